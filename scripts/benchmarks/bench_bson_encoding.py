@@ -0,0 +1,67 @@
+"""
+Compare le coût par document, côté migration, de la lecture et de l'encodage BSON des
+données transformées : fichier JSON (json puis conversion des timestamps puis encodage
+par pymongo), dataset Parquet lu en dictionnaires Python puis encodé par pymongo, et
+dataset Parquet encodé en BSON colonne par colonne (encode_record_batch).
+
+Les documents du chemin natif doivent être identiques, octet par octet, à ceux encodés
+par pymongo depuis le Parquet. Le JSON arrondit les flottants (10 chiffres significatifs
+avec to_json) : seuls le nombre de documents et leurs timestamps sont comparés.
+
+Usage : python scripts/benchmarks/bench_bson_encoding.py [--rows 200000]
+"""
+import argparse
+import logging
+import os
+import tempfile
+from collections import Counter
+
+from bson import decode as bson_decode, encode as bson_encode
+
+import bench_utils
+from bench_quality import make_frame
+import migrate_to_mongodb as mig
+from transformation_parquet import write_partitioned_parquet
+
+def encode_json(path):
+    return [bson_encode(document) for document in mig.normalize_documents(mig.iter_json_records(path), Counter())]
+
+def encode_parquet_dicts(path):
+    return [bson_encode(document) for document in mig.normalize_documents(mig.iter_parquet_records(path), Counter())]
+
+def encode_parquet_native(path):
+    return list(mig.iter_parquet_bson_documents(path, Counter()))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    # Colonne d'objets imbriqués exclue : elle n'est pas exportée telle quelle
+    df = make_frame(args.rows).drop(columns=['_airbyte_meta'])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path = os.path.join(tmp_dir, 'data_for_mongodb.json')
+        parquet_path = os.path.join(tmp_dir, 'parquet')
+        df.to_json(json_path, orient='records', indent=4, force_ascii=False, date_format='iso')
+        write_partitioned_parquet(df, parquet_path)
+
+        json_time, json_docs = bench_utils.best_of(lambda: encode_json(json_path), args.repeat)
+        dicts_time, dict_docs = bench_utils.best_of(lambda: encode_parquet_dicts(parquet_path), args.repeat)
+        native_time, native_docs = bench_utils.best_of(lambda: encode_parquet_native(parquet_path), args.repeat)
+
+    # Mêmes documents que pymongo, à l'_id près (généré à l'encodage)
+    assert len(native_docs) == len(dict_docs) == len(json_docs) == len(df)
+    for native, encoded in zip(native_docs, dict_docs):
+        assert native.raw == bson_encode({'_id': native['_id'], **bson_decode(encoded)})
+    assert sorted(document['timestamp'] for document in map(bson_decode, json_docs)) == \
+        sorted(document['timestamp'] for document in native_docs)
+
+    timings = {'JSON + pymongo': json_time, 'Parquet + pymongo': dicts_time, 'Parquet BSON natif': native_time}
+    bench_utils.print_comparison("Lecture et encodage BSON", len(df), timings)
+    for name, seconds in timings.items():
+        print(f"  {name:<20} {seconds / len(df) * 1e6:8.2f} µs par document")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Mesure l'empreinte mémoire (octets par ligne) d'une historique de station
+en représentation standard et en représentation compacte (COMPACT_DTYPES).
+
+Usage : python scripts/benchmarks/bench_compact_dtypes.py [--years 3]
+"""
+import argparse
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import bench_utils
+from transformation_parquet import (STATION_METADATA, clean_and_convert_data, memory_per_row,
+                                    optimize_dtypes, transform_station_parquet, widen_float32_columns)
+
+WIND_DIRECTIONS = ['North', 'NNE', 'NE', 'ENE', 'East', 'ESE', 'SE', 'SSE',
+                   'South', 'SSW', 'SW', 'WSW', 'West', 'WNW', 'NW', 'NNW']
+
+def write_station_history(data_path, years, seed=42):
+    """Écrit une historique synthétique au format Weather Underground (un relevé toutes les 5 minutes)."""
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range('2024-01-01', periods=years * 365 * 288, freq='5min')
+    n_rows = len(timestamps)
+
+    def with_unit(values, unit):
+        return np.char.add(np.char.add(values.round(1).astype(str), '\xa0'), unit).astype(object)
+
+    df = pd.DataFrame({
+        'Temperature': with_unit(rng.uniform(20, 90, n_rows), '°F'),
+        'Dew Point': with_unit(rng.uniform(20, 70, n_rows), '°F'),
+        'Humidity': with_unit(rng.integers(20, 100, n_rows).astype(float), '%'),
+        'Wind': np.array(WIND_DIRECTIONS, dtype=object)[rng.integers(0, 16, n_rows)],
+        'Speed': with_unit(rng.uniform(0, 30, n_rows), 'mph'),
+        'Gust': with_unit(rng.uniform(0, 40, n_rows), 'mph'),
+        'Pressure': with_unit(rng.uniform(29, 31, n_rows), 'in'),
+        'Precip. Rate.': with_unit(rng.uniform(0, 1, n_rows), 'in'),
+        'Precip. Accum.': with_unit(rng.uniform(0, 2, n_rows), 'in'),
+        'UV': rng.integers(0, 10, n_rows).astype(float),
+        'Solar': with_unit(rng.uniform(0, 800, n_rows), 'w/m²'),
+        'timestamp': timestamps.strftime('%Y-%m-%dT%H:%M:%S'),
+    })
+    os.makedirs(data_path, exist_ok=True)
+    df.to_parquet(os.path.join(data_path, 'history.parquet'), index=False)
+    return n_rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--years', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        n_rows = write_station_history(tmp_dir, args.years)
+        station_meta = STATION_METADATA["ILAMAD25"]
+
+        standard = clean_and_convert_data(transform_station_parquet(tmp_dir, station_meta))
+        compact = optimize_dtypes(clean_and_convert_data(transform_station_parquet(tmp_dir, station_meta, compact=True)))
+
+    # L'export doit rester identique malgré la représentation compacte
+    pd.testing.assert_frame_equal(widen_float32_columns(compact).astype(standard.dtypes.to_dict()), standard)
+
+    before, after = memory_per_row(standard), memory_per_row(compact)
+    print(f"\nHistorique de {args.years} an(s) ({n_rows} lignes)")
+    print(f"  standard : {before:8.1f} octets/ligne  ({before * n_rows / 1e6:8.1f} Mo)")
+    print(f"  compact  : {after:8.1f} octets/ligne  ({after * n_rows / 1e6:8.1f} Mo)  x{before / after:.1f}")
+    print("\n  Détail par colonne (octets/ligne) :")
+    detail = pd.DataFrame({
+        'standard': standard.memory_usage(deep=True, index=False) / n_rows,
+        'compact': compact.memory_usage(deep=True, index=False) / n_rows,
+    })
+    print(detail.round(1).to_string())
+
+if __name__ == '__main__':
+    main()
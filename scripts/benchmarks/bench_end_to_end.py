@@ -0,0 +1,196 @@
+"""
+Mesure le pipeline complet sur des sources synthétiques (synthetic_data.py) à plusieurs
+échelles : la transformation est exécutée par sa fonction main() (téléchargement des
+sources depuis un S3 simulé par moto avec leur manifeste, lecture et aplatissement,
+nettoyage, test de qualité, écriture JSON et Parquet, manifeste des fichiers
+transformés), puis le dataset Parquet est chargé dans MongoDB (encodage BSON natif et
+insert_batches). Les variables d'environnement de la transformation s'appliquent
+(STREAMING_BATCH_ROWS, TRANSFORM_MAX_WORKERS...).
+
+Chaque échelle est exécutée dans un processus neuf : le pic de mémoire résidente du
+processus, relevé à la fin de chaque étape (ru_maxrss ne donne pas de pic par étape),
+n'inclut pas les échelles précédentes ; les étapes exécutées dans les processus de
+transformation portent le pic de leur processus. Avec --tracemalloc, le pic des
+allocations Python de chaque étape est aussi mesuré (les temps sont alors plus élevés).
+La durée des étapes exécutées dans plusieurs threads (téléchargements, insert_many) est
+cumulée sur les threads.
+
+L'historique est d'un an par défaut : l'échelle 100 compte alors environ 21 millions de
+relevés Weather Underground, à mesurer avec STREAMING_BATCH_ROWS et --uri (ou avec un
+--days plus court). Le S3 simulé ne mesure que le coût côté client des téléchargements.
+Sans --uri, la base est simulée avec mongomock (documents décodés avant l'insertion,
+sans index) : le débit du chargement n'est alors qu'un ordre de grandeur.
+
+Usage : python scripts/benchmarks/bench_end_to_end.py [--scales 1 10 100] [--days 365] [--uri mongodb://localhost:27017/]
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import boto3
+from bson import decode as bson_decode
+from bson.raw_bson import RawBSONDocument
+from moto import mock_aws
+
+import bench_utils  # noqa: F401 (chemins des scripts du pipeline)
+import instrumentation
+import migrate_to_mongodb as mig
+import transformation_parquet as tp
+from synthetic_data import DEFAULT_DAYS, generate_sources
+
+# Fichier des stations synthétiques de l'échelle en cours : les processus de transformation
+# lancés par tp.main() réimportent ce module (méthode 'spawn') et y relisent les stations
+SYNTHETIC_STATIONS_ENV = 'BENCH_SYNTHETIC_STATIONS'
+
+def use_synthetic_stations(stations):
+    """Remplace les stations du pipeline par les stations synthétiques {identifiant: métadonnées}."""
+    tp.STATION_METADATA = stations
+    tp.STATION_S3_PREFIXES = {station_id: f"data_stations/{station_id.lower()}_weather/" for station_id in stations}
+
+if os.environ.get(SYNTHETIC_STATIONS_ENV):
+    logging.disable(logging.WARNING)
+    with open(os.environ[SYNTHETIC_STATIONS_ENV], encoding='utf-8') as f:
+        use_synthetic_stations(json.load(f))
+
+class _MongomockCollection:
+    """Collection mongomock acceptant les RawBSONDocument de l'encodage natif."""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def insert_many(self, documents, ordered=True):
+        return self._collection.insert_many(
+            [bson_decode(doc.raw) if isinstance(doc, RawBSONDocument) else doc for doc in documents], ordered=ordered)
+
+def open_collection(uri, db_name):
+    """Retourne (client, collection de chargement) : serveur MongoDB avec ses index, ou mongomock."""
+    if uri:
+        from pymongo import MongoClient
+        client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+        client.drop_database(db_name)
+        collection = client[db_name][mig.COLLECTION_NAME]
+        mig.ensure_indexes(collection)
+        return client, collection.with_options(write_concern=mig.write_concern())
+    import mongomock
+    client = mongomock.MongoClient()
+    return client, _MongomockCollection(client[db_name][mig.COLLECTION_NAME])
+
+def load_parquet(parquet_path, collection):
+    """Chargement complet du dataset Parquet ; retourne (documents insérés, relevés ignorés)."""
+    skipped = Counter()
+    documents = mig.iter_parquet_bson_documents(parquet_path, skipped, mig.BATCH_SIZE)
+    batches = instrumentation.timed_iter('read_input', mig.iter_batches(documents, mig.BATCH_SIZE),
+                                         count=len, bytes_read=instrumentation.path_size(parquet_path))
+    with instrumentation.stage('mongo_load') as metrics:
+        inserted = mig.insert_batches(collection, batches)
+        metrics['rows_out'] = inserted
+    return inserted, skipped['timestamp']
+
+def upload_sources(s3_client, sources_dir):
+    """Dépose les fichiers des sources dans le bucket du pipeline, sous data_stations/<dossier>/."""
+    s3_client.create_bucket(Bucket=tp.S3_BUCKET_NAME)
+    for source_name in sorted(os.listdir(sources_dir)):
+        for file_name in sorted(os.listdir(os.path.join(sources_dir, source_name))):
+            s3_client.upload_file(os.path.join(sources_dir, source_name, file_name), tp.S3_BUCKET_NAME,
+                                  f"data_stations/{source_name}/{file_name}")
+
+def run_scale(scale, days, uri, db_name):
+    """Génère les sources d'une échelle puis exécute le pipeline ; retourne le rapport d'exécution."""
+    logging.disable(logging.WARNING)
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir, mock_aws():
+        sources = generate_sources(os.path.join(tmp_dir, 'sources'), scale, days)
+        stations = {meta['station_id']: meta for meta in sources['stations'].values()}
+        stations_file = os.path.join(tmp_dir, 'stations.json')
+        with open(stations_file, 'w', encoding='utf-8') as f:
+            json.dump(stations, f)
+        os.environ[SYNTHETIC_STATIONS_ENV] = stations_file
+        use_synthetic_stations(stations)
+        upload_sources(boto3.client('s3'), os.path.join(tmp_dir, 'sources'))
+        report_path = os.path.join(tmp_dir, 'run_report.json')
+
+        # Chemins relatifs du pipeline (temp_data/, transformed_data/) dans le dossier temporaire
+        os.chdir(tmp_dir)
+        client, collection = open_collection(uri, db_name)
+        try:
+            with instrumentation.run(f"bench_x{scale}", report_path):
+                with instrumentation.stage('transformation') as metrics:
+                    tp.main()
+                    with open(os.path.join(tp.TRANSFORMED_OUTPUT_PATH, tp.QUALITY_REPORT_FILENAME), encoding='utf-8') as f:
+                        metrics['rows_out'] = transformed = json.load(f)['rows']
+                inserted, skipped = load_parquet(tp.PARQUET_OUTPUT_PATH, collection)
+        finally:
+            os.chdir(cwd)
+            if uri:
+                client.drop_database(db_name)
+            client.close()
+
+        with open(report_path, encoding='utf-8') as f:
+            report = json.load(f)
+    # Tous les relevés générés sont transformés puis chargés (ou ignorés faute d'horodatage)
+    assert transformed == sum(sources['rows'].values())
+    assert inserted + skipped == transformed
+    report['input_rows'] = transformed
+    return report
+
+def stage_rows(entry):
+    """Lignes traitées par une étape : les plus nombreuses en entrée ou en sortie (charges utiles dépliées)."""
+    return max(entry.get('rows_in') or 0, entry.get('rows_out') or 0)
+
+def summarize_stages(stages):
+    """Cumule les étapes d'un rapport par (étape, étape parente), toutes sources confondues."""
+    summary = {}
+    for entry in stages:
+        key = (entry['stage'], entry.get('parent'))
+        current = summary.setdefault(key, {'rows': 0, 'wall_seconds': 0.0, 'process_peak_rss_mb': 0, 'traced_peak_mb': None})
+        current['rows'] += stage_rows(entry)
+        current['wall_seconds'] += entry['wall_seconds']
+        current['process_peak_rss_mb'] = max(current['process_peak_rss_mb'], entry.get('process_peak_rss_mb') or 0)
+        if entry.get('traced_peak_mb') is not None:
+            current['traced_peak_mb'] = max(current['traced_peak_mb'] or 0, entry['traced_peak_mb'])
+    return summary
+
+def print_scale(scale, report):
+    print(f"\nÉchelle x{scale} ({report['input_rows']} relevés, {report['wall_seconds']:.1f} s)")
+    print(f"  {'étape':<36} {'lignes':>10} {'durée (s)':>10} {'lignes/s':>12} {'pic RSS processus (Mo)':>23} {'pic Python (Mo)':>16}")
+    for (name, parent), s in summarize_stages(report['stages']).items():
+        label = f"{parent} > {name}" if parent else name
+        rate = f"{s['rows'] / s['wall_seconds']:12.0f}" if s['rows'] and s['wall_seconds'] > 0 else f"{'-':>12}"
+        traced = f"{s['traced_peak_mb']:16.1f}" if s['traced_peak_mb'] is not None else f"{'-':>16}"
+        print(f"  {label:<36} {s['rows']:>10} {s['wall_seconds']:10.2f} {rate} {s['process_peak_rss_mb']:23.1f} {traced}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS, help="jours d'historique de chaque station")
+    parser.add_argument('--uri', help="URI d'un serveur MongoDB (mongomock par défaut)")
+    parser.add_argument('--db', default='greenandcoop_bench_end_to_end', help="base temporaire du chargement")
+    parser.add_argument('--tracemalloc', action='store_true', help="pic des allocations Python par étape")
+    args = parser.parse_args()
+    if args.tracemalloc:
+        # Lu à l'import d'instrumentation dans les processus des échelles
+        os.environ['TRACEMALLOC_STAGES'] = 'all'
+
+    totals = {}
+    for scale in args.scales:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            report = pool.submit(run_scale, scale, args.days, args.uri, args.db).result()
+        print_scale(scale, report)
+        stages = summarize_stages(report['stages'])
+        totals[scale] = (report['input_rows'], stages[('transformation', None)]['wall_seconds'],
+                         stages[('mongo_load', None)]['wall_seconds'], report['peak_rss_mb'])
+
+    print("\nDébit de bout en bout")
+    print(f"  {'échelle':<8} {'relevés':>10} {'transformation':>16} {'chargement':>14} {'total':>14} {'pic RSS processus (Mo)':>23}")
+    for scale, (rows, transform_seconds, load_seconds, peak) in totals.items():
+        rates = [f"{rows / seconds:10.0f} l/s" for seconds in (transform_seconds, load_seconds, transform_seconds + load_seconds)]
+        print(f"  x{scale:<7} {rows:>10} {rates[0]:>16} {rates[1]:>14} {rates[2]:>14} {peak:23.1f}")
+
+if __name__ == '__main__':
+    main()
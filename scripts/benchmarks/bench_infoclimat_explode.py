@@ -0,0 +1,96 @@
+"""
+Compare l'aplatissement de la structure 'hourly' d'Infoclimat :
+boucle iterrows historique contre explode_hourly_payloads (colonne par colonne), sur
+des charges utiles aux séries en listes Python (JSON d'Airbyte) et relues depuis
+Parquet (séries en tableaux NumPy, copiées sans conversion valeur par valeur).
+
+Usage : python scripts/benchmarks/bench_infoclimat_explode.py [--payloads 50] [--stations 10] [--hours 720]
+"""
+import argparse
+import os
+import random
+import tempfile
+
+import pandas as pd
+
+import bench_utils
+from transformation_parquet import explode_hourly_payloads
+
+METRICS = ['temperature', 'pression', 'humidite', 'point_de_rosee', 'visibilite',
+           'vent_moyen', 'vent_rafales', 'vent_direction', 'pluie_1h', 'pluie_3h', 'neige_au_sol', 'nebulosite']
+
+def make_payloads(n_payloads, n_stations, n_hours, seed=42):
+    """Génère des charges utiles Infoclimat synthétiques (une ligne par appel API)."""
+    rng = random.Random(seed)
+    rows = []
+    for p in range(n_payloads):
+        stations, hourly = [], {}
+        for s in range(n_stations):
+            station_id = f"{p:03d}{s:03d}"
+            stations.append({'id': station_id, 'name': f"Station {station_id}",
+                             'latitude': 50 + rng.random(), 'longitude': 3 + rng.random(), 'elevation': rng.randint(0, 200)})
+            measurements = {'time': [f"2024-10-{1 + h // 24:02d} {h % 24:02d}:00:00" for h in range(n_hours)]}
+            for metric in METRICS:
+                # Quelques séries incomplètes et valeurs nulles, comme dans l'API réelle
+                length = n_hours if rng.random() > 0.1 else n_hours // 2
+                measurements[metric] = [None if rng.random() < 0.05 else round(rng.uniform(-5, 30), 1) for _ in range(length)]
+            hourly[station_id] = measurements
+        rows.append({'stations': stations, 'hourly': hourly})
+    return pd.DataFrame(rows)
+
+def explode_hourly_iterrows(source_df):
+    """Implémentation historique de transform_infoclimat_parquet, conservée comme référence."""
+    exploded_records = []
+    for _, row in source_df.iterrows():
+        stations = {s['id']: s for s in row.get('stations', []) if isinstance(s, dict)}
+        hourly_data = row.get('hourly', {})
+        if not isinstance(hourly_data, dict): continue
+
+        for station_id, measurements in hourly_data.items():
+            station_info = stations.get(station_id, {})
+            if not isinstance(measurements, dict): continue
+
+            time_steps = measurements.get('time', [])
+            num_records = len(time_steps)
+
+            for i in range(num_records):
+                flat_record = {
+                    'station_id': station_id,
+                    'latitude': station_info.get('latitude'),
+                    'longitude': station_info.get('longitude'),
+                    'elevation': station_info.get('elevation'),
+                    'station_name': station_info.get('name'),
+                    'timestamp': time_steps[i]
+                }
+                for metric, values in measurements.items():
+                    if metric != 'time' and isinstance(values, list) and i < len(values):
+                        flat_record[metric] = values[i]
+                exploded_records.append(flat_record)
+    return pd.DataFrame(exploded_records)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--payloads', type=int, default=50)
+    parser.add_argument('--stations', type=int, default=10)
+    parser.add_argument('--hours', type=int, default=720)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    source_df = make_payloads(args.payloads, args.stations, args.hours)
+    loop_time, expected = bench_utils.best_of(lambda: explode_hourly_iterrows(source_df), args.repeat)
+    columnar_time, result = bench_utils.best_of(lambda: explode_hourly_payloads(source_df), args.repeat)
+
+    # Le nouveau chemin doit produire exactement le même DataFrame
+    pd.testing.assert_frame_equal(result, expected)
+    # Relues depuis Parquet, les séries sont des tableaux NumPy : mêmes mesures qu'avec des listes
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'infoclimat.parquet')
+        source_df.to_parquet(path, index=False)
+        parquet_df = pd.read_parquet(path)
+    parquet_time, parquet_result = bench_utils.best_of(lambda: explode_hourly_payloads(parquet_df), args.repeat)
+    pd.testing.assert_frame_equal(parquet_result, expected, check_like=True)
+    bench_utils.print_comparison("Aplatissement 'hourly' Infoclimat", len(result),
+                                 {'iterrows': loop_time, 'colonnes': columnar_time, 'colonnes (Parquet)': parquet_time})
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Compare le test de qualité historique (copie du DataFrame, recherche des objets
+imbriqués valeur par valeur, isnull() et duplicated() appelés deux fois) au
+rapport vectorisé de test_data_quality.
+
+Usage : python scripts/benchmarks/bench_quality.py [--rows 500000]
+"""
+import argparse
+import logging
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+import bench_utils
+from transformation_parquet import STATION_METADATA, test_data_quality
+
+def make_frame(n_rows, seed=42):
+    """
+    Génère un DataFrame semblable aux données finales : mesures numériques avec valeurs
+    manquantes, métadonnées de station, timestamps, environ 1 % de lignes dupliquées
+    et une colonne d'objets imbriqués comme celles laissées par Airbyte.
+    """
+    rng = np.random.default_rng(seed)
+    stations = list(STATION_METADATA.values())
+    meta = pd.DataFrame([stations[i] for i in rng.integers(0, len(stations), n_rows)])
+    data = {
+        col: np.where(rng.random(n_rows) < 0.03, np.nan, rng.uniform(0, 100, n_rows).round(1))
+        for col in ['temperature', 'dew_point', 'humidity', 'speed', 'gust', 'pressure', 'precip_accum']
+    }
+    data['wind'] = rng.choice(['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW'], n_rows).astype(object)
+    data['timestamp'] = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 10 * n_rows, n_rows), unit='min')
+    data['_airbyte_meta'] = [{'changes': []} if i % 100 == 0 else None for i in range(n_rows)]
+    df = pd.concat([meta, pd.DataFrame(data)], axis=1)
+    duplicates = df.sample(frac=0.01, random_state=seed)
+    return pd.concat([df, duplicates], ignore_index=True)
+
+def make_mixed_frame():
+    """
+    Colonnes de types mêlés dont les valeurs ont la même représentation str() (1 et '1') :
+    duplicated() les distingue, le rapport vectorisé doit en faire autant. Les valeurs
+    manquantes (None, NaN, NaT) sont en revanche égales entre elles.
+    """
+    values = [1, '1', 1.0, True, np.int64(1), None, np.nan, pd.NaT, pd.Timestamp('2024-01-01'),
+              '2024-01-01 00:00:00', datetime(2024, 1, 1), date(2024, 1, 1), b'1', 'a', 'a']
+    return pd.DataFrame({
+        'value': pd.Series(values, dtype=object),
+        'station_id': pd.Series(['A', 'A', None, np.nan] * 3 + ['A'] * 3, dtype=object),
+        'timestamp': pd.Series([0, '0'] * 7 + [0], dtype=object),
+    })
+
+def test_data_quality_legacy(df):
+    """Implémentation historique, conservée comme référence ; retourne (valeurs manquantes, doublons)."""
+    null_counts = None
+    if df.isnull().values.any():
+        null_counts = df.isnull().sum()[df.isnull().sum() > 0]
+    df_for_duplicates_test = df.copy()
+    unhashable_cols = []
+    for col in df_for_duplicates_test.columns:
+        if any(isinstance(x, (dict, list)) for x in df_for_duplicates_test[col].dropna()):
+            unhashable_cols.append(col)
+    if unhashable_cols:
+        df_for_duplicates_test = df_for_duplicates_test.drop(columns=unhashable_cols)
+    duplicates = 0
+    if df_for_duplicates_test.duplicated().any():
+        duplicates = df_for_duplicates_test.duplicated().sum()
+    return null_counts, duplicates
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    df = make_frame(args.rows)
+    legacy_time, (null_counts, duplicates) = bench_utils.best_of(lambda: test_data_quality_legacy(df), args.repeat)
+    report_time, report = bench_utils.best_of(lambda: test_data_quality(df, "benchmark"), args.repeat)
+
+    assert report.null_counts == {col: int(count) for col, count in null_counts.items()}
+    assert report.duplicate_rows == duplicates
+    mixed = make_mixed_frame()
+    assert test_data_quality(mixed, "types mêlés").duplicate_rows == test_data_quality_legacy(mixed)[1]
+    bench_utils.print_comparison("Test de qualité", len(df), {'historique': legacy_time, 'vectorisé': report_time})
+    print(f"  {report.duplicate_rows} doublons, {report.duplicate_keys} clés {report.key_columns} dupliquées, "
+          f"colonnes non hashables : {report.unhashable_columns}")
+
+if __name__ == '__main__':
+    main()
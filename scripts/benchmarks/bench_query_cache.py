@@ -0,0 +1,199 @@
+"""
+Compare le débit du service de requêtes asynchrone (query_service.QueryService) sans
+cache (chaque appel interroge la base, y compris les appels simultanés identiques) et
+avec cache sur un mélange de requêtes répétées (relevés d'une station sur une
+journée, résumés journaliers sur une semaine), vérifie que les résultats sont identiques
+puis que la publication d'une nouvelle version des données par la migration vide le cache.
+
+Les données synthétiques sont écrites dans une base dédiée (--db), supprimée à la fin.
+Sans --uri, la base est simulée avec mongomock : les temps ne mesurent alors que le
+coût du cache face à une recherche en mémoire.
+
+Usage : python scripts/benchmarks/bench_query_cache.py [--uri mongodb://localhost:27017/] [--repeat 20] [--concurrency 16]
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import bench_utils  # noqa: F401 (chemins des scripts du pipeline)
+import query_service
+from migrate_to_mongodb import publish_data_version
+from query_service import QueryService, TTLCache
+
+STATIONS = ['IICHTE19', 'ILAMAD25', '07015']
+START = datetime(2024, 1, 1)
+# Période des résumés journaliers demandés
+SUMMARY_DAYS = 7
+
+def make_documents(n_days, seed=42):
+    """Relevés horaires de chaque station et résumés journaliers correspondants."""
+    rng = np.random.default_rng(seed)
+    raw, daily = [], []
+    for station_id in STATIONS:
+        for day in range(n_days):
+            period_start = START + timedelta(days=day)
+            temperatures = rng.normal(12, 5, 24).round(1)
+            precip = np.cumsum(rng.exponential(0.1, 24)).round(2)
+            for hour in range(24):
+                raw.append({'station_id': station_id, 'station_name': station_id,
+                            'timestamp': period_start + timedelta(hours=hour),
+                            'temperature': float(temperatures[hour]), 'precip_accum': float(precip[hour])})
+            daily.append({'station_id': station_id, 'station_name': station_id, 'period_start': period_start,
+                          'readings': 24, 'temperature_min': float(temperatures.min()),
+                          'temperature_max': float(temperatures.max()),
+                          'temperature_mean': float(temperatures.mean()),
+                          'temperature_sum': float(temperatures.sum()), 'temperature_count': 24,
+                          'precip_total': float(precip[-1]), 'precip_accum_max': float(precip[-1])})
+    return raw, daily
+
+def make_queries(n_queries, n_days, seed=42):
+    """Paramètres distincts : (méthode, station, début, fin)."""
+    rng = random.Random(seed)
+    queries = set()
+    while len(queries) < n_queries:
+        station_id = rng.choice(STATIONS)
+        if rng.random() < 0.5:
+            start = START + timedelta(days=rng.randrange(n_days))
+            queries.add(('get_station_range', station_id, start, start + timedelta(days=1)))
+        else:
+            start = START + timedelta(days=rng.randrange(n_days - SUMMARY_DAYS))
+            queries.add(('get_daily_summary', station_id, start, start + timedelta(days=SUMMARY_DAYS)))
+    return sorted(queries)
+
+class _MockCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, *args):
+        self._cursor = self._cursor.sort(*args)
+        return self
+
+    async def to_list(self, length=None):
+        return list(self._cursor)
+
+class _MockCollection:
+    """Interface asynchrone minimale (celle de Motor utilisée par QueryService) autour de mongomock."""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def find(self, *args, **kwargs):
+        return _MockCursor(self._collection.find(*args, **kwargs))
+
+    async def find_one(self, *args, **kwargs):
+        return self._collection.find_one(*args, **kwargs)
+
+class _MockDatabase:
+    def __init__(self, db):
+        self._db = db
+
+    def __getitem__(self, name):
+        return _MockCollection(self._db[name])
+
+class _MockClient:
+    def __init__(self, client):
+        self._client = client
+
+    def __getitem__(self, db_name):
+        return _MockDatabase(self._client[db_name])
+
+    def close(self):
+        pass
+
+async def run_queries(service, queries, repeat, concurrency):
+    """Exécute chaque requête `repeat` fois (ordre mélangé) ; retourne (durée, {requête: résultat})."""
+    calls = [query for query in queries for _ in range(repeat)]
+    random.Random(0).shuffle(calls)
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {}
+
+    async def call(query):
+        method, station_id, start, end = query
+        async with semaphore:
+            results[query] = await getattr(service, method)(station_id, start, end)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(call(query) for query in calls))
+    return time.perf_counter() - started, results
+
+async def bench(args, async_client, sync_db):
+    queries = make_queries(args.queries, args.days)
+    timings, results = {}, {}
+    for name, max_entries, coalesce in [('sans cache', 0, False), ('avec cache', query_service.QUERY_CACHE_SIZE, True)]:
+        service = QueryService(client=async_client, db_name=args.db, cache=TTLCache(max_entries=max_entries),
+                               coalesce=coalesce)
+        timings[name], results[name] = await run_queries(service, queries, args.repeat, args.concurrency)
+    assert results['avec cache'] == results['sans cache']
+    assert all(results['sans cache'].values())
+    hit_rate = service.cache.hits / (service.cache.hits + service.cache.misses)
+
+    # Un nouveau relevé suivi d'une publication de version doit être visible au prochain appel
+    station_query = next(query for query in queries if query[0] == 'get_station_range')
+    _, station_id, start, end = station_query
+    sync_db[query_service.COLLECTION_NAME].insert_one(
+        {'station_id': station_id, 'station_name': station_id, 'timestamp': start + timedelta(minutes=30)})
+    assert len(await service.get_station_range(station_id, start, end)) == len(results['avec cache'][station_query])
+    publish_data_version(sync_db[query_service.STATE_COLLECTION_NAME])
+    # Sans attendre DATA_VERSION_CHECK_INTERVAL secondes
+    await service.check_data_version(force=True)
+    assert len(await service.get_station_range(station_id, start, end)) == len(results['avec cache'][station_query]) + 1
+
+    calls = len(queries) * args.repeat
+    print(f"\nService de requêtes ({calls} appels, {len(queries)} requêtes distinctes, concurrence {args.concurrency})")
+    reference = timings['sans cache']
+    for name, seconds in timings.items():
+        print(f"  {name:<20} {seconds * 1000:10.1f} ms  {calls / seconds:12.0f} requêtes/s  x{reference / seconds:.1f}")
+    print(f"  taux de succès du cache : {hit_rate:.1%}, invalidation après publication d'une version : OK")
+
+def history_days(value):
+    """Jours de relevés : les résumés journaliers portent sur une semaine et doivent pouvoir commencer à deux dates."""
+    days = int(value)
+    if days < SUMMARY_DAYS + 1:
+        raise argparse.ArgumentTypeError(f"au moins {SUMMARY_DAYS + 1} jours sont nécessaires (résumés sur {SUMMARY_DAYS} jours)")
+    return days
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', help="URI d'un serveur MongoDB (mongomock par défaut)")
+    parser.add_argument('--db', default='greenandcoop_bench_query_cache', help="base temporaire du benchmark")
+    parser.add_argument('--days', type=history_days, default=60, help="jours de relevés horaires par station")
+    parser.add_argument('--queries', type=int, default=50, help="requêtes distinctes")
+    parser.add_argument('--repeat', type=int, default=20, help="appels par requête")
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+    distinct_queries = len(STATIONS) * (args.days + args.days - SUMMARY_DAYS)
+    if args.queries > distinct_queries:
+        parser.error(f"--queries : au plus {distinct_queries} requêtes distinctes sur {args.days} jours")
+    logging.disable(logging.WARNING)
+
+    if args.uri:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        from pymongo import ASCENDING, MongoClient
+        sync_client = MongoClient(args.uri, serverSelectionTimeoutMS=5000)
+        async_client = AsyncIOMotorClient(args.uri, maxPoolSize=query_service.QUERY_POOL_SIZE)
+    else:
+        import mongomock
+        sync_client = mongomock.MongoClient()
+        async_client = _MockClient(sync_client)
+    sync_db = sync_client[args.db]
+    try:
+        raw, daily = make_documents(args.days)
+        sync_db[query_service.COLLECTION_NAME].insert_many(raw)
+        sync_db[query_service.DAILY_COLLECTION_NAME].insert_many(daily)
+        if args.uri:
+            sync_db[query_service.COLLECTION_NAME].create_index([('station_id', ASCENDING), ('timestamp', ASCENDING)])
+            sync_db[query_service.DAILY_COLLECTION_NAME].create_index([('station_id', ASCENDING), ('period_start', ASCENDING)])
+        publish_data_version(sync_db[query_service.STATE_COLLECTION_NAME])
+        asyncio.run(bench(args, async_client, sync_db))
+    finally:
+        sync_client.drop_database(args.db)
+        sync_client.close()
+        async_client.close()
+
+if __name__ == '__main__':
+    main()
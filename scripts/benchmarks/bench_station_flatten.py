@@ -0,0 +1,61 @@
+"""
+Compare la lecture et l'aplatissement d'une historique de station dont les mesures sont
+enveloppées par Airbyte ({'string': ..., 'number': ...}) : lecture pandas puis détection
+et extraction valeur par valeur des dictionnaires, contre extraction du champ 'string'
+dans Arrow selon un plan calculé une fois par schéma (unwrap_airbyte_columns).
+Les DataFrames obtenus doivent être identiques.
+
+Usage : python scripts/benchmarks/bench_station_flatten.py [--years 1]
+"""
+import argparse
+import logging
+import os
+import tempfile
+
+import pandas as pd
+
+import bench_utils
+from bench_compact_dtypes import write_station_history
+from transformation_parquet import STATION_METADATA, flatten_station_frame, transform_station_parquet
+
+def wrap_airbyte_columns(data_path):
+    """Réécrit l'historique avec les mesures textuelles enveloppées comme dans les fichiers Airbyte."""
+    path = os.path.join(data_path, 'history.parquet')
+    df = pd.read_parquet(path)
+    for col in df.columns:
+        if df[col].dtype == 'object' and col != 'timestamp':
+            df[col] = [None if value is None else {'string': value, 'number': None} for value in df[col]]
+    df['_airbyte_raw_id'] = 'id'
+    df['_airbyte_meta'] = [{'changes': []}] * len(df)
+    df.to_parquet(path, index=False)
+
+def flatten_dicts(data_path, station_meta):
+    """Lecture de référence : dictionnaires Python dépliés colonne par colonne avec pandas."""
+    df = pd.read_parquet(data_path)
+    for col in df.columns:
+        if df[col].dtype == 'object':
+            first_valid = df[col].dropna().iloc[0] if not df[col].dropna().empty else None
+            if isinstance(first_valid, dict) and 'string' in first_valid:
+                df[col] = df[col].apply(lambda x: x.get('string') if isinstance(x, dict) else x)
+    return flatten_station_frame(df, station_meta)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    station_meta = STATION_METADATA["ILAMAD25"]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        n_rows = write_station_history(tmp_dir, args.years)
+        wrap_airbyte_columns(tmp_dir)
+        dicts_time, expected = bench_utils.best_of(lambda: flatten_dicts(tmp_dir, station_meta), args.repeat)
+        arrow_time, result = bench_utils.best_of(lambda: transform_station_parquet(tmp_dir, station_meta), args.repeat)
+
+    pd.testing.assert_frame_equal(result, expected)
+    bench_utils.print_comparison("Lecture et aplatissement d'une station", n_rows,
+                                 {'dictionnaires': dicts_time, 'plan Arrow': arrow_time})
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Compare la transformation en mémoire (transform_in_memory) et la transformation
+en streaming par lots (transform_streaming) sur des sources synthétiques :
+temps, pic de mémoire Python (tracemalloc) et identité des sorties : mêmes relevés
+JSON (un enregistrement streaming ne porte que les colonnes de sa source, les autres
+valant null en mémoire), même dataset Parquet lu avec son schéma commun et même
+rapport de qualité.
+
+Usage : python scripts/benchmarks/bench_streaming_transform.py [--years 1] [--payloads 20] [--batch-rows 20000]
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# Les deux chemins sont mesurés dans ce processus (pic mémoire tracemalloc comparable)
+os.environ.setdefault('TRANSFORM_MAX_WORKERS', '0')
+
+import bench_utils
+from bench_compact_dtypes import write_station_history
+from bench_infoclimat_explode import make_payloads
+import transformation_parquet as tp
+from transformation_parquet import explode_hourly_payloads
+
+def write_infoclimat_records(data_path, n_payloads, n_files=3):
+    """
+    Écrit des relevés Infoclimat déjà aplatis sur plusieurs fichiers. Les horodatages
+    utilisent une espace comme séparateur, une métrique n'est renseignée que dans les
+    derniers relevés et la colonne 'state' est numérique (types mélangés avec les
+    métadonnées des stations). La métrique 'temperature' est retirée : elle porterait
+    le même nom que la colonne 'Temperature' renommée des stations.
+    """
+    df = explode_hourly_payloads(make_payloads(n_payloads, n_stations=5, n_hours=240)).drop(columns=['temperature'])
+    df['ensoleillement'] = df['pression'].where(df.index >= len(df) // 2)
+    df['state'] = 59
+    os.makedirs(data_path, exist_ok=True)
+    per_file = -(-len(df) // n_files)
+    for i in range(n_files):
+        df.iloc[i * per_file:(i + 1) * per_file].to_parquet(os.path.join(data_path, f'part-{i}.parquet'), index=False)
+
+def measure(func):
+    """Exécute func et retourne (durée en secondes, pic de mémoire tracemalloc en octets, résultat)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+def read_dataset(path):
+    """Lit un dataset Parquet avec son schéma commun (_common_metadata ou union des fichiers)."""
+    schema = pa.unify_schemas([tp.dataset_file_schema(path), tp.PARQUET_PARTITIONING.schema])
+    df = ds.dataset(path, schema=schema, format='parquet', partitioning=tp.PARQUET_PARTITIONING).to_table().to_pandas()
+    return df.sort_values(list(df.columns), ignore_index=True)
+
+def assert_same_records(streaming_file, memory_file):
+    """Mêmes enregistrements, dans le même ordre ; les colonnes absentes d'un enregistrement streaming valent null en mémoire."""
+    with open(streaming_file, encoding='utf-8') as f:
+        streaming = json.load(f)
+    with open(memory_file, encoding='utf-8') as f:
+        memory = json.load(f)
+    assert len(streaming) == len(memory)
+    for streaming_record, memory_record in zip(streaming, memory):
+        assert streaming_record == {key: memory_record[key] for key in streaming_record}
+        assert all(value is None for key, value in memory_record.items() if key not in streaming_record)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--years', type=int, default=1, help="historique de chaque station Weather Underground")
+    parser.add_argument('--payloads', type=int, default=20, help="charges utiles Infoclimat")
+    parser.add_argument('--batch-rows', type=int, default=20000)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sources = os.path.join(tmp_dir, 'sources')
+        write_infoclimat_records(os.path.join(sources, 'infoclimat'), args.payloads)
+        write_station_history(os.path.join(sources, 'ichtegem_weather'), args.years)
+        write_station_history(os.path.join(sources, 'la_madeleine_weather'), args.years, seed=7)
+
+        outputs = {}
+        for mode in ['memory', 'streaming']:
+            out = os.path.join(tmp_dir, mode)
+            os.makedirs(out)
+            outputs[mode] = out
+        memory_time, memory_peak, memory_report = measure(lambda: tp.transform_in_memory(
+            sources, outputs['memory'], os.path.join(outputs['memory'], 'parquet'), compact=False))
+        streaming_time, streaming_peak, streaming_report = measure(lambda: tp.transform_streaming(
+            tp.streaming_sources(sources), args.batch_rows, outputs['streaming'], os.path.join(outputs['streaming'], 'parquet')))
+
+        # Les sorties doivent être identiques
+        assert_same_records(os.path.join(outputs['streaming'], 'data_for_mongodb.json'),
+                            os.path.join(outputs['memory'], 'data_for_mongodb.json'))
+        pd.testing.assert_frame_equal(read_dataset(os.path.join(outputs['streaming'], 'parquet')),
+                                      read_dataset(os.path.join(outputs['memory'], 'parquet')))
+        assert streaming_report.to_dict() == memory_report.to_dict()
+
+    bench_utils.print_comparison("Transformation complète", memory_report.rows,
+                                 {'en mémoire': memory_time, f'streaming ({args.batch_rows})': streaming_time})
+    print(f"  pic mémoire Python : {memory_peak / 1e6:.1f} Mo (en mémoire) -> {streaming_peak / 1e6:.1f} Mo (streaming)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Compare le nettoyage des colonnes de mesures de clean_and_convert_data :
+extraction historique par astype(str).str.extract contre parse_measure_column.
+
+Usage : python scripts/benchmarks/bench_unit_parsing.py [--rows 200000]
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import bench_utils
+from transformation_parquet import clean_and_convert_data
+
+MEASURE_UNITS = {
+    'Temperature': '°F', 'Dew Point': '°F', 'Humidity': '%', 'Speed': 'mph', 'Gust': 'mph',
+    'Pressure': 'in', 'Precip. Rate.': 'in', 'Precip. Accum.': 'in', 'Solar': 'w/m²'
+}
+
+def make_frame(n_rows, seed=42):
+    """
+    Génère un DataFrame combiné comme celui de main() : moitié de relevés Weather Underground
+    ('56.8 °F', séparés par une espace insécable comme dans les exports) et moitié de relevés
+    Infoclimat déjà numériques, plus les métadonnées des stations.
+    """
+    rng = np.random.default_rng(seed)
+    half = n_rows // 2
+    data = {}
+    for column, unit in MEASURE_UNITS.items():
+        values = rng.uniform(0, 100, n_rows).round(1)
+        as_text = np.char.add(np.char.add(values[:half].astype(str), '\xa0'), unit).astype(object)
+        data[column] = np.concatenate([as_text, values[half:].astype(object)])
+        data[column][rng.random(n_rows) < 0.02] = None
+    data['UV'] = rng.integers(0, 10, n_rows).astype(float)
+    data['latitude'] = rng.uniform(50, 51, n_rows).round(3)
+    data['longitude'] = rng.uniform(2, 3, n_rows).round(3)
+    data['elevation'] = rng.integers(0, 200, n_rows).astype(float)
+    data['timestamp'] = pd.date_range('2024-01-01', periods=n_rows, freq='min').strftime('%Y-%m-%dT%H:%M:%S')
+    return pd.DataFrame(data)
+
+def clean_and_convert_data_regex(df):
+    """Implémentation historique de la conversion des colonnes de mesures, conservée comme référence."""
+    rename_map = {
+        'Dew Point': 'dew_point', 'Precip. Rate.': 'precip_rate', 'Precip. Accum.': 'precip_accum',
+        'Speed': 'speed', 'Gust': 'gust', 'Pressure': 'pressure', 'UV': 'uv', 'Humidity': 'humidity',
+        'Wind': 'wind', 'Solar': 'solar', 'Temperature': 'temperature'
+    }
+    df = df.rename(columns={k: v for k, v in rename_map.items() if k in df.columns})
+    numeric_cols = [
+        'dew_point', 'precip_rate', 'precip_accum', 'speed', 'gust', 'pressure', 'uv',
+        'humidity', 'solar', 'temperature', 'latitude', 'longitude', 'elevation'
+    ]
+    for col in numeric_cols:
+        if col in df.columns:
+            df[col] = df[col].astype(str).str.extract(r'(-?\d+\.?\d*)')
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    if 'timestamp' in df.columns:
+        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+    return df
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    df = make_frame(args.rows)
+    regex_time, expected = bench_utils.best_of(lambda: clean_and_convert_data_regex(df), args.repeat)
+    vector_time, result = bench_utils.best_of(lambda: clean_and_convert_data(df), args.repeat)
+    float32_time, compact = bench_utils.best_of(lambda: clean_and_convert_data(df, measure_dtype=np.float32), args.repeat)
+    si_time, _ = bench_utils.best_of(lambda: clean_and_convert_data(df, normalize_units=True), args.repeat)
+
+    pd.testing.assert_frame_equal(result, expected)
+    # Valeurs au format inattendu ('50.0°F') ou sans unité : converties comme le reste de la colonne
+    odd = pd.DataFrame({'Temperature': ['50.0\xa0°F', '50.0°F', '50', '50.0 °F']})
+    assert np.allclose(clean_and_convert_data(odd, normalize_units=True)['temperature'], 10.0)
+    bench_utils.print_comparison("Conversion des colonnes de mesures", len(df), {
+        'regex': regex_time, 'vectorisé': vector_time, 'vectorisé float32': float32_time, 'vectorisé + SI': si_time
+    })
+    print(f"  mémoire : {expected.memory_usage(deep=True).sum() / 1e6:.1f} Mo (float64) -> "
+          f"{compact.memory_usage(deep=True).sum() / 1e6:.1f} Mo (float32)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+import os
+import sys
+import time
+
+# Permet d'importer les scripts du pipeline depuis les benchmarks
+SCRIPTS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+for sub_dir in ['.', 'transformation', 'migration']:
+    path = os.path.normpath(os.path.join(SCRIPTS_DIR, sub_dir))
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+def best_of(func, repeat=5):
+    """Exécute func `repeat` fois et retourne (meilleur temps en secondes, dernier résultat)."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def print_comparison(title, rows, timings):
+    """Affiche un tableau 'implémentation / temps / débit' pour un même volume de lignes."""
+    print(f"\n{title} ({rows} lignes)")
+    reference = None
+    for name, seconds in timings.items():
+        reference = reference or seconds
+        print(f"  {name:<20} {seconds * 1000:10.1f} ms  {rows / seconds:12.0f} lignes/s  x{reference / seconds:.1f}")
@@ -0,0 +1,183 @@
+"""
+Générateur de sources synthétiques au format des fichiers Parquet synchronisés par
+Airbyte, pour mesurer le pipeline à des volumes proches de la production :
+
+- une source par station Weather Underground (dossier <station>_weather/) : un relevé
+  toutes les 5 minutes, colonnes nommées comme dans les fichiers Parquet d'Airbyte
+  (temperature, gust, uv... en minuscules, Dew_Point, Precip__Rate_, Precip__Accum_),
+  mesures en chaînes suffixées de leur unité ("56.8 °F", espace insécable) enveloppées
+  par Airbyte ({'string': ..., 'number': ...}), uv numérique, colonnes _airbyte_*,
+  quelques relevés vides (sans horodatage) ;
+- la source Infoclimat (dossier infoclimat/) : une charge utile par jour, avec la liste
+  des stations et leur structure 'hourly' ({station: {'time': [...], metrique: [...]}}),
+  séries parfois incomplètes et valeurs nulles.
+
+L'échelle 1 correspond aux stations des exemples du dépôt (deux stations Weather
+Underground) ; l'échelle n multiplie le nombre de stations. L'historique est d'un an
+par défaut (--days).
+
+Usage : python scripts/benchmarks/synthetic_data.py sortie/ [--scale 10] [--days 365]
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Stations de l'échelle 1
+BASE_STATIONS = 2
+BASE_INFOCLIMAT_STATIONS = 4
+START = '2024-10-01'
+# Jours d'historique par défaut
+DEFAULT_DAYS = 365
+# Lignes par fichier Parquet d'une station (Airbyte découpe chaque synchronisation en plusieurs fichiers)
+ROWS_PER_FILE = 50000
+# Part des relevés Weather Underground entièrement vides
+EMPTY_READING_RATE = 0.01
+
+WIND_DIRECTIONS = ['North', 'NNE', 'NE', 'ENE', 'East', 'ESE', 'SE', 'SSE',
+                   'South', 'SSW', 'SW', 'WSW', 'West', 'WNW', 'NW', 'NNW']
+# Métriques Infoclimat ('temperature' exclue : elle porterait le nom de la colonne renommée des stations)
+INFOCLIMAT_METRICS = {
+    'pression': (990, 1035), 'humidite': (40, 100), 'point_de_rosee': (-5, 18), 'visibilite': (1000, 60000),
+    'vent_moyen': (0, 40), 'vent_rafales': (0, 80), 'vent_direction': (0, 360), 'pluie_1h': (0, 5),
+    'pluie_3h': (0, 12), 'neige_au_sol': (0, 0), 'nebulosite': (0, 8),
+}
+
+def station_metadata(n_stations):
+    """Métadonnées des stations synthétiques, au format de STATION_METADATA."""
+    return {
+        f"ISYNTH{i:03d}": {
+            'station_id': f"ISYNTH{i:03d}", 'station_name': f"Station synthétique {i}",
+            'latitude': round(50.0 + i * 0.01, 3), 'longitude': round(3.0 + i * 0.01, 3), 'elevation': 10 + i % 50,
+            'city': f"Ville {i}", 'state': '-/-', 'hardware': 'other', 'software': 'EasyWeatherPro_V5.1.6',
+        }
+        for i in range(n_stations)
+    }
+
+def _with_unit(fmt, values, unit):
+    return np.char.add(np.char.mod(fmt, values), '\xa0' + unit)
+
+def _airbyte_wrapped(values, empty):
+    """Colonne enveloppée par Airbyte : structure {'string', 'number'}, nulle pour les relevés vides."""
+    strings = pa.array(values, type=pa.string(), mask=empty)
+    return pa.StructArray.from_arrays([strings, pa.nulls(len(strings), pa.float64())],
+                                      names=['string', 'number'], mask=pa.array(empty))
+
+def _airbyte_columns(n_rows, rng, extracted_at):
+    return {
+        '_airbyte_raw_id': pa.array(np.char.mod('%032x', rng.integers(0, 2 ** 63, n_rows))),
+        '_airbyte_extracted_at': pa.array(np.full(n_rows, np.datetime64(extracted_at, 'ms')), type=pa.timestamp('ms', tz='UTC')),
+        '_airbyte_meta': pa.array([{'changes': [], 'sync_id': 1}] * n_rows),
+        '_airbyte_generation_id': pa.array(np.ones(n_rows, dtype=np.int64)),
+    }
+
+def station_table(days, seed=42, start=START):
+    """
+    Relevés d'une station Weather Underground sur `days` jours, tels qu'écrits par Airbyte
+    (mêmes colonnes, dans le même ordre, que les fichiers de transformed_data/).
+    """
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range(start, periods=days * 288, freq='5min') + pd.Timedelta(minutes=int(rng.integers(0, 5)))
+    n_rows = len(timestamps)
+    hours = timestamps.hour.to_numpy() + timestamps.minute.to_numpy() / 60
+    daylight = np.clip(np.sin((hours - 6) / 12 * np.pi), 0, None)
+
+    temperature = 50 + 8 * np.sin((hours - 9) / 24 * 2 * np.pi) + np.cumsum(rng.normal(0, 0.05, n_rows))
+    dew_point = temperature - rng.uniform(2, 10, n_rows)
+    speed = rng.gamma(2, 3, n_rows)
+    rain = rng.random(n_rows) < 0.05
+    precip_rate = np.where(rain, rng.exponential(0.1, n_rows), 0)
+    # Cumul de pluie remis à zéro chaque jour
+    day = (timestamps.normalize() - timestamps[0].normalize()).days.to_numpy()
+    precip_accum = pd.Series(precip_rate / 12).groupby(day).cumsum().to_numpy()
+    empty = rng.random(n_rows) < EMPTY_READING_RATE
+
+    wrapped = lambda values: _airbyte_wrapped(values, empty)
+    table = {
+        'uv': pa.array(np.round(daylight * 8), mask=empty),
+        'gust': wrapped(_with_unit('%.1f', speed * rng.uniform(1, 1.6, n_rows), 'mph')),
+        'wind': wrapped(np.array(WIND_DIRECTIONS)[rng.integers(0, 16, n_rows)]),
+        'solar': wrapped(_with_unit('%d', (daylight * rng.uniform(300, 800, n_rows)).astype(int), 'w/m²')),
+        'speed': wrapped(_with_unit('%.1f', speed, 'mph')),
+        'humidity': wrapped(_with_unit('%d', rng.integers(40, 100, n_rows), '%')),
+        'pressure': wrapped(_with_unit('%.2f', 29.9 + np.cumsum(rng.normal(0, 0.002, n_rows)), 'in')),
+        'Dew_Point': wrapped(_with_unit('%.1f', dew_point, '°F')),
+        'timestamp': pa.array(timestamps.strftime('%Y-%m-%dT%H:%M:%S'), mask=empty),
+        'temperature': wrapped(_with_unit('%.1f', temperature, '°F')),
+        'Precip__Rate_': wrapped(_with_unit('%.2f', precip_rate, 'in')),
+        'Precip__Accum_': wrapped(_with_unit('%.2f', precip_accum, 'in')),
+    }
+    table.update(_airbyte_columns(n_rows, rng, timestamps[-1]))
+    return pa.table(table)
+
+def infoclimat_table(station_ids, days, seed=42, start=START):
+    """Charges utiles Infoclimat (une ligne par jour) pour les stations station_ids."""
+    rng = np.random.default_rng(seed)
+    stations = [{'id': station_id, 'name': f"Infoclimat {station_id}", 'latitude': round(float(rng.uniform(50, 51)), 4),
+                 'longitude': round(float(rng.uniform(2.5, 3.5)), 4), 'elevation': int(rng.integers(0, 200)),
+                 'type': 'synop'} for station_id in station_ids]
+    payloads = []
+    for day in pd.date_range(start, periods=days, freq='D'):
+        times = [f"{day:%Y-%m-%d} {hour:02d}:00:00" for hour in range(24)]
+        hourly = {}
+        for station_id in station_ids:
+            measurements = {'time': times}
+            for metric, (low, high) in INFOCLIMAT_METRICS.items():
+                # Quelques séries incomplètes et valeurs nulles, comme dans l'API réelle
+                length = 24 if rng.random() > 0.1 else 12
+                values = np.round(rng.uniform(low, high, length), 1)
+                measurements[metric] = [None if missing else float(value)
+                                        for value, missing in zip(values, rng.random(length) < 0.05)]
+            hourly[station_id] = measurements
+        payloads.append({'status': 'OK', 'stations': stations, 'hourly': hourly})
+    table = pa.Table.from_pylist(payloads)
+    for name, column in _airbyte_columns(len(payloads), rng, pd.Timestamp(start) + pd.Timedelta(days=days)).items():
+        table = table.append_column(name, column)
+    return table
+
+def _write_parts(table, data_path, rows_per_file=ROWS_PER_FILE):
+    os.makedirs(data_path, exist_ok=True)
+    for i, offset in enumerate(range(0, len(table), rows_per_file)):
+        pq.write_table(table.slice(offset, rows_per_file), os.path.join(data_path, f"part-{i:04d}.parquet"))
+
+def generate_sources(output_dir, scale=1, days=DEFAULT_DAYS, seed=42):
+    """
+    Écrit les sources synthétiques de l'échelle `scale` dans output_dir (même arborescence
+    que le dossier de téléchargement S3). Retourne {'stations': {dossier: métadonnées},
+    'infoclimat': dossier, 'rows': {dossier: lignes écrites}}.
+    """
+    stations = station_metadata(BASE_STATIONS * scale)
+    sources = {'stations': {}, 'infoclimat': os.path.join(output_dir, 'infoclimat'), 'rows': {}}
+    for i, (station_id, meta) in enumerate(stations.items()):
+        data_path = os.path.join(output_dir, f"{station_id.lower()}_weather")
+        table = station_table(days, seed=seed + i)
+        _write_parts(table, data_path)
+        sources['stations'][data_path] = meta
+        sources['rows'][data_path] = len(table)
+
+    infoclimat_ids = [f"{7000 + i:05d}" for i in range(BASE_INFOCLIMAT_STATIONS * scale)]
+    _write_parts(infoclimat_table(infoclimat_ids, days, seed=seed), sources['infoclimat'])
+    sources['rows'][sources['infoclimat']] = len(infoclimat_ids) * days * 24
+    return sources
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output_dir')
+    parser.add_argument('--scale', type=int, default=1, help="multiplicateur du nombre de stations")
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS, help="jours d'historique")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    sources = generate_sources(args.output_dir, args.scale, args.days, args.seed)
+    # Métadonnées des stations, à reporter dans STATION_METADATA pour lancer le pipeline sur ces sources
+    with open(os.path.join(args.output_dir, '_stations.json'), 'w', encoding='utf-8') as f:
+        json.dump({meta['station_id']: meta for meta in sources['stations'].values()}, f, ensure_ascii=False, indent=2)
+    for data_path, rows in sources['rows'].items():
+        print(f"{data_path:<50} {rows:>10} relevés")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,371 @@
+"""
+Instrumentation partagée des scripts du pipeline (conversion Excel, transformation, migration).
+
+Chaque étape est mesurée dans un bloc `with stage(...)` : durée, temps CPU, lignes en
+entrée et en sortie, octets lus et écrits, pic de mémoire résidente du processus depuis
+son démarrage (process_peak_rss_mb) et hausse de ce pic pendant l'étape
+(peak_rss_growth_mb, seule mesure propre à l'étape). À la fin de
+l'exécution, `run(...)` écrit un rapport JSON lisible par machine et résume les étapes
+dans les logs. Une étape exécutée plusieurs fois (un appel par lot en streaming) est
+agrégée en une seule entrée du rapport, avec son nombre d'appels. Les étapes peuvent être
+mesurées depuis plusieurs threads, et depuis des processus de travail avec captured()
+et merge().
+
+Variables d'environnement :
+- RUN_REPORT_DIR : répertoire des rapports d'exécution et des profils (défaut : '.')
+- PROFILE_STAGES : étapes exécutées sous cProfile ('all' ou noms séparés par des virgules)
+- TRACEMALLOC_STAGES : étapes dont les allocations Python sont tracées (même format)
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows : pas de getrusage
+    resource = None
+
+RUN_REPORT_DIR = os.environ.get('RUN_REPORT_DIR', '.')
+PROFILE_STAGES = os.environ.get('PROFILE_STAGES', '')
+TRACEMALLOC_STAGES = os.environ.get('TRACEMALLOC_STAGES', '')
+# Nombre de lignes du profil cProfile et de sites d'allocation conservés par étape
+PROFILE_TOP = 15
+TRACEMALLOC_TOP = 5
+METRIC_KEYS = ['rows_in', 'rows_out', 'bytes_read', 'bytes_written']
+TIME_KEYS = ['wall_seconds', 'cpu_seconds']
+
+# Exécution en cours (une seule par processus), piles des étapes ouvertes (une par thread)
+# et profileur actif
+_run = None
+_local = threading.local()
+_lock = threading.Lock()
+_active_profiler = None
+# tracemalloc est global au processus : pic de chaque étape tracée ouverte (tous threads
+# confondus, par id de ses mesures) et démarrage du traçage par ce module, protégés par _lock
+_traced_peaks = {}
+_started_tracing = False
+
+def _enabled_for(setting, name):
+    names = {s.strip() for s in setting.split(',') if s.strip()}
+    return 'all' in names or name in names
+
+def peak_rss_mb(who='self'):
+    """
+    Pic de mémoire résidente depuis le démarrage, en Mo (None si indisponible) : du
+    processus ('self') ou du plus gros des processus fils terminés ('children').
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if who == 'children' else resource.RUSAGE_SELF)
+    # ru_maxrss est exprimé en Ko sous Linux
+    return round(usage.ru_maxrss / 1024, 1)
+
+def path_size(path):
+    """Taille en octets d'un fichier, ou de tous les fichiers d'un répertoire (0 s'il n'existe pas)."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+def record(**metrics):
+    """
+    Ajoute des compteurs (rows_in, rows_out, bytes_read, bytes_written...) à l'étape
+    ouverte la plus interne du thread courant. Sans étape ouverte, l'appel est ignoré.
+    """
+    stack = _stack()
+    if not stack:
+        return
+    current = stack[-1]
+    for key, value in metrics.items():
+        current[key] = current.get(key, 0) + value
+
+def _new_metrics(name, fields):
+    metrics = {'stage': name, **fields}
+    stack = _stack()
+    if stack:
+        metrics['parent'] = stack[-1]['stage']
+    return metrics
+
+def _store(metrics):
+    """
+    Ajoute les mesures d'un appel (ou d'une entrée déjà agrégée, avec 'calls') au run
+    en cours, en cumulant les appels d'une même étape.
+    """
+    with _lock:
+        if _run is not None:
+            _merge_entry(_run['stages'], metrics)
+
+def _merge_entry(stages, metrics):
+    key = (metrics['stage'], metrics.get('source'), metrics.get('parent'))
+    calls = metrics.get('calls', 1)
+    if key not in stages:
+        stages[key] = {**metrics, 'calls': calls}
+        return
+    entry = stages[key]
+    entry['calls'] += calls
+    # Les hausses du pic de mémoire des appels successifs s'additionnent
+    for name in METRIC_KEYS + TIME_KEYS + ['peak_rss_growth_mb']:
+        if name in metrics:
+            entry[name] = round(entry.get(name, 0) + metrics[name], 4)
+    for name in ['process_peak_rss_mb', 'traced_peak_mb']:
+        if metrics.get(name) is not None:
+            entry[name] = max(entry.get(name) or 0, metrics[name])
+    if 'top_allocations' in metrics:
+        entry['top_allocations'] = metrics['top_allocations']
+    if metrics['status'] != 'ok':
+        entry['status'] = metrics['status']
+
+@contextmanager
+def stage(name, **fields):
+    """
+    Mesure une étape du pipeline. Les champs passés en argument (source, rows_in...) sont
+    copiés dans les mesures, qui sont retournées par le `with` pour être complétées :
+
+        with stage('read_parquet', source='infoclimat') as metrics:
+            df = pd.read_parquet(path)
+            metrics['rows_out'] = len(df)
+
+    Si l'étape figure dans PROFILE_STAGES ou TRACEMALLOC_STAGES, elle est exécutée sous
+    cProfile ou tracemalloc. Hors d'un `run(...)`, les mesures ne sont pas conservées.
+    """
+    global _active_profiler
+    metrics = _new_metrics(name, fields)
+    _stack().append(metrics)
+
+    profiler = None
+    # Un seul profileur peut être actif : une étape imbriquée dans une étape profilée est incluse dans son profil
+    with _lock:
+        if _run is not None and _active_profiler is None and _enabled_for(PROFILE_STAGES, name):
+            profiler = _active_profiler = _run['profilers'].setdefault(name, cProfile.Profile())
+    traced = _run is not None and _enabled_for(TRACEMALLOC_STAGES, name)
+    if traced:
+        _enter_traced_stage(metrics)
+
+    status = 'error'
+    start, cpu_start = time.perf_counter(), time.process_time()
+    peak_rss_start = peak_rss_mb()
+    if profiler:
+        profiler.enable()
+    try:
+        yield metrics
+        status = 'ok'
+    finally:
+        if profiler:
+            profiler.disable()
+            _active_profiler = None
+        metrics['wall_seconds'] = round(time.perf_counter() - start, 4)
+        metrics['cpu_seconds'] = round(time.process_time() - cpu_start, 4)
+        _set_rss(metrics, peak_rss_start)
+        metrics['status'] = status
+        if traced:
+            _exit_traced_stage(metrics)
+        _stack().pop()
+        _store(metrics)
+
+def _fold_traced_peak():
+    """Reporte le pic tracemalloc courant sur chaque étape tracée ouverte (sous _lock)."""
+    peak = tracemalloc.get_traced_memory()[1]
+    for key in _traced_peaks:
+        _traced_peaks[key] = max(_traced_peaks[key], peak)
+
+def _enter_traced_stage(metrics):
+    """
+    Ouvre une étape tracée. tracemalloc n'a qu'un pic, global au processus : avant de le
+    remettre à zéro pour cette étape, il est reporté sur les étapes tracées déjà ouvertes
+    (imbriquées ou dans d'autres threads), dont le pic est le maximum des pics reportés.
+    Le traçage est démarré par la première étape tracée et arrêté après la dernière.
+    """
+    global _started_tracing
+    with _lock:
+        if not _traced_peaks and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        _fold_traced_peak()
+        tracemalloc.reset_peak()
+        _traced_peaks[id(metrics)] = 0
+
+def _exit_traced_stage(metrics):
+    """
+    Ferme une étape tracée : ajoute à ses mesures le pic des allocations Python du
+    processus pendant l'étape (étapes simultanées comprises) et les principaux sites
+    d'allocation encore vivants.
+    """
+    global _started_tracing
+    with _lock:
+        _fold_traced_peak()
+        metrics['traced_peak_mb'] = round(_traced_peaks.pop(id(metrics)) / 1e6, 1)
+        top = tracemalloc.take_snapshot().statistics('lineno')[:TRACEMALLOC_TOP]
+        metrics['top_allocations'] = [
+            {'location': f"{s.traceback[0].filename}:{s.traceback[0].lineno}", 'size_mb': round(s.size / 1e6, 2)}
+            for s in top
+        ]
+        if not _traced_peaks and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+def _set_rss(metrics, peak_rss_start):
+    """
+    Mémoire résidente d'une étape : pic du processus depuis son démarrage (pas propre à
+    l'étape) et hausse de ce pic pendant l'étape (0 si l'étape reste sous le pic atteint avant).
+    """
+    metrics['process_peak_rss_mb'] = peak_rss_mb()
+    if metrics['process_peak_rss_mb'] is not None:
+        metrics['peak_rss_growth_mb'] = round(metrics['process_peak_rss_mb'] - peak_rss_start, 1)
+
+def timed_iter(name, iterable, count=None, **fields):
+    """
+    Itère sur `iterable` en mesurant uniquement le temps passé à produire les éléments
+    (lecture, parsing), séparément du traitement fait par l'appelant. L'étape est
+    enregistrée à la fin de l'itération ; `count(item)` donne le nombre de lignes de
+    chaque élément (1 par défaut).
+    """
+    metrics = _new_metrics(name, fields)
+    metrics['rows_out'] = 0
+    elapsed = cpu = 0.0
+    peak_rss_start = peak_rss_mb()
+    iterator = iter(iterable)
+    status = 'error'
+    try:
+        while True:
+            start, cpu_start = time.perf_counter(), time.process_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                status = 'ok'
+                break
+            finally:
+                elapsed += time.perf_counter() - start
+                cpu += time.process_time() - cpu_start
+            metrics['rows_out'] += count(item) if count else 1
+            yield item
+    finally:
+        metrics.update(wall_seconds=round(elapsed, 4), cpu_seconds=round(cpu, 4), status=status)
+        # Le pic de mémoire couvre toute l'itération, traitement de l'appelant compris
+        _set_rss(metrics, peak_rss_start)
+        _store(metrics)
+
+def captured(func, *args, **kwargs):
+    """
+    Exécute func dans un processus de travail en mesurant ses étapes comme pendant un run.
+    Retourne (résultat, étapes mesurées), à passer à merge() dans le processus principal.
+    """
+    global _run
+    saved_run, saved_stack = _run, _stack()
+    _run, _local.stack = {'run': 'worker', 'stages': {}, 'profilers': {}}, []
+    try:
+        result = func(*args, **kwargs)
+        stages = list(_run['stages'].values())
+        profiles = _dump_profiles(f"worker-{os.getpid()}", _run['profilers'])
+        for entry in stages:
+            if entry['stage'] in profiles:
+                entry['profile_path'] = profiles[entry['stage']]
+        return result, stages
+    finally:
+        _run, _local.stack = saved_run, saved_stack
+
+def merge(captured_result):
+    """
+    Ajoute au run en cours les étapes d'un résultat de captured(), rattachées à l'étape
+    ouverte du thread courant, et retourne le résultat de la fonction.
+    """
+    result, stages = captured_result
+    stack = _stack()
+    for metrics in stages:
+        if 'parent' not in metrics and stack:
+            metrics = {**metrics, 'parent': stack[-1]['stage']}
+        _store(metrics)
+    return result
+
+def _dump_profiles(run_name, profilers):
+    """Écrit le profil cProfile de chaque étape (.prof) et en journalise les fonctions les plus coûteuses."""
+    paths = {}
+    for name, profiler in profilers.items():
+        os.makedirs(RUN_REPORT_DIR, exist_ok=True)
+        path = os.path.join(RUN_REPORT_DIR, f"{run_name}_{name}.prof")
+        profiler.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(PROFILE_TOP)
+        logging.info(f"Profil de l'étape '{name}' sauvegardé dans {path}\n{summary.getvalue()}")
+        paths[name] = path
+    return paths
+
+def write_run_report(report, path):
+    """Écrit le rapport d'exécution au format JSON."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+
+def log_run_summary(report):
+    """Journalise un tableau récapitulatif des étapes du run."""
+    lines = [f"Résumé de l'exécution '{report['run']}' ({report['status']}, {report['wall_seconds']:.2f} s) :"]
+    for s in report['stages']:
+        label = s['stage'] + (f"[{s['source']}]" if s.get('source') else '')
+        if s['status'] != 'ok':
+            label += f" ({s['status']})"
+        counters = ', '.join(f"{key}={s[key]}" for key in METRIC_KEYS if s.get(key) is not None)
+        lines.append(f"  {label:<40} {s['wall_seconds']:9.3f} s  x{s['calls']:<5} "
+                     f"pic RSS du processus {s.get('process_peak_rss_mb')} Mo "
+                     f"(+{s.get('peak_rss_growth_mb')} Mo pendant l'étape)  {counters}")
+    logging.info('\n'.join(lines))
+
+@contextmanager
+def run(name, report_path=None):
+    """
+    Encadre une exécution complète d'un script : les étapes mesurées pendant le bloc
+    sont rassemblées dans un rapport JSON (par défaut RUN_REPORT_DIR/<name>_run_report.json),
+    écrit même si le script échoue.
+    """
+    global _run
+    report_path = report_path or os.path.join(RUN_REPORT_DIR, f"{name}_run_report.json")
+    _run = {
+        'run': name,
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'pid': os.getpid(),
+        'stages': {},
+        'profilers': {},
+    }
+    status = 'error'
+    start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield _run
+        status = 'ok'
+    finally:
+        current, _run = _run, None
+        report = {
+            'run': name,
+            'status': status,
+            'started_at': current['started_at'],
+            'finished_at': datetime.now(timezone.utc).isoformat(),
+            'pid': current['pid'],
+            'wall_seconds': round(time.perf_counter() - start, 4),
+            'cpu_seconds': round(time.process_time() - cpu_start, 4),
+            'peak_rss_mb': peak_rss_mb(),
+            # Processus de conversion des classeurs Excel
+            'peak_rss_children_mb': peak_rss_mb('children'),
+            'stages': list(current['stages'].values()),
+        }
+        try:
+            os.makedirs(RUN_REPORT_DIR, exist_ok=True)
+            profiles = _dump_profiles(name, current['profilers'])
+            for entry in report['stages']:
+                if entry['stage'] in profiles:
+                    entry['profile_path'] = profiles[entry['stage']]
+            write_run_report(report, report_path)
+            log_run_summary(report)
+            logging.info(f"Rapport d'exécution sauvegardé dans {report_path}")
+        except OSError as e:
+            logging.error(f"Impossible d'écrire le rapport d'exécution : {e}")
@@ -1,8 +1,31 @@
+import hashlib
 import json
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, OperationFailure
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from bson import ObjectId, encode as bson_encode
+from bson.raw_bson import RawBSONDocument
+from pymongo import ASCENDING, InsertOne, MongoClient, UpdateOne
+from pymongo.errors import (BulkWriteError, ConnectionFailure, ExecutionTimeout, OperationFailure,
+                            PyMongoError, WriteConcernError)
+from pymongo.write_concern import WriteConcern
+import itertools
 import os
+import random
+import struct
+import sys
+import threading
+import time
+import uuid
 import logging
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Module d'instrumentation partagé (scripts/instrumentation.py, copié à côté du script dans l'image Docker)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import instrumentation
 
 # Configuration du logging
 logging.basicConfig(
@@ -20,35 +43,1043 @@ DB_NAME = "greenandcoop"
 COLLECTION_NAME = "weather_stations"
 
 # Chemin vers le fichier JSON transformé
-JSON_FILE_PATH = os.path.join('transformed_data', 'data_for_mongodb.json')
+# (un fichier '.jsonl' est lu comme du JSON Lines, un enregistrement par ligne)
+JSON_FILE_PATH = os.environ.get('JSON_FILE_PATH', os.path.join('transformed_data', 'data_for_mongodb.json'))
+
+# Dataset Parquet partitionné produit par 'transformation_parquet.py' ;
+# s'il est défini, il est lu par lots Arrow à la place du fichier JSON
+PARQUET_DATASET_PATH = os.environ.get('PARQUET_DATASET_PATH')
+PARQUET_PARTITIONING = ds.partitioning(
+    pa.schema([('station_id', pa.string()), ('month', pa.string())]), flavor='hive'
+)
+# Colonnes de partitionnement qui ne sont pas des champs des documents
+PARTITION_ONLY_COLUMNS = ['month']
+# Encodage des documents lus dans le dataset Parquet lors d'un chargement complet : 'raw'
+# (documents BSON construits colonne par colonne depuis les lots Arrow) ou 'dict'
+# (dictionnaires Python encodés par pymongo, toujours utilisé en mode incrémental)
+BSON_ENCODING = os.environ.get('BSON_ENCODING', 'raw')
+# Schéma commun des fichiers, écrit par la transformation incrémentale (les partitions
+# ajoutées peuvent apporter des colonnes absentes des premiers fichiers)
+COMMON_METADATA_FILENAME = '_common_metadata'
+
+# Mode de chargement : 'full' (vidage puis rechargement complet) ou
+# 'incremental' (upsert des seuls enregistrements plus récents que le dernier chargement)
+MIGRATION_MODE = os.environ.get('MIGRATION_MODE', 'full')
+# Manifeste écrit par la transformation à côté du fichier JSON ; son champ 'delta' indique
+# que le fichier ne contient que les relevés d'une transformation incrémentale
+TRANSFORM_MANIFEST_FILENAME = '_transform_manifest.json'
+# Collection contenant le dernier timestamp chargé pour chaque station
+STATE_COLLECTION_NAME = os.environ.get('STATE_COLLECTION_NAME', 'migration_state')
+# Document de la collection d'état portant la version des données chargées, changée à chaque
+# chargement : le service de requêtes (scripts/query_service.py) vide alors son cache
+DATA_VERSION_ID = '_data_version'
+
+# Index maintenus sur la collection : (nom, clés, options). L'index unique sert aussi
+# de clé aux upserts du mode incrémental ; les deux couvrent les requêtes par station et période.
+INDEXES = [
+    ('station_id_timestamp_unique', [('station_id', ASCENDING), ('timestamp', ASCENDING)], {'unique': True}),
+    ('station_name_timestamp', [('station_name', ASCENDING), ('timestamp', ASCENDING)], {}),
+]
+
+# Type de la collection principale : 'standard' ou 'timeseries'. Une collection time-series
+# regroupe les relevés par station (metaField) et par période ; elle n'accepte ni index
+# unique ni upsert, le mode incrémental y insère donc les relevés nouveaux.
+# Le changement de type n'est appliqué que lors d'un chargement complet.
+COLLECTION_TYPE = os.environ.get('COLLECTION_TYPE', 'standard')
+TIMESERIES_OPTIONS = {'timeField': 'timestamp', 'metaField': 'station_id', 'granularity': 'minutes'}
+
+# Agrégats horaires et journaliers par station, recalculés sur les journées touchées
+# par chaque chargement (tout l'historique lors d'un chargement complet)
+BUILD_ROLLUPS = os.environ.get('BUILD_ROLLUPS', '1') == '1'
+HOURLY_COLLECTION_NAME = os.environ.get('HOURLY_COLLECTION_NAME', 'weather_hourly')
+DAILY_COLLECTION_NAME = os.environ.get('DAILY_COLLECTION_NAME', 'weather_daily')
+# Clé des agrégats, aussi utilisée par $merge (qui exige un index unique sur ces champs)
+ROLLUP_KEY = [('station_id', ASCENDING), ('period_start', ASCENDING)]
+
+# Nombre de documents envoyés par insert_many
+BATCH_SIZE = int(os.environ.get('BATCH_SIZE', 5000))
+# Nombre de lots écrits simultanément, chacun par un thread et une connexion du pool
+INSERT_WORKERS = int(os.environ.get('INSERT_WORKERS', 4))
+# Write concern des écritures : nombre de membres ('1', '0') ou 'majority', et attente du journal
+WRITE_CONCERN = os.environ.get('WRITE_CONCERN', '1')
+WRITE_CONCERN_JOURNAL = os.environ.get('WRITE_CONCERN_JOURNAL', '0') == '1'
+# Renvois d'un lot après une erreur transitoire, l'attente doublant à chaque tentative
+MAX_RETRIES = int(os.environ.get('MAX_RETRIES', 5))
+RETRY_BACKOFF_SECONDS = float(os.environ.get('RETRY_BACKOFF_SECONDS', 0.5))
+# Point de reprise d'un chargement complet : lots déjà insérés pour une entrée donnée
+CHECKPOINT_PATH = os.environ.get('CHECKPOINT_PATH', 'migration_checkpoint.json')
+# Intervalle entre deux journalisations du débit soutenu (en secondes)
+PROGRESS_INTERVAL_SECONDS = 10
+DUPLICATE_KEY_ERROR = 11000
+# Taille des blocs lus depuis le fichier JSON (en caractères)
+READ_CHUNK_SIZE = 1024 * 1024
+
+def iter_json_records(file_path, chunk_size=READ_CHUNK_SIZE):
+    """
+    Lit les enregistrements un par un depuis un tableau JSON ou un fichier JSON Lines,
+    sans jamais charger le fichier entier en mémoire.
+    """
+    if file_path.endswith('.jsonl'):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        return
+
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        buffer, pos, eof = '', 0, False
+        in_array = False
+        while True:
+            # Ignore les espaces et les virgules entre deux enregistrements
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(buffer):
+                if eof:
+                    if in_array:
+                        raise json.JSONDecodeError("Tableau JSON non terminé", buffer, pos)
+                    return
+                buffer, pos = f.read(chunk_size), 0
+                eof = not buffer
+                continue
+            if not in_array:
+                if buffer[pos] != '[':
+                    raise json.JSONDecodeError("Un tableau JSON est attendu", buffer, pos)
+                in_array = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+                # Un nombre en fin de bloc peut être tronqué : on attend la suite
+                if end == len(buffer) and not eof:
+                    raise json.JSONDecodeError("Enregistrement incomplet", buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+
+            yield record
+            pos = end
+
+def _open_parquet_dataset(dataset_path):
+    """
+    Ouvre le dataset Parquet partitionné et retourne (dataset, colonnes des documents).
+    Le schéma de _common_metadata, s'il existe, couvre les colonnes de tous les fichiers.
+    """
+    schema = None
+    common_metadata = os.path.join(dataset_path, COMMON_METADATA_FILENAME)
+    if os.path.exists(common_metadata):
+        schema = pa.unify_schemas([pq.read_schema(common_metadata), PARQUET_PARTITIONING.schema])
+    dataset = ds.dataset(dataset_path, schema=schema, format='parquet', partitioning=PARQUET_PARTITIONING)
+    return dataset, [name for name in dataset.schema.names if name not in PARTITION_ONLY_COLUMNS]
+
+def iter_parquet_records(dataset_path, batch_size=BATCH_SIZE):
+    """
+    Lit le dataset Parquet partitionné par lots Arrow de batch_size lignes au plus
+    et produit les documents un par un. Les types sont conservés : les timestamps
+    arrivent en datetime et les valeurs manquantes en None.
+    """
+    dataset, columns = _open_parquet_dataset(dataset_path)
+    for record_batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+        yield from record_batch.to_pylist()
+
+def iter_parquet_bson_documents(dataset_path, skipped, batch_size=BATCH_SIZE):
+    """
+    Variante de iter_parquet_records produisant directement des documents BSON prêts à
+    être envoyés (voir encode_record_batch), sans dictionnaires Python intermédiaires.
+    """
+    dataset, columns = _open_parquet_dataset(dataset_path)
+    # Les petits lots (un par fichier de partition) sont regroupés : le coût fixe de
+    # l'encodage d'un lot est ainsi réparti sur batch_size lignes
+    pending, pending_rows = [], 0
+    for record_batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+        pending.append(record_batch)
+        pending_rows += record_batch.num_rows
+        if pending_rows >= batch_size:
+            yield from _encode_pending(pending, skipped)
+            pending, pending_rows = [], 0
+    yield from _encode_pending(pending, skipped)
+
+def _encode_pending(record_batches, skipped):
+    if len(record_batches) > 1:
+        record_batches = pa.Table.from_batches(record_batches).combine_chunks().to_batches()
+    for record_batch in record_batches:
+        yield from encode_record_batch(record_batch, skipped)
+
+# Encodage BSON colonne par colonne
+
+BSON_DOUBLE, BSON_STRING, BSON_OBJECT_ID, BSON_BOOLEAN = 0x01, 0x02, 0x07, 0x08
+BSON_DATETIME, BSON_NULL, BSON_INT32, BSON_INT64 = 0x09, 0x0A, 0x10, 0x12
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+# Longueur du document (4 octets) puis élément _id : type, nom '_id\0', ObjectId (12 octets)
+BSON_HEADER_SIZE = 4 + 1 + 4 + 12
+
+# Partie aléatoire propre au processus et compteur des ObjectId, construits comme ceux de bson.ObjectId
+_OBJECT_ID_RANDOM = np.frombuffer(os.urandom(5), dtype=np.uint8)
+_object_id_lock = threading.Lock()
+_object_id_next = random.randrange(0x1000000)
+
+def _object_ids(n):
+    """n ObjectId distincts (matrice n x 12 octets) : horodatage, partie aléatoire du processus, compteur."""
+    global _object_id_next
+    with _object_id_lock:
+        first = _object_id_next
+        _object_id_next = (first + n) % 0x1000000
+    ids = np.empty((n, 12), dtype=np.uint8)
+    ids[:, :4] = np.frombuffer(struct.pack('>I', int(time.time())), dtype=np.uint8)
+    ids[:, 4:9] = _OBJECT_ID_RANDOM
+    counters = ((first + np.arange(n)) % 0x1000000).astype('>u4')
+    ids[:, 9:] = counters.view(np.uint8).reshape(n, 4)[:, 1:]
+    return ids
+
+def _write_bytes(buffer, positions, values):
+    """Écrit chaque ligne de values (matrice n x k d'octets) dans buffer à la position correspondante."""
+    if len(positions):
+        buffer[positions[:, None] + np.arange(values.shape[1])] = values
+
+def _fixed_width_values(values, dtype):
+    return np.ascontiguousarray(values, dtype=dtype).view(np.uint8).reshape(len(values), np.dtype(dtype).itemsize)
+
+def _column_encoder(array):
+    """
+    Prépare l'encodage BSON d'une colonne Arrow. Retourne (type BSON de chaque ligne,
+    taille de la valeur de chaque ligne, fonction écrivant les valeurs à partir de leurs
+    positions dans le tampon), ou None si le type de la colonne n'est pas pris en charge.
+    Les valeurs manquantes sont des null BSON (sans valeur), comme None avec pymongo.
+    """
+    if pa.types.is_dictionary(array.type):
+        array = array.dictionary_decode()
+    n = len(array)
+    valid = array.is_valid().to_numpy(zero_copy_only=False)
+
+    def typed(code, width):
+        return np.where(valid, code, BSON_NULL).astype(np.uint8), np.where(valid, width, 0)
+
+    if pa.types.is_null(array.type):
+        return np.full(n, BSON_NULL, dtype=np.uint8), np.zeros(n, dtype=np.int64), lambda buffer, positions: None
+
+    if pa.types.is_floating(array.type):
+        values = array.cast(pa.float64()).fill_null(0).to_numpy()
+        types, widths = typed(BSON_DOUBLE, 8)
+        return types, widths, lambda buffer, positions: _write_bytes(
+            buffer, positions[valid], _fixed_width_values(values[valid], '<f8'))
+
+    if pa.types.is_integer(array.type):
+        try:
+            values = array.cast(pa.int64()).fill_null(0).to_numpy()
+        except pa.ArrowInvalid:
+            return None
+        # Comme pymongo : int32 lorsque la valeur y tient, int64 sinon
+        is_int32 = (values >= INT32_MIN) & (values <= INT32_MAX)
+        types = np.where(valid, np.where(is_int32, BSON_INT32, BSON_INT64), BSON_NULL).astype(np.uint8)
+        widths = np.where(valid, np.where(is_int32, 4, 8), 0)
+
+        def write_integers(buffer, positions):
+            for mask, dtype in ((valid & is_int32, '<i4'), (valid & ~is_int32, '<i8')):
+                _write_bytes(buffer, positions[mask], _fixed_width_values(values[mask], dtype))
+        return types, widths, write_integers
+
+    if pa.types.is_boolean(array.type):
+        values = array.fill_null(False).to_numpy(zero_copy_only=False)
+        types, widths = typed(BSON_BOOLEAN, 1)
+        return types, widths, lambda buffer, positions: _write_bytes(
+            buffer, positions[valid], _fixed_width_values(values[valid], np.uint8))
+
+    if pa.types.is_timestamp(array.type):
+        # Millisecondes depuis l'époque UTC, la précision des dates BSON
+        values = array.cast(pa.timestamp('ms', tz=array.type.tz), safe=False).cast(pa.int64()).fill_null(0).to_numpy()
+        types, widths = typed(BSON_DATETIME, 8)
+        return types, widths, lambda buffer, positions: _write_bytes(
+            buffer, positions[valid], _fixed_width_values(values[valid], '<i8'))
+
+    if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+        array = array.cast(pa.large_string())
+        _, offsets_buffer, data_buffer = array.buffers()
+        offsets = np.frombuffer(offsets_buffer, dtype=np.int64)[array.offset:array.offset + n + 1]
+        data = np.frombuffer(data_buffer, dtype=np.uint8) if data_buffer is not None else np.empty(0, dtype=np.uint8)
+        lengths = np.where(valid, np.diff(offsets), 0)
+        # Longueur (4 octets, terminateur compris), octets UTF-8, terminateur nul
+        types, widths = typed(BSON_STRING, 4 + lengths + 1)
+
+        def write_strings(buffer, positions):
+            positions, starts, sizes = positions[valid], offsets[:-1][valid], lengths[valid]
+            _write_bytes(buffer, positions, _fixed_width_values(sizes + 1, '<i4'))
+            total = int(sizes.sum())
+            if total:
+                # Position de chaque octet dans sa chaîne, puis copie vers la valeur de la ligne
+                within = np.arange(total) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+                buffer[np.repeat(positions + 4, sizes) + within] = data[np.repeat(starts, sizes) + within]
+        return types, widths, write_strings
+
+    return None
+
+def _encode_records(record_batch, skipped):
+    """Encodage par pymongo des lignes du lot (types non pris en charge par encode_record_batch)."""
+    return [RawBSONDocument(bson_encode({'_id': ObjectId(), **record}))
+            for record in normalize_documents(record_batch.to_pylist(), skipped)]
+
+def encode_record_batch(record_batch, skipped):
+    """
+    Encode un lot Arrow en documents BSON (RawBSONDocument) sans créer d'objets Python
+    par valeur : les éléments de chaque colonne sont écrits en une fois dans un tampon
+    NumPy commun au lot, puis découpé en documents. Ceux-ci sont identiques à ceux que
+    pymongo encode depuis record_batch.to_pylist() : _id en tête, colonnes dans l'ordre,
+    valeurs manquantes en null, entiers en int32 lorsqu'ils y tiennent, timestamps en dates.
+    Les lignes sans timestamp sont écartées et comptées dans skipped ; un lot dont une
+    colonne a un type non pris en charge (listes, structures...) est encodé par pymongo.
+    """
+    names = record_batch.schema.names
+    if 'timestamp' not in names:
+        skipped['timestamp'] += record_batch.num_rows
+        return []
+    timestamps = record_batch.column('timestamp')
+    if not pa.types.is_timestamp(timestamps.type):
+        return _encode_records(record_batch, skipped)
+    if timestamps.null_count:
+        skipped['timestamp'] += timestamps.null_count
+        record_batch = record_batch.filter(timestamps.is_valid())
+    n = record_batch.num_rows
+    if n == 0:
+        return []
+
+    encoded_names = [name.encode('utf-8') for name in names]
+    columns = [_column_encoder(record_batch.column(i)) for i in range(len(names))]
+    if any(column is None for column in columns) or any(b'\0' in name for name in encoded_names):
+        return _encode_records(record_batch, skipped)
+
+    # Taille de chaque document : en-tête et _id, éléments (type, nom, valeur), terminateur
+    sizes = np.full(n, BSON_HEADER_SIZE + 1, dtype=np.int64)
+    for name, (_, widths, _) in zip(encoded_names, columns):
+        sizes += 1 + len(name) + 1 + widths
+    starts = np.zeros(n, dtype=np.int64)
+    np.cumsum(sizes[:-1], out=starts[1:])
+    buffer = np.zeros(int(sizes.sum()), dtype=np.uint8)
+
+    _write_bytes(buffer, starts, _fixed_width_values(sizes, '<i4'))
+    buffer[starts + 4] = BSON_OBJECT_ID
+    _write_bytes(buffer, starts + 5, np.broadcast_to(np.frombuffer(b'_id', dtype=np.uint8), (n, 3)))
+    _write_bytes(buffer, starts + 9, _object_ids(n))
+    positions = starts + BSON_HEADER_SIZE
+    for name, (types, widths, write_values) in zip(encoded_names, columns):
+        buffer[positions] = types
+        _write_bytes(buffer, positions + 1, np.broadcast_to(np.frombuffer(name, dtype=np.uint8), (n, len(name))))
+        write_values(buffer, positions + len(name) + 2)
+        positions = positions + len(name) + 2 + widths
+
+    data = buffer.tobytes()
+    return [RawBSONDocument(data[start:end]) for start, end in zip(starts.tolist(), (starts + sizes).tolist())]
+
+def iter_batches(records, batch_size=BATCH_SIZE):
+    """Regroupe un flux d'enregistrements en lots de taille fixe."""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def write_concern():
+    """Write concern des écritures de la migration (WRITE_CONCERN, WRITE_CONCERN_JOURNAL)."""
+    w = int(WRITE_CONCERN) if WRITE_CONCERN.isdigit() else WRITE_CONCERN
+    return WriteConcern(w=w, j=True if WRITE_CONCERN_JOURNAL else None)
+
+def _is_transient(error):
+    """Erreurs après lesquelles un lot peut être renvoyé : connexion, délai dépassé, write concern non satisfait."""
+    if isinstance(error, BulkWriteError):
+        return bool(error.details.get('writeConcernErrors'))
+    return isinstance(error, (ConnectionFailure, ExecutionTimeout, WriteConcernError))
+
+def with_retries(write, batch_number, retries=MAX_RETRIES, backoff=RETRY_BACKOFF_SECONDS, before_retry=None):
+    """
+    Exécute write() et le relance après une erreur transitoire, au plus retries fois,
+    en attendant backoff secondes puis le double à chaque tentative (avec une part
+    aléatoire pour que les threads ne renvoient pas leurs lots au même instant).
+    before_retry(), s'il est fourni, est appelé avant chaque nouvel essai (par exemple
+    pour retirer ce qu'un essai interrompu a déjà écrit).
+    """
+    for attempt in range(retries + 1):
+        try:
+            if attempt and before_retry is not None:
+                before_retry()
+            return write()
+        except PyMongoError as e:
+            if attempt == retries or not _is_transient(e):
+                raise
+            delay = backoff * 2 ** attempt
+            delay += random.uniform(0, delay)
+            logging.warning(f"Lot {batch_number} : erreur transitoire ({type(e).__name__}), "
+                            f"nouvel essai {attempt + 1}/{retries} dans {delay:.1f} s.")
+            time.sleep(delay)
+
+def parallel_writes(write, items, workers=INSERT_WORKERS):
+    """
+    Applique write à chaque élément dans `workers` threads et produit les résultats
+    dans l'ordre d'achèvement. Au plus 2 * workers éléments sont en attente, ce qui
+    borne la mémoire pendant que le thread principal lit la suite de l'entrée.
+    À la première erreur (écriture ou lecture), les écritures non commencées sont
+    annulées, les résultats des écritures en cours sont encore produits (pour le
+    point de reprise), puis l'erreur est propagée.
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        error = None
+        exhausted = False
+        while True:
+            if error is None and not exhausted and len(pending) < 2 * workers:
+                try:
+                    pending.add(executor.submit(write, next(items)))
+                    continue
+                except StopIteration:
+                    exhausted = True
+                except Exception as e:
+                    error = e
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.cancelled():
+                    continue
+                if future.exception() is None:
+                    yield future.result()
+                elif error is None:
+                    error = future.exception()
+            if error is not None:
+                for future in pending:
+                    future.cancel()
+        if error is not None:
+            raise error
+
+class ThroughputLog:
+    """Journalise le débit soutenu toutes les PROGRESS_INTERVAL_SECONDS secondes, puis le débit moyen."""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.start = self.last_report = time.monotonic()
+        self.total = self.since_report = 0
+
+    def add(self, documents):
+        self.total += documents
+        self.since_report += documents
+        now = time.monotonic()
+        if now - self.last_report >= PROGRESS_INTERVAL_SECONDS:
+            logging.info(f"Débit soutenu : {self.since_report / (now - self.last_report):.0f} docs/s "
+                         f"({self.total} documents écrits).")
+            self.last_report, self.since_report = now, 0
+
+    def finish(self):
+        elapsed = time.monotonic() - self.start
+        if self.total:
+            logging.info(f"Débit moyen : {self.total / elapsed:.0f} docs/s sur {elapsed:.2f} s "
+                         f"({self.workers} threads d'écriture).")
+
+# Point de reprise du chargement complet
+
+def input_signature(input_path):
+    """Empreinte de l'entrée (tailles et dates de modification de ses fichiers) : un point de reprise n'est valable que pour la même entrée."""
+    paths = [input_path]
+    if os.path.isdir(input_path):
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(input_path) for name in names)
+    digest = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.relpath(path, input_path)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+def open_checkpoint(input_path, path=CHECKPOINT_PATH):
+    """
+    Charge le point de reprise d'un chargement complet interrompu sur la même entrée
+    (même signature et même BATCH_SIZE, les lots étant numérotés dans l'ordre de lecture).
+    Retourne le point de reprise, dont 'completed' est l'ensemble des lots déjà insérés
+    (vide pour un nouveau chargement).
+    """
+    checkpoint = {'path': path, 'input': os.path.abspath(input_path), 'signature': input_signature(input_path),
+                  'batch_size': BATCH_SIZE, 'completed': set()}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except FileNotFoundError:
+        return checkpoint
+    except (OSError, ValueError):
+        logging.warning(f"Point de reprise '{path}' illisible, ignoré.")
+        return checkpoint
+    if all(saved.get(key) == checkpoint[key] for key in ('input', 'signature', 'batch_size')):
+        checkpoint['completed'] = {number for first, last in saved.get('completed', []) for number in range(first, last + 1)}
+    else:
+        logging.warning(f"Le point de reprise '{path}' concerne une autre entrée, il est ignoré.")
+    return checkpoint
+
+def save_checkpoint(checkpoint):
+    """Écrit le point de reprise (lots insérés regroupés en intervalles) de façon atomique."""
+    ranges = []
+    for number in sorted(checkpoint['completed']):
+        if ranges and ranges[-1][1] == number - 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    data = {key: checkpoint[key] for key in ('input', 'signature', 'batch_size')}
+    data['completed'] = ranges
+    tmp_path = checkpoint['path'] + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, checkpoint['path'])
+
+def clear_checkpoint(checkpoint):
+    if os.path.exists(checkpoint['path']):
+        os.remove(checkpoint['path'])
+
+def _insert_batch(collection, batch, retried=False):
+    """
+    Insère un lot (dictionnaires ou RawBSONDocument) par insert_many non ordonné. Retourne
+    un Counter : documents insérés, doublons de clé (relevés en double) et autres rejets.
+    Avec retried (nouvel essai après une erreur transitoire), les doublons de clé sont
+    comptés comme insérés : ce sont les documents déjà écrits par l'essai interrompu
+    (un relevé en double dans le lot lui-même n'est alors plus distingué).
+    """
+    try:
+        collection.insert_many(batch, ordered=False)
+        return Counter(written=len(batch))
+    except BulkWriteError as e:
+        if e.details.get('writeConcernErrors'):
+            raise
+        # En mode non ordonné, les documents valides du lot sont tout de même insérés
+        errors = e.details.get('writeErrors', [])
+        duplicates = sum(1 for error in errors if error.get('code') == DUPLICATE_KEY_ERROR)
+        counts = Counter(written=e.details.get('nInserted', 0), duplicates=duplicates, rejected=len(errors) - duplicates)
+        if retried:
+            counts['written'] += counts.pop('duplicates')
+        return counts
+
+def _delete_batch_documents(collection, batch):
+    """
+    Supprime les documents portant les clés (station_id, timestamp) d'un lot. Sans index
+    unique (collection time-series), c'est la seule façon de renvoyer un lot dont un essai
+    interrompu a peut-être déjà inséré une partie sans dupliquer ces relevés.
+    """
+    timestamps = {}
+    for document in batch:
+        timestamps.setdefault(document['station_id'], []).append(document['timestamp'])
+    for station_id, station_timestamps in timestamps.items():
+        collection.delete_many({'station_id': station_id, 'timestamp': {'$in': station_timestamps}})
+
+def insert_batches(collection, batches, checkpoint=None, workers=INSERT_WORKERS, timeseries=False):
+    """
+    Insère les lots depuis `workers` threads (insert_many non ordonnés, lots renvoyés
+    après une erreur transitoire) et journalise le débit de chaque lot et le débit soutenu.
+    Un lot renvoyé peut avoir été en partie écrit : sur une collection time-series (sans
+    index unique), ses documents sont d'abord supprimés (voir _delete_batch_documents).
+    Avec un point de reprise, les lots déjà insérés sont sautés et chaque lot terminé y est enregistré.
+    Retourne le nombre total de documents insérés.
+    """
+    completed = checkpoint['completed'] if checkpoint else set()
+    totals = Counter()
+    throughput = ThroughputLog(workers)
+
+    def pending_batches():
+        for batch_number, batch in enumerate(batches, start=1):
+            if batch_number in completed:
+                totals['resumed'] += len(batch)
+            else:
+                yield batch_number, batch
+
+    def write(item):
+        batch_number, batch = item
+        start_batch = time.monotonic()
+        attempts = itertools.count()
+        before_retry = (lambda: _delete_batch_documents(collection, batch)) if timeseries else None
+        with instrumentation.stage('insert_many', rows_in=len(batch)) as metrics:
+            counts = with_retries(lambda: _insert_batch(collection, batch, retried=next(attempts) > 0), batch_number,
+                                  before_retry=before_retry)
+            metrics['rows_out'] = counts['written']
+        return batch_number, counts, time.monotonic() - start_batch
+
+    for batch_number, counts, elapsed in parallel_writes(write, pending_batches(), workers):
+        totals.update(counts)
+        throughput.add(counts['written'])
+        if counts['duplicates'] or counts['rejected']:
+            logging.warning(f"Lot {batch_number} : {counts['duplicates']} doublons de clé et "
+                            f"{counts['rejected']} autres documents rejetés.")
+        rate = counts['written'] / elapsed if elapsed > 0 else float('inf')
+        logging.info(f"Lot {batch_number} : {counts['written']} documents insérés en {elapsed:.2f} s ({rate:.0f} docs/s).")
+        if checkpoint:
+            completed.add(batch_number)
+            save_checkpoint(checkpoint)
+
+    throughput.finish()
+    if totals['duplicates']:
+        # L'index unique ne conserve qu'un relevé par clé, y compris lors d'un chargement complet
+        logging.warning(f"{totals['duplicates']} relevés en double sur (station_id, timestamp) non insérés : "
+                        "un seul relevé est conservé par station et par timestamp.")
+    if totals['rejected']:
+        logging.warning(f"{totals['rejected']} documents rejetés par MongoDB.")
+    if totals['resumed']:
+        logging.info(f"{totals['resumed']} documents déjà insérés avant la reprise ignorés.")
+    return totals['written']
+
+def _parse_timestamp(value):
+    """
+    Convertit un timestamp (datetime ou chaîne ISO 8601) en datetime naïf UTC,
+    ou None s'il est invalide.
+    """
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def normalize_documents(records, skipped):
+    """
+    Garantit que chaque document porte un timestamp de type date BSON.
+    Les enregistrements sans timestamp exploitable sont écartés et comptés dans skipped.
+    """
+    for record in records:
+        timestamp = _parse_timestamp(record.get('timestamp'))
+        if timestamp is None:
+            skipped['timestamp'] += 1
+            continue
+        record['timestamp'] = timestamp
+        yield record
+
+def ensure_indexes(collection, timeseries=False):
+    """
+    Crée les index composés de INDEXES s'ils n'existent pas. Un index existant du même
+    nom mais aux options différentes (ex : ancien index partiel) est supprimé et recréé.
+    Les collections time-series n'acceptant pas d'index unique, l'option y est ignorée.
+    """
+    existing = collection.index_information()
+    for name, keys, options in INDEXES:
+        if timeseries:
+            options = {option: value for option, value in options.items() if option != 'unique'}
+        current = existing.get(name)
+        if current is not None:
+            up_to_date = (
+                list(current['key']) == keys
+                and all(current.get(option) == value for option, value in options.items())
+                and 'partialFilterExpression' not in current
+            )
+            if up_to_date:
+                continue
+            logging.info(f"Index '{name}' obsolète, recréation...")
+            collection.drop_index(name)
+        logging.info(f"Création de l'index '{name}'...")
+        collection.create_index(keys, name=name, **options)
+
+def prepare_collection(db, reset):
+    """
+    Retourne la collection principale et indique si elle est de type time-series.
+    La collection est créée selon COLLECTION_TYPE si elle n'existe pas. Avec reset
+    (chargement complet), elle est vidée, ou supprimée puis recréée si son type doit changer.
+    """
+    want_timeseries = COLLECTION_TYPE == 'timeseries'
+    info = next(db.list_collections(filter={'name': COLLECTION_NAME}), None)
+    is_timeseries = info is not None and info.get('type') == 'timeseries'
+
+    if info is not None and reset:
+        if want_timeseries or is_timeseries:
+            # Une collection time-series se vide plus vite en la recréant
+            logging.info(f"Suppression de la collection '{COLLECTION_NAME}'...")
+            db.drop_collection(COLLECTION_NAME)
+            info = None
+        else:
+            logging.info(f"Nettoyage de la collection '{COLLECTION_NAME}'...")
+            db[COLLECTION_NAME].delete_many({})
+    elif info is not None and is_timeseries != want_timeseries:
+        logging.warning(f"La collection '{COLLECTION_NAME}' n'est pas de type '{COLLECTION_TYPE}' ; "
+                        "le type ne change que lors d'un chargement complet.")
+
+    if info is None:
+        if want_timeseries:
+            logging.info(f"Création de la collection time-series '{COLLECTION_NAME}'...")
+            db.create_collection(COLLECTION_NAME, timeseries=TIMESERIES_OPTIONS)
+        else:
+            db.create_collection(COLLECTION_NAME)
+        is_timeseries = want_timeseries
+    return db[COLLECTION_NAME], is_timeseries
+
+def convert_string_timestamps(collection):
+    """
+    Convertit en dates BSON les timestamps encore stockés en chaînes par d'anciens
+    chargements, puis supprime les documents sans timestamp exploitable.
+    """
+    result = collection.update_many(
+        {'timestamp': {'$type': 'string'}},
+        [{'$set': {'timestamp': {'$dateFromString': {'dateString': '$timestamp', 'onError': None}}}}]
+    )
+    if result.modified_count:
+        logging.info(f"{result.modified_count} timestamps convertis de chaîne en date.")
+    deleted = collection.delete_many({'timestamp': {'$not': {'$type': 'date'}}}).deleted_count
+    if deleted:
+        logging.warning(f"{deleted} documents sans timestamp exploitable supprimés.")
+
+def load_high_water_marks(state_collection):
+    """Retourne le dernier timestamp chargé pour chaque station : {station_id: datetime}."""
+    marks = {}
+    for doc in state_collection.find({'_id': {'$ne': DATA_VERSION_ID}}, {'last_timestamp': 1}):
+        last_timestamp = _parse_timestamp(doc.get('last_timestamp'))
+        if last_timestamp is not None:
+            marks[doc['_id']] = last_timestamp
+    return marks
+
+def save_high_water_marks(state_collection, marks):
+    """Enregistre les derniers timestamps chargés ; une marque existante plus récente est conservée."""
+    for station_id, last_timestamp in marks.items():
+        state_collection.update_one(
+            {'_id': station_id},
+            {'$max': {'last_timestamp': last_timestamp}},
+            upsert=True
+        )
+
+def rebuild_high_water_marks(collection, state_collection):
+    """Recalcule les marques de toutes les stations depuis la collection, après un chargement complet."""
+    state_collection.delete_many({'_id': {'$ne': DATA_VERSION_ID}})
+    marks = {}
+    pipeline = [{'$group': {'_id': '$station_id', 'last_timestamp': {'$max': '$timestamp'}}}]
+    for doc in collection.aggregate(pipeline):
+        last_timestamp = _parse_timestamp(doc.get('last_timestamp'))
+        if doc['_id'] is not None and last_timestamp is not None:
+            marks[doc['_id']] = last_timestamp
+    save_high_water_marks(state_collection, marks)
+    return marks
+
+def publish_data_version(state_collection):
+    """Enregistre une nouvelle version des données chargées et la retourne."""
+    version = uuid.uuid4().hex
+    state_collection.update_one(
+        {'_id': DATA_VERSION_ID},
+        {'$set': {'version': version, 'loaded_at': datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    return version
+
+def _bulk_write_batch(collection, operations):
+    """Envoie les opérations par bulk_write non ordonné ; retourne un Counter (documents écrits, rejetés)."""
+    try:
+        result = collection.bulk_write(operations, ordered=False)
+        return Counter(written=result.inserted_count + result.upserted_count + result.modified_count)
+    except BulkWriteError as e:
+        if e.details.get('writeConcernErrors'):
+            raise
+        written = e.details.get('nInserted', 0) + e.details.get('nUpserted', 0) + e.details.get('nModified', 0)
+        return Counter(written=written, rejected=len(e.details.get('writeErrors', [])))
+
+def upsert_batches(collection, batches, high_water_marks, insert_only=False, periods=None, workers=INSERT_WORKERS):
+    """
+    Envoie en upsert (clé station_id + timestamp) les enregistrements plus récents
+    que la marque de leur station, par bulk_write non ordonnés depuis `workers` threads
+    (lots renvoyés après une erreur transitoire, les upserts étant idempotents). Avec
+    insert_only (collection time-series, sans upsert), ils sont simplement insérés.
+    Si periods est fourni, il reçoit pour chaque station le premier et le dernier
+    timestamp envoyés : {station_id: (début, fin)}.
+    Retourne (nombre de documents écrits, nouvelles marques, True si aucune erreur).
+    """
+    totals = Counter()
+    new_marks = {}
+    throughput = ThroughputLog(workers)
+
+    def operation_batches():
+        # Les marques et les périodes sont calculées dans le thread principal, pendant la lecture
+        for batch_number, batch in enumerate(batches, start=1):
+            operations = []
+            for record in batch:
+                station_id = record.get('station_id')
+                timestamp = _parse_timestamp(record.get('timestamp'))
+                if station_id is None or timestamp is None:
+                    totals['skipped_invalid'] += 1
+                    continue
+                mark = high_water_marks.get(station_id)
+                if mark is not None and timestamp <= mark:
+                    totals['skipped_old'] += 1
+                    continue
+
+                document = dict(record, timestamp=timestamp)
+                if insert_only:
+                    operations.append(InsertOne(document))
+                else:
+                    operations.append(UpdateOne(
+                        {'station_id': station_id, 'timestamp': timestamp},
+                        {'$set': document},
+                        upsert=True
+                    ))
+                if station_id not in new_marks or timestamp > new_marks[station_id]:
+                    new_marks[station_id] = timestamp
+                if periods is not None:
+                    first, last = periods.get(station_id, (timestamp, timestamp))
+                    periods[station_id] = (min(first, timestamp), max(last, timestamp))
+            if operations:
+                yield batch_number, operations
+
+    def write(item):
+        batch_number, operations = item
+        start_batch = time.monotonic()
+        with instrumentation.stage('bulk_write', rows_in=len(operations)) as metrics:
+            counts = with_retries(lambda: _bulk_write_batch(collection, operations), batch_number)
+            metrics['rows_out'] = counts['written']
+        return batch_number, len(operations), counts, time.monotonic() - start_batch
+
+    for batch_number, sent, counts, elapsed in parallel_writes(write, operation_batches(), workers):
+        totals.update(counts)
+        throughput.add(counts['written'])
+        if counts['rejected']:
+            logging.warning(f"Lot {batch_number} : {counts['rejected']} documents rejetés.")
+        rate = sent / elapsed if elapsed > 0 else float('inf')
+        logging.info(f"Lot {batch_number} : {sent} envois ({counts['written']} écrits) en {elapsed:.2f} s ({rate:.0f} docs/s).")
+
+    logging.info(f"{totals['skipped_old']} enregistrements déjà chargés ignorés, "
+                 f"{totals['skipped_invalid']} sans station ou timestamp valide ignorés.")
+    if totals['skipped_old']:
+        logging.warning(f"{totals['skipped_old']} relevés non postérieurs au dernier timestamp chargé de leur station "
+                        "n'ont pas été envoyés (déjà chargés, ou arrivés en retard : seul un chargement complet les charge).")
+    throughput.finish()
+    return totals['written'], new_marks, not totals['rejected']
+
+# Agrégats horaires et journaliers
+
+def _rollup_projection():
+    """Champs des documents d'agrégat, la moyenne étant recalculée à partir de la somme et du nombre."""
+    return {
+        '_id': 0,
+        'station_id': '$_id.station_id',
+        'period_start': '$_id.period_start',
+        'station_name': 1,
+        'readings': 1,
+        'temperature_min': 1,
+        'temperature_max': 1,
+        'temperature_mean': {'$cond': [
+            {'$gt': ['$temperature_count', 0]},
+            {'$divide': ['$temperature_sum', '$temperature_count']},
+            None
+        ]},
+        'temperature_sum': 1,
+        'temperature_count': 1,
+        'precip_total': 1,
+        'precip_accum_max': 1,
+        'gust_max': 1,
+    }
+
+def _merge_stage(collection_name):
+    return {'$merge': {'into': collection_name, 'on': [field for field, _ in ROLLUP_KEY],
+                       'whenMatched': 'replace', 'whenNotMatched': 'insert'}}
+
+def _first_number(*fields):
+    """Expression donnant la valeur du premier champ numérique parmi fields (null sinon)."""
+    expression = None
+    for field in reversed(fields):
+        expression = {'$cond': [{'$isNumber': field}, field, expression]}
+    return expression
+
+def _sum_or_null(sum_field, count_field):
+    """Somme, ou null si aucune valeur numérique n'a été additionnée ($sum donnerait 0)."""
+    return {'$cond': [{'$gt': [count_field, 0]}, sum_field, None]}
+
+def rainfall_stages():
+    """
+    Étapes ajoutant à chaque relevé la pluie tombée depuis le relevé précédent ('rain') :
+    pluie_1h pour Infoclimat ; pour les stations, l'augmentation de precip_accum, cumul
+    remis à zéro chaque jour, depuis le relevé précédent de la station, ou le cumul entier
+    au premier relevé du jour et après une remise à zéro. Les relevés sans cumul reprennent
+    la dernière valeur connue ($locf), pour que la pluie tombée pendant un relevé vide ou
+    entre deux heures soit comptée au relevé suivant.
+    """
+    accum = _first_number('$precip_accum')
+    same_day = {'$eq': [{'$dateTrunc': {'date': '$timestamp', 'unit': 'day'}},
+                        {'$dateTrunc': {'date': '$_previous_timestamp', 'unit': 'day'}}]}
+    return [
+        {'$setWindowFields': {
+            'partitionBy': '$station_id', 'sortBy': {'timestamp': 1},
+            'output': {'_accum': {'$locf': accum}},
+        }},
+        {'$setWindowFields': {
+            'partitionBy': '$station_id', 'sortBy': {'timestamp': 1},
+            'output': {'_previous_accum': {'$shift': {'output': '$_accum', 'by': -1}},
+                       '_previous_timestamp': {'$shift': {'output': '$timestamp', 'by': -1}}},
+        }},
+        {'$set': {'rain': {'$cond': [
+            {'$isNumber': '$pluie_1h'}, '$pluie_1h',
+            {'$cond': [
+                {'$not': [{'$isNumber': accum}]}, None,
+                {'$cond': [
+                    {'$and': [{'$isNumber': '$_previous_accum'}, same_day,
+                              {'$gte': ['$precip_accum', '$_previous_accum']}]},
+                    {'$subtract': ['$precip_accum', '$_previous_accum']},
+                    '$precip_accum',
+                ]},
+            ]},
+        ]}}},
+    ]
+
+def hourly_rollup_pipeline(match):
+    """
+    Agrège les relevés bruts par station et par heure puis fusionne le résultat dans
+    HOURLY_COLLECTION_NAME. La pluie de l'heure est la somme de la pluie de ses relevés
+    (voir rainfall_stages) et la rafale maximale porte sur gust (stations) ou
+    vent_rafales (Infoclimat).
+    """
+    return [
+        {'$match': match},
+        *rainfall_stages(),
+        {'$group': {
+            '_id': {'station_id': '$station_id',
+                    'period_start': {'$dateTrunc': {'date': '$timestamp', 'unit': 'hour'}}},
+            'station_name': {'$first': '$station_name'},
+            'readings': {'$sum': 1},
+            'temperature_min': {'$min': '$temperature'},
+            'temperature_max': {'$max': '$temperature'},
+            'temperature_sum': {'$sum': '$temperature'},
+            'temperature_count': {'$sum': {'$cond': [{'$isNumber': '$temperature'}, 1, 0]}},
+            'precip_sum': {'$sum': '$rain'},
+            'precip_count': {'$sum': {'$cond': [{'$isNumber': '$rain'}, 1, 0]}},
+            'precip_accum_max': {'$max': _first_number('$precip_accum')},
+            'gust_max': {'$max': _first_number('$gust', '$vent_rafales')},
+        }},
+        {'$set': {'precip_total': _sum_or_null('$precip_sum', '$precip_count')}},
+        {'$project': _rollup_projection()},
+        _merge_stage(HOURLY_COLLECTION_NAME),
+    ]
+
+def daily_rollup_pipeline(match):
+    """
+    Agrège les agrégats horaires par station et par jour puis fusionne le résultat dans
+    DAILY_COLLECTION_NAME. La pluie du jour est la somme de la pluie de ses heures.
+    """
+    return [
+        {'$match': match},
+        {'$group': {
+            '_id': {'station_id': '$station_id',
+                    'period_start': {'$dateTrunc': {'date': '$period_start', 'unit': 'day'}}},
+            'station_name': {'$first': '$station_name'},
+            'readings': {'$sum': '$readings'},
+            'temperature_min': {'$min': '$temperature_min'},
+            'temperature_max': {'$max': '$temperature_max'},
+            'temperature_sum': {'$sum': '$temperature_sum'},
+            'temperature_count': {'$sum': '$temperature_count'},
+            'precip_sum': {'$sum': '$precip_total'},
+            'precip_count': {'$sum': {'$cond': [{'$isNumber': '$precip_total'}, 1, 0]}},
+            'precip_accum_max': {'$max': '$precip_accum_max'},
+            'gust_max': {'$max': '$gust_max'},
+        }},
+        {'$set': {'precip_total': _sum_or_null('$precip_sum', '$precip_count')}},
+        {'$project': _rollup_projection()},
+        _merge_stage(DAILY_COLLECTION_NAME),
+    ]
+
+def _touched_days(periods, time_field):
+    """Filtre couvrant, pour chaque station, les journées entières entre son premier et son dernier relevé chargé."""
+    clauses = []
+    for station_id, (first, last) in periods.items():
+        start = first.replace(hour=0, minute=0, second=0, microsecond=0)
+        end = last.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        clauses.append({'station_id': station_id, time_field: {'$gte': start, '$lt': end}})
+    return {'$or': clauses}
+
+def build_rollups(db, collection, periods=None):
+    """
+    Met à jour les agrégats horaires (depuis les relevés bruts) puis journaliers
+    (depuis les agrégats horaires). Sans periods, tout l'historique est recalculé
+    après avoir vidé les collections d'agrégats ; sinon seules les journées touchées
+    par le chargement sont recalculées, ce qui rend l'opération idempotente.
+    """
+    if periods is not None and not periods:
+        logging.info("Aucun nouveau relevé : agrégats inchangés.")
+        return
+    for name in (HOURLY_COLLECTION_NAME, DAILY_COLLECTION_NAME):
+        if periods is None:
+            db[name].delete_many({})
+        db[name].create_index(ROLLUP_KEY, name='station_id_period_start_unique', unique=True)
+
+    start = time.monotonic()
+    raw_match = {} if periods is None else _touched_days(periods, 'timestamp')
+    with instrumentation.stage('hourly_rollup'):
+        # Les fenêtres de rainfall_stages trient tous les relevés de chaque station
+        collection.aggregate(hourly_rollup_pipeline(raw_match), allowDiskUse=True)
+    hourly_match = {} if periods is None else _touched_days(periods, 'period_start')
+    with instrumentation.stage('daily_rollup'):
+        db[HOURLY_COLLECTION_NAME].aggregate(daily_rollup_pipeline(hourly_match), allowDiskUse=True)
+    logging.info(f"Agrégats horaires et journaliers mis à jour en {time.monotonic() - start:.2f} s "
+                 f"({len(periods) if periods is not None else 'toutes les'} stations).")
+
+def json_output_is_delta(json_path):
+    """Indique si le fichier JSON est le delta d'une transformation incrémentale (voir TRANSFORM_MANIFEST_FILENAME)."""
+    manifest_path = os.path.join(os.path.dirname(json_path), TRANSFORM_MANIFEST_FILENAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('delta') is True
+    except (OSError, json.JSONDecodeError, AttributeError):
+        return False
 
 def migrate_to_mongodb():
     """
-    Lit les données depuis un fichier JSON et les insère dans une collection MongoDB.
-    La collection est vidée avant l'insertion pour éviter les doublons.
+    Lit les données depuis un fichier JSON (ou le dataset Parquet si PARQUET_DATASET_PATH
+    est défini) et les insère dans une collection MongoDB.
+    L'entrée est lue en flux et insérée par lots de BATCH_SIZE documents, la mémoire
+    utilisée reste donc constante quelle que soit la taille des données.
+    En mode 'full', la collection est vidée avant l'insertion pour éviter les doublons ;
+    un chargement complet interrompu reprend au premier lot non inséré (CHECKPOINT_PATH).
+    En mode 'incremental', seuls les relevés plus récents que le dernier chargement de
+    chaque station sont envoyés, en upsert sur la clé (station_id, timestamp) : un relevé
+    arrivé en retard, antérieur à cette marque, n'est chargé que par un chargement complet.
+    Un fichier JSON produit par une transformation incrémentale (delta) est toujours
+    chargé en mode 'incremental' : vider la collection n'y laisserait que le delta.
+    Les timestamps sont toujours stockés en dates BSON et les index de INDEXES sont maintenus.
+    Avec BUILD_ROLLUPS, les agrégats horaires et journaliers sont mis à jour après le chargement.
     """
     logging.info("Démarrage de la migration vers MongoDB")
+    mode = MIGRATION_MODE
+    if mode != 'incremental' and not PARQUET_DATASET_PATH and json_output_is_delta(JSON_FILE_PATH):
+        logging.warning(f"'{JSON_FILE_PATH}' ne contient que les relevés d'une transformation incrémentale : "
+                        "chargement en mode incrémental au lieu d'un remplacement de la collection.")
+        mode = 'incremental'
 
     # Vérification de l'existence du fichier JSON
-    if not os.path.exists(JSON_FILE_PATH):
-        logging.error(f"Le fichier JSON '{JSON_FILE_PATH}' n'a pas été trouvé.")
+    skipped = Counter()
+    if PARQUET_DATASET_PATH:
+        input_path, input_label = PARQUET_DATASET_PATH, "dataset Parquet"
+        if BSON_ENCODING == 'raw' and mode != 'incremental':
+            # Documents encodés en BSON colonne par colonne depuis les lots Arrow
+            documents = iter_parquet_bson_documents(PARQUET_DATASET_PATH, skipped, BATCH_SIZE)
+        else:
+            documents = normalize_documents(iter_parquet_records(PARQUET_DATASET_PATH, BATCH_SIZE), skipped)
+    else:
+        input_path, input_label = JSON_FILE_PATH, "fichier JSON"
+        documents = normalize_documents(iter_json_records(JSON_FILE_PATH), skipped)
+
+    if not os.path.exists(input_path):
+        logging.error(f"Le {input_label} '{input_path}' n'a pas été trouvé.")
         logging.error("Veuillez d'abord exécuter le script 'transformation_parquet.py'.")
         return
 
-    # Lecture des données JSON
+    # Lecture du premier lot pour valider le fichier avant de toucher à la base
+    # Le temps de lecture, de parsing et d'encodage est mesuré séparément du temps d'écriture dans MongoDB
+    batches = instrumentation.timed_iter('read_input', iter_batches(documents, BATCH_SIZE),
+                                         count=len, bytes_read=instrumentation.path_size(input_path))
     try:
-        with open(JSON_FILE_PATH, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        logging.info(f"{len(data)} enregistrements chargés depuis le fichier JSON.")
+        first_batch = next(batches, None)
     except json.JSONDecodeError:
-        logging.error(f"Le fichier '{JSON_FILE_PATH}' contient un JSON invalide.", exc_info=True)
+        logging.error(f"Le fichier '{input_path}' contient un JSON invalide.", exc_info=True)
+        return
+    except pa.ArrowInvalid:
+        logging.error(f"Le dataset '{input_path}' contient des fichiers Parquet invalides.", exc_info=True)
         return
     except Exception as e:
-        logging.error(f"Erreur inattendue lors de la lecture du fichier JSON.", exc_info=True)
+        logging.error(f"Erreur inattendue lors de la lecture du {input_label}.", exc_info=True)
         return
 
-    if not data:
-        logging.warning("Le fichier JSON est vide. Aucune donnée à migrer.")
+    if not first_batch:
+        logging.warning(f"Le {input_label} est vide. Aucune donnée à migrer.")
         return
 
     # Connexion à MongoDB
@@ -60,17 +1091,72 @@ def migrate_to_mongodb():
         logging.info("Connexion à MongoDB réussie.")
         
         db = client[DB_NAME]
-        collection = db[COLLECTION_NAME]
 
-        # Vider la collection pour éviter les doublons lors de ré-exécutions
-        logging.info(f"Nettoyage de la collection '{COLLECTION_NAME}'...")
-        collection.delete_many({})
-        
-        # Insertion des données
-        logging.info("Insertion des données dans MongoDB...")
-        result = collection.insert_many(data)
-        logging.info(f"{len(result.inserted_ids)} documents insérés avec succès.")
+        state_collection = db[STATE_COLLECTION_NAME]
+        all_batches = itertools.chain([first_batch], batches)
+
+        if mode == 'incremental':
+            logging.info("Mode incrémental : envoi des nouveaux relevés uniquement.")
+            with instrumentation.stage('prepare_collection'):
+                collection, is_timeseries = prepare_collection(db, reset=False)
+                if not is_timeseries:
+                    convert_string_timestamps(collection)
+                ensure_indexes(collection, timeseries=is_timeseries)
+            collection = collection.with_options(write_concern=write_concern())
+            high_water_marks = load_high_water_marks(state_collection)
+            periods = {}
+            written, new_marks, success = upsert_batches(collection, all_batches, high_water_marks,
+                                                         insert_only=is_timeseries, periods=periods)
+            if success:
+                save_high_water_marks(state_collection, new_marks)
+            elif is_timeseries:
+                # Les insertions n'étant pas idempotentes, renvoyer le lot dupliquerait les relevés écrits
+                save_high_water_marks(state_collection, new_marks)
+                logging.warning("Des erreurs d'écriture sont survenues, les relevés rejetés ne seront pas renvoyés.")
+            else:
+                # Les upserts étant idempotents, le prochain chargement renverra ces relevés
+                logging.warning("Des erreurs d'écriture sont survenues, les marques de chargement ne sont pas avancées.")
+            logging.info(f"{written} documents insérés ou mis à jour avec succès.")
+        else:
+            checkpoint = open_checkpoint(input_path)
+            # Vider la collection pour éviter les doublons lors de ré-exécutions,
+            # sauf à la reprise d'un chargement interrompu
+            with instrumentation.stage('prepare_collection'):
+                collection, is_timeseries = prepare_collection(db, reset=not checkpoint['completed'])
+                if checkpoint['completed'] and is_timeseries:
+                    # Sans index unique, les lots en cours lors de l'interruption (peut-être en partie
+                    # insérés) seraient dupliqués par la reprise
+                    logging.warning("Reprise impossible sur une collection time-series : chargement complet.")
+                    checkpoint['completed'] = set()
+                    collection, is_timeseries = prepare_collection(db, reset=True)
+                elif checkpoint['completed']:
+                    logging.info(f"Reprise du chargement interrompu : {len(checkpoint['completed'])} lots déjà insérés.")
+                ensure_indexes(collection, timeseries=is_timeseries)
+            collection = collection.with_options(write_concern=write_concern())
 
+            # Insertion des données par lots
+            logging.info(f"Insertion des données dans MongoDB par lots de {BATCH_SIZE} documents "
+                         f"({INSERT_WORKERS} threads d'écriture)...")
+            inserted = insert_batches(collection, all_batches, checkpoint, timeseries=is_timeseries)
+            clear_checkpoint(checkpoint)
+            logging.info(f"{inserted} documents insérés avec succès.")
+            with instrumentation.stage('rebuild_high_water_marks'):
+                rebuild_high_water_marks(collection, state_collection)
+            periods = None
+
+        if BUILD_ROLLUPS:
+            build_rollups(db, collection, periods)
+        if periods is None or periods:
+            version = publish_data_version(state_collection)
+            logging.info(f"Version des données publiée : {version}.")
+
+        if skipped['timestamp']:
+            logging.warning(f"{skipped['timestamp']} enregistrements sans timestamp valide ignorés.")
+
+    except json.JSONDecodeError:
+        logging.error(f"Le fichier '{input_path}' contient un JSON invalide.", exc_info=True)
+    except pa.ArrowInvalid:
+        logging.error(f"Le dataset '{input_path}' contient des fichiers Parquet invalides.", exc_info=True)
     except ConnectionFailure:
         logging.error(f"Impossible de se connecter à MongoDB. Vérifiez que le service est bien en cours d'exécution sur {MONGO_URI}", exc_info=True)
     except OperationFailure as e:
@@ -83,4 +1169,5 @@ def migrate_to_mongodb():
             logging.info("Connexion à MongoDB fermée.")
 
 if __name__ == '__main__':
-    migrate_to_mongodb()
+    with instrumentation.run('migration'):
+        migrate_to_mongodb()
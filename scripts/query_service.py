@@ -0,0 +1,224 @@
+"""
+Service de requêtes asynchrone devant la collection weather_stations.
+
+Les requêtes courantes des data scientists (relevés d'une station sur une période,
+résumés journaliers et horaires lus dans les agrégats de la migration) passent par
+un client Motor unique, dont le pool de connexions est partagé par toutes les
+coroutines, et par un cache LRU en mémoire dont les entrées expirent après
+QUERY_CACHE_TTL secondes.
+
+Le cache est invalidé quand la migration charge de nouvelles données : chaque
+chargement écrit un jeton de version des données dans la collection d'état
+(document DATA_VERSION_ID de migration_state), relu au plus toutes les
+DATA_VERSION_CHECK_INTERVAL secondes.
+
+Les résultats mis en cache sont partagés entre les appelants : ils ne doivent pas
+être modifiés.
+
+Exemple :
+    python scripts/query_service.py station_range IICHTE19 2024-10-01 2024-10-02
+    python scripts/query_service.py daily_summary IICHTE19 2024-10-01 2024-11-01
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+# Configuration du Logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()
+    ]
+)
+
+# Configuration de la Connexion
+MONGO_URI = os.environ.get('MONGO_URI', "mongodb://localhost:27017/")
+DB_NAME = os.environ.get('DB_NAME', "greenandcoop")
+COLLECTION_NAME = os.environ.get('COLLECTION_NAME', "weather_stations")
+# Agrégats horaires et journaliers construits par migrate_to_mongodb.py
+HOURLY_COLLECTION_NAME = os.environ.get('HOURLY_COLLECTION_NAME', "weather_hourly")
+DAILY_COLLECTION_NAME = os.environ.get('DAILY_COLLECTION_NAME', "weather_daily")
+# Collection d'état de la migration et document portant la version des données chargées
+STATE_COLLECTION_NAME = os.environ.get('STATE_COLLECTION_NAME', "migration_state")
+DATA_VERSION_ID = '_data_version'
+
+# Connexions simultanées maximales du pool partagé
+QUERY_POOL_SIZE = int(os.environ.get('QUERY_POOL_SIZE', 20))
+# Nombre de résultats conservés (0 pour désactiver le cache) et durée de vie en secondes
+QUERY_CACHE_SIZE = int(os.environ.get('QUERY_CACHE_SIZE', 1024))
+QUERY_CACHE_TTL = float(os.environ.get('QUERY_CACHE_TTL', 300))
+# Intervalle minimal entre deux lectures du jeton de version des données
+DATA_VERSION_CHECK_INTERVAL = float(os.environ.get('DATA_VERSION_CHECK_INTERVAL', 5))
+
+# Champs de calcul internes des agrégats, non renvoyés
+ROLLUP_PROJECTION = {'_id': 0, 'temperature_sum': 0, 'temperature_count': 0}
+
+_MISSING = object()
+
+class TTLCache:
+    """Cache LRU de taille bornée dont les entrées expirent après ttl secondes."""
+
+    def __init__(self, max_entries=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # clé -> (date d'expiration, valeur)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=_MISSING):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > self.clock():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self._entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (self.clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+class QueryService:
+    """
+    Requêtes typées sur les relevés et leurs agrégats. Les appels simultanés portant
+    sur les mêmes paramètres partagent une seule requête MongoDB (sauf avec coalesce=False).
+    """
+
+    def __init__(self, uri=MONGO_URI, db_name=DB_NAME, client=None, cache=None,
+                 version_check_interval=DATA_VERSION_CHECK_INTERVAL, coalesce=True):
+        if client is None:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            client = AsyncIOMotorClient(uri, maxPoolSize=QUERY_POOL_SIZE, serverSelectionTimeoutMS=5000)
+        self.client = client
+        self.db = client[db_name]
+        self.cache = cache if cache is not None else TTLCache()
+        self.version_check_interval = version_check_interval
+        self.data_version = _MISSING
+        self._next_version_check = float('-inf')
+        # Incrémentée à chaque invalidation : un résultat lu avant ne doit pas être mis en cache
+        self._generation = 0
+        self.coalesce = coalesce
+        # Requêtes partagées en cours, par (génération, clé) : un appel suivant une invalidation
+        # ne rejoint pas une requête lancée avant elle
+        self._pending = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.client.close()
+
+    def invalidate(self):
+        """Vide le cache ; les requêtes en cours ne seront ni mises en cache ni partagées avec les appels suivants."""
+        self.cache.clear()
+        self._generation += 1
+
+    async def check_data_version(self, force=False):
+        """Relit le jeton de version des données (au plus une fois par intervalle) et vide le cache s'il a changé."""
+        now = time.monotonic()
+        if not force and now < self._next_version_check:
+            return
+        self._next_version_check = now + self.version_check_interval
+        doc = await self.db[STATE_COLLECTION_NAME].find_one({'_id': DATA_VERSION_ID}, {'version': 1})
+        version = doc.get('version') if doc else None
+        if version != self.data_version:
+            if self.data_version is not _MISSING:
+                logging.info(f"Nouvelles données chargées (version {version}) : cache des requêtes vidé.")
+            self.invalidate()
+            self.data_version = version
+
+    async def _cached(self, key, fetch):
+        await self.check_data_version()
+        result = self.cache.get(key)
+        if result is not _MISSING:
+            return result
+        if not self.coalesce:
+            return await self._fetch(key, fetch)
+        pending_key = (self._generation, key)
+        task = self._pending.get(pending_key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key, fetch))
+            self._pending[pending_key] = task
+            task.add_done_callback(lambda _: self._pending.pop(pending_key, None))
+        # Annuler un appelant ne doit pas annuler la requête partagée avec les autres
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key, fetch):
+        generation = self._generation
+        result = await fetch()
+        if generation == self._generation:
+            self.cache.put(key, result)
+        return result
+
+    async def _find(self, collection_name, query, projection, sort_field):
+        cursor = self.db[collection_name].find(query, projection).sort(sort_field, 1)
+        return await cursor.to_list(length=None)
+
+    async def get_station_range(self, station_id: str, start: datetime, end: datetime) -> list:
+        """Relevés bruts d'une station entre start (inclus) et end (exclu), triés par timestamp."""
+        query = {'station_id': station_id, 'timestamp': {'$gte': start, '$lt': end}}
+        return await self._cached(('station_range', station_id, start, end),
+                                  lambda: self._find(COLLECTION_NAME, query, {'_id': 0}, 'timestamp'))
+
+    async def get_daily_summary(self, station_id: str, start: datetime, end: datetime) -> list:
+        """Résumés journaliers d'une station (température min/max/moyenne, pluie, rafale max, nombre de relevés)."""
+        query = {'station_id': station_id, 'period_start': {'$gte': start, '$lt': end}}
+        return await self._cached(('daily_summary', station_id, start, end),
+                                  lambda: self._find(DAILY_COLLECTION_NAME, query, ROLLUP_PROJECTION, 'period_start'))
+
+    async def get_hourly_summary(self, station_id: str, start: datetime, end: datetime) -> list:
+        """Résumés horaires d'une station, mêmes champs que get_daily_summary."""
+        query = {'station_id': station_id, 'period_start': {'$gte': start, '$lt': end}}
+        return await self._cached(('hourly_summary', station_id, start, end),
+                                  lambda: self._find(HOURLY_COLLECTION_NAME, query, ROLLUP_PROJECTION, 'period_start'))
+
+QUERIES = {
+    'station_range': QueryService.get_station_range,
+    'daily_summary': QueryService.get_daily_summary,
+    'hourly_summary': QueryService.get_hourly_summary,
+}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('query', choices=list(QUERIES))
+    parser.add_argument('station_id')
+    parser.add_argument('start', type=datetime.fromisoformat)
+    parser.add_argument('end', type=datetime.fromisoformat)
+    parser.add_argument('--uri', default=MONGO_URI, help="URI MongoDB (défaut : $MONGO_URI)")
+    return parser.parse_args(argv)
+
+async def _run_query(args):
+    async with QueryService(args.uri) as service:
+        return await QUERIES[args.query](service, args.station_id, args.start, args.end)
+
+def main(argv=None):
+    args = parse_args(argv)
+    for document in asyncio.run(_run_query(args)):
+        print(json.dumps(document, default=str, ensure_ascii=False))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
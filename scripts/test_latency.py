@@ -1,7 +1,30 @@
+"""
+Benchmark de latence de la collection weather_stations.
+
+Exécute un mélange configurable de requêtes représentatives (lecture ponctuelle,
+journée d'une station, mois de plusieurs stations, résumés horaires et journaliers
+calculés sur les relevés bruts ou lus dans les collections d'agrégats), à froid
+puis à chaud, avec plusieurs requêtes simultanées, et rapporte p50/p95/p99 et débit.
+
+Exemples :
+    python scripts/test_latency.py --uri mongodb://localhost:27017/ --iterations 200 --concurrency 8
+    python scripts/test_latency.py --mock --seed-file transformed_data/data_for_mongodb.json --output-json bench.json
+    python scripts/test_latency.py --uri mongodb://localhost:27017/ --workloads aggregation daily_rollup hourly_aggregation hourly_rollup
+    python scripts/test_latency.py --uri mongodb://localhost:27017/ --check-plans
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
 import time
 import logging
+import pyarrow as pa
+import pyarrow.dataset as ds
+from concurrent.futures import ThreadPoolExecutor
 from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+from pymongo.errors import ConnectionFailure, OperationFailure
 from datetime import datetime, timedelta
 
 # Configuration du Logging
@@ -9,80 +32,400 @@ logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.StreamHandler() 
+        logging.StreamHandler()
     ]
 )
 
-# Configuration de la Connexion 
-MONGO_URI = "mongodb://13.60.208.12:27017/"
-DB_NAME = "greenandcoop"
-COLLECTION_NAME = "weather_stations"
+# Configuration de la Connexion
+MONGO_URI = os.environ.get('MONGO_URI', "mongodb://13.60.208.12:27017/")
+DB_NAME = os.environ.get('DB_NAME', "greenandcoop")
+COLLECTION_NAME = os.environ.get('COLLECTION_NAME', "weather_stations")
+# Agrégats horaires et journaliers construits par migrate_to_mongodb.py
+HOURLY_COLLECTION_NAME = os.environ.get('HOURLY_COLLECTION_NAME', "weather_hourly")
+DAILY_COLLECTION_NAME = os.environ.get('DAILY_COLLECTION_NAME', "weather_daily")
 
-def test_database_latency():
+# Dataset Parquet produit par transformation_parquet.py ; s'il est défini,
+# les paramètres des requêtes y sont tirés sans interroger la base
+PARQUET_DATASET_PATH = os.environ.get('PARQUET_DATASET_PATH')
+PARQUET_PARTITIONING = ds.partitioning(
+    pa.schema([('station_id', pa.string()), ('month', pa.string())]), flavor='hive'
+)
+
+# Nombre de couples (station, timestamp) tirés pour paramétrer les requêtes
+SAMPLE_SIZE = 200
+# Nombre de stations interrogées par la requête multi-stations
+MULTI_STATION_COUNT = 3
+
+# Requêtes du benchmark
+# Chaque requête est décrite par un dictionnaire ('filter' pour un find, 'pipeline'
+# pour une agrégation, 'collection' si elle ne vise pas la collection brute) afin de
+# pouvoir être exécutée comme expliquée (--check-plans).
+
+def _day_bounds(timestamp):
+    start = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    return start, start + timedelta(days=1)
+
+def _month_bounds(timestamp):
+    start = timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+def build_point_lookup(sample, samples):
+    """Lecture d'un relevé précis : station + timestamp exact."""
+    return {"filter": {"station_id": sample["station_id"], "timestamp": sample["timestamp"]}, "limit": 1}
+
+def build_station_day(sample, samples):
+    """Tous les relevés d'une station sur une journée (requête historique de ce script)."""
+    start_date, end_date = _day_bounds(sample["timestamp"])
+    return {"filter": {
+        "station_name": sample["station_name"],
+        "timestamp": {"$gte": start_date, "$lt": end_date}
+    }}
+
+def build_multi_station_month(sample, samples):
+    """Tous les relevés de plusieurs stations sur le mois du relevé tiré."""
+    stations = sorted({s["station_id"] for s in samples})
+    random.shuffle(stations)
+    station_ids = list({sample["station_id"], *stations[:MULTI_STATION_COUNT - 1]})
+    start, end = _month_bounds(sample["timestamp"])
+    return {"filter": {
+        "station_id": {"$in": station_ids},
+        "timestamp": {"$gte": start, "$lt": end}
+    }}
+
+def _raw_summary_pipeline(sample, bounds, period_format):
+    """Résumé par période (min/max/moyenne de température, pluie, rafale max) calculé sur les relevés bruts."""
+    start, end = bounds(sample["timestamp"])
+    return [
+        {"$match": {
+            "station_id": sample["station_id"],
+            "timestamp": {"$gte": start, "$lt": end}
+        }},
+        {"$group": {
+            "_id": {"$dateToString": {"format": period_format, "date": "$timestamp"}},
+            "temperature_min": {"$min": "$temperature"},
+            "temperature_max": {"$max": "$temperature"},
+            "temperature_mean": {"$avg": "$temperature"},
+            # Pluie : cumul journalier des stations (precip_accum) et pluie horaire d'Infoclimat (pluie_1h)
+            "precip_accum_max": {"$max": "$precip_accum"},
+            "rain_1h_total": {"$sum": "$pluie_1h"},
+            "gust_max": {"$max": {"$ifNull": ["$gust", "$vent_rafales"]}},
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+
+def _rollup_find(collection_name, sample, bounds):
+    start, end = bounds(sample["timestamp"])
+    return {
+        "collection": collection_name,
+        "filter": {"station_id": sample["station_id"], "period_start": {"$gte": start, "$lt": end}},
+        "sort": [("period_start", 1)],
+    }
+
+def build_daily_aggregation(sample, samples):
+    """Résumé journalier d'une station sur un mois, agrégé depuis les relevés bruts."""
+    return {"pipeline": _raw_summary_pipeline(sample, _month_bounds, "%Y-%m-%d")}
+
+def build_daily_rollup(sample, samples):
+    """Même résumé journalier, lu dans la collection d'agrégats journaliers."""
+    return _rollup_find(DAILY_COLLECTION_NAME, sample, _month_bounds)
+
+def build_hourly_aggregation(sample, samples):
+    """Résumé horaire d'une station sur une journée, agrégé depuis les relevés bruts."""
+    return {"pipeline": _raw_summary_pipeline(sample, _day_bounds, "%Y-%m-%dT%H")}
+
+def build_hourly_rollup(sample, samples):
+    """Même résumé horaire, lu dans la collection d'agrégats horaires."""
+    return _rollup_find(HOURLY_COLLECTION_NAME, sample, _day_bounds)
+
+WORKLOADS = {
+    'point': build_point_lookup,
+    'station_day': build_station_day,
+    'multi_station_month': build_multi_station_month,
+    'aggregation': build_daily_aggregation,
+    'daily_rollup': build_daily_rollup,
+    'hourly_aggregation': build_hourly_aggregation,
+    'hourly_rollup': build_hourly_rollup,
+}
+
+def _target(collection, query):
+    return collection.database[query["collection"]] if "collection" in query else collection
+
+def execute_query(collection, query):
+    """Exécute une requête décrite par un builder et retourne le nombre de documents lus."""
+    collection = _target(collection, query)
+    if "pipeline" in query:
+        return len(list(collection.aggregate(query["pipeline"])))
+    return len(list(collection.find(query["filter"], sort=query.get("sort"), limit=query.get("limit", 0))))
+
+def explain_query(collection, query):
+    """Retourne le plan choisi par le serveur pour une requête (verbosité queryPlanner)."""
+    collection = _target(collection, query)
+    if "pipeline" in query:
+        return collection.database.command(
+            'explain',
+            {'aggregate': collection.name, 'pipeline': query["pipeline"], 'cursor': {}},
+            verbosity='queryPlanner'
+        )
+    return collection.find(query["filter"], sort=query.get("sort"), limit=query.get("limit", 0)).explain()
+
+def plan_stages(explain_output):
+    """Liste les étapes de tous les 'winningPlan' d'une sortie d'explain, à toute profondeur."""
+    stages = []
+
+    def collect(node, in_plan):
+        if isinstance(node, dict):
+            if in_plan and 'stage' in node:
+                stages.append(node['stage'])
+            for key, value in node.items():
+                collect(value, in_plan or key == 'winningPlan')
+        elif isinstance(node, list):
+            for item in node:
+                collect(item, in_plan)
+
+    collect(explain_output, False)
+    return stages
+
+def check_query_plans(collection, workloads, samples):
+    """
+    Explique une requête de chaque type et signale celles dont le plan contient un COLLSCAN.
+    Retourne la liste des types de requêtes fautifs.
+    """
+    failing = []
+    for workload in workloads:
+        query = WORKLOADS[workload](random.choice(samples), samples)
+        stages = plan_stages(explain_query(collection, query))
+        if 'COLLSCAN' in stages or not stages:
+            logging.error(f"{workload} : plan sans index ({' > '.join(stages) or 'plan introuvable'}).")
+            failing.append(workload)
+        else:
+            logging.info(f"{workload} : {' > '.join(stages)}")
+    return failing
+
+# Paramètres des requêtes
+
+def sample_parameters_from_parquet(dataset_path, size=SAMPLE_SIZE):
+    """Tire des couples (station, timestamp) du dataset Parquet en ne lisant que les colonnes utiles."""
+    dataset = ds.dataset(dataset_path, format='parquet', partitioning=PARQUET_PARTITIONING)
+    table = dataset.to_table(columns=['station_id', 'station_name', 'timestamp'],
+                             filter=ds.field('timestamp').is_valid())
+    rows = table.to_pylist()
+    return random.sample(rows, min(size, len(rows)))
+
+def sample_parameters_from_db(collection, size=SAMPLE_SIZE):
+    """Tire des couples (station, timestamp) de la collection."""
+    pipeline = [
+        {"$match": {"timestamp": {"$ne": None}, "station_id": {"$ne": None}}},
+        {"$sample": {"size": size}},
+        {"$project": {"_id": 0, "station_id": 1, "station_name": 1, "timestamp": 1}},
+    ]
+    return list(collection.aggregate(pipeline))
+
+def normalize_samples(samples):
+    """
+    Ne conserve que les tirages dont le timestamp est une date. La migration stocke les
+    timestamps en dates BSON ; le dataset Parquet les fournit déjà en datetime.
+    """
+    return [s for s in samples if isinstance(s.get("timestamp"), datetime)]
+
+# Mesures
+
+def percentile(sorted_values, p):
+    """Percentile par la méthode du rang le plus proche sur une liste triée."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(p / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def summarize(workload, phase, latencies_ms, documents, wall_time, concurrency):
+    """Calcule les statistiques d'une série de mesures."""
+    ordered = sorted(latencies_ms)
+    return {
+        "workload": workload,
+        "phase": phase,
+        "concurrency": concurrency,
+        "iterations": len(ordered),
+        "documents_mean": sum(documents) / len(documents) if documents else 0,
+        "p50_ms": percentile(ordered, 50),
+        "p95_ms": percentile(ordered, 95),
+        "p99_ms": percentile(ordered, 99),
+        "min_ms": ordered[0] if ordered else None,
+        "max_ms": ordered[-1] if ordered else None,
+        "throughput_qps": len(ordered) / wall_time if wall_time > 0 else None,
+    }
+
+def _timed_call(collection, query):
+    start = time.perf_counter()
+    documents = execute_query(collection, query)
+    return (time.perf_counter() - start) * 1000, documents
+
+def run_cold(make_client, workload, samples, iterations):
+    """
+    Mesures à froid : nouvelle connexion et cache de plans vidé avant chaque requête.
+    Le cache de pages du serveur n'est pas vidé, ces mesures restent donc optimistes.
+    """
+    build = WORKLOADS[workload]
+    latencies, documents = [], []
+    wall_start = time.perf_counter()
+    for _ in range(iterations):
+        client = make_client()
+        try:
+            db = client[DB_NAME]
+            try:
+                db.command({"planCacheClear": COLLECTION_NAME})
+            except (OperationFailure, NotImplementedError):
+                pass
+            latency, n_docs = _timed_call(db[COLLECTION_NAME], build(random.choice(samples), samples))
+        finally:
+            client.close()
+        latencies.append(latency)
+        documents.append(n_docs)
+    return summarize(workload, "cold", latencies, documents, time.perf_counter() - wall_start, 1)
+
+def run_warm(collection, workload, samples, iterations, warmup, concurrency):
+    """Mesures à chaud : connexion partagée, itérations de chauffe ignorées, requêtes simultanées."""
+    build = WORKLOADS[workload]
+    for _ in range(warmup):
+        execute_query(collection, build(random.choice(samples), samples))
+
+    queries = [build(random.choice(samples), samples) for _ in range(iterations)]
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda q: _timed_call(collection, q), queries))
+    wall_time = time.perf_counter() - wall_start
+    return summarize(workload, "warm", [r[0] for r in results], [r[1] for r in results], wall_time, concurrency)
+
+def run_benchmark(collection, make_client, workloads, samples,
+                  iterations, warmup, cold_iterations, concurrency):
+    """Exécute chaque requête à froid puis à chaud et retourne la liste des résultats."""
+    results = []
+    for workload in workloads:
+        if cold_iterations:
+            results.append(run_cold(make_client, workload, samples, cold_iterations))
+        results.append(run_warm(collection, workload, samples, iterations, warmup, concurrency))
+    return results
+
+def _format_stat(value, precision, width=10):
+    """Statistique alignée à droite, ou '-' si elle n'a pas pu être calculée (aucune mesure)."""
+    return f"{'-':>{width}}" if value is None else f"{value:>{width}.{precision}f}"
+
+def log_results(results):
+    logging.info("--- Résultats du Benchmark ---")
+    logging.info(f"{'requête':<22}{'phase':<6}{'conc.':>6}{'n':>6}{'docs':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+    for r in results:
+        logging.info(f"{r['workload']:<22}{r['phase']:<6}{r['concurrency']:>6}{r['iterations']:>6}{r['documents_mean']:>8.0f}"
+                     f"{_format_stat(r['p50_ms'], 2)}{_format_stat(r['p95_ms'], 2)}"
+                     f"{_format_stat(r['p99_ms'], 2)}{_format_stat(r['throughput_qps'], 1)}")
+
+def write_reports(results, run_info, json_path=None, csv_path=None):
+    """Sauvegarde les résultats en JSON (avec les paramètres du run) et/ou en CSV pour comparer les exécutions."""
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump({"run": run_info, "results": results}, f, indent=4, default=str)
+        logging.info(f"Résultats sauvegardés dans {json_path}")
+    if csv_path:
+        new_file = not os.path.exists(csv_path)
+        with open(csv_path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=["started_at", "label", *results[0].keys()])
+            if new_file:
+                writer.writeheader()
+            for r in results:
+                writer.writerow({"started_at": run_info["started_at"], "label": run_info["label"], **r})
+        logging.info(f"Résultats ajoutés à {csv_path}")
+
+# Point d'entrée
+
+def _mock_client_factory(seed_file):
+    """Crée une base mongomock alimentée depuis un fichier JSON (tableau ou JSON Lines)."""
+    import mongomock
+
+    client = mongomock.MongoClient()
+    if seed_file:
+        with open(seed_file, 'r', encoding='utf-8') as f:
+            documents = [json.loads(line) for line in f if line.strip()] if seed_file.endswith('.jsonl') else json.load(f)
+        # Même conversion que la migration : timestamps en dates
+        for document in documents:
+            if isinstance(document.get('timestamp'), str):
+                document['timestamp'] = datetime.fromisoformat(document['timestamp'].replace('Z', '+00:00'))
+        client[DB_NAME][COLLECTION_NAME].insert_many(documents)
+        logging.info(f"{len(documents)} documents chargés dans la base mongomock.")
+    # Une seule instance : une nouvelle connexion mongomock serait une base vide
+    client.close = lambda: None
+    return lambda: client
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', default=MONGO_URI, help="URI MongoDB (défaut : $MONGO_URI)")
+    parser.add_argument('--workloads', nargs='+', choices=list(WORKLOADS), default=list(WORKLOADS))
+    parser.add_argument('--iterations', type=int, default=100, help="requêtes mesurées à chaud par type")
+    parser.add_argument('--warmup', type=int, default=10, help="requêtes de chauffe ignorées par type")
+    parser.add_argument('--cold-iterations', type=int, default=5, help="requêtes mesurées à froid par type (0 pour ignorer)")
+    parser.add_argument('--concurrency', type=int, default=4, help="requêtes simultanées à chaud")
+    parser.add_argument('--seed', type=int, default=42, help="graine du tirage des paramètres")
+    parser.add_argument('--label', default='', help="libellé du run dans les rapports")
+    parser.add_argument('--output-json', help="fichier JSON de résultats")
+    parser.add_argument('--output-csv', help="fichier CSV auquel ajouter les résultats")
+    parser.add_argument('--mock', action='store_true', help="utiliser mongomock au lieu d'un serveur MongoDB")
+    parser.add_argument('--seed-file', help="données à charger dans la base mongomock")
+    parser.add_argument('--check-plans', action='store_true',
+                        help="expliquer chaque requête au lieu de la mesurer ; code de sortie 1 si un plan fait un COLLSCAN")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """
-    Se connecte à la base de données, trouve une date valide,
-    puis exécute une requête de test et mesure le temps d'exécution.
+    Lance le benchmark (ou la vérification des plans avec --check-plans).
+    Retourne les résultats, ou None en cas d'échec.
     """
-    logging.info(f"Tentative de connexion à la base de données sur : {MONGO_URI}")
+    args = parse_args(argv)
+    random.seed(args.seed)
+
+    if args.mock:
+        make_client = _mock_client_factory(args.seed_file)
+    else:
+        make_client = lambda: MongoClient(args.uri, serverSelectionTimeoutMS=5000)
+
+    logging.info(f"Tentative de connexion à la base de données sur : {'mongomock' if args.mock else args.uri}")
     client = None
     try:
-        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+        client = make_client()
         client.admin.command('ping')
         logging.info("Connexion à MongoDB réussie.")
-        
-        db = client[DB_NAME]
-        collection = db[COLLECTION_NAME]
-
-        # Trouver une date valide
-        logging.info("Recherche d'un document avec un timestamp valide...")
-        station_to_find = "La Madeleine"
-        sample_document = collection.find_one({
-            "station_name": station_to_find,
-            "timestamp": {"$ne": None} 
-        })
-
-        if not sample_document or "timestamp" not in sample_document:
-            logging.error(f"Impossible de trouver un document de test avec un timestamp valide pour la station '{station_to_find}'.")
-            return
-
-        timestamp_from_db = sample_document["timestamp"]
-        valid_date_obj = None
-
-        if isinstance(timestamp_from_db, datetime):
-            logging.debug("Le timestamp est déjà un objet datetime, utilisation directe.")
-            valid_date_obj = timestamp_from_db
-        elif isinstance(timestamp_from_db, str):
-            logging.debug("Le timestamp est une chaîne de caractères, conversion...")
-            valid_date_obj = datetime.fromisoformat(timestamp_from_db)
+        collection = client[DB_NAME][COLLECTION_NAME]
+
+        if PARQUET_DATASET_PATH:
+            logging.info(f"Tirage des paramètres dans le dataset Parquet {PARQUET_DATASET_PATH}...")
+            samples = sample_parameters_from_parquet(PARQUET_DATASET_PATH)
         else:
-            logging.error(f"Format de timestamp non supporté : {type(timestamp_from_db)}")
-            return
-
-        start_date = valid_date_obj.replace(hour=0, minute=0, second=0, microsecond=0)
-        end_date = start_date + timedelta(days=1)
-        
-        logging.info(f"Date valide trouvée. Test sur la journée du {start_date.strftime('%Y-%m-%d')}")
-
-        # Exécuter la requête de performance
-        query = {
-            "station_name": station_to_find,
-            "timestamp": {
-                "$gte": start_date if isinstance(timestamp_from_db, datetime) else start_date.isoformat(),
-                "$lt": end_date if isinstance(timestamp_from_db, datetime) else end_date.isoformat()
-            }
-        }
+            logging.info("Tirage des paramètres dans la collection...")
+            samples = sample_parameters_from_db(collection)
+        samples = normalize_samples(samples)
+        if not samples:
+            logging.error("Impossible de trouver des documents de test avec un timestamp valide.")
+            return None
 
-        logging.info(f"Exécution de la requête de test pour la station '{station_to_find}'...")
-        
-        start_time = time.monotonic()
-        documents = list(collection.find(query))
-        end_time = time.monotonic()
+        if args.check_plans:
+            failing = check_query_plans(collection, args.workloads, samples)
+            if failing:
+                logging.error(f"Requêtes sans index : {', '.join(failing)}")
+                return None
+            logging.info("Toutes les requêtes du benchmark utilisent un index.")
+            return []
 
-        duration_ms = (end_time - start_time) * 1000
-        
-        logging.info("--- Résultats du Test ---")
-        logging.info(f"Nombre de documents trouvés : {len(documents)}")
-        logging.info(f"Temps d'exécution de la requête : {duration_ms:.2f} ms")
+        run_info = {
+            "started_at": datetime.now().isoformat(timespec='seconds'),
+            "label": args.label,
+            "target": "mongomock" if args.mock else args.uri.rsplit('@', 1)[-1],
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "cold_iterations": args.cold_iterations,
+            "concurrency": args.concurrency,
+            "samples": len(samples),
+        }
+        results = run_benchmark(collection, make_client, args.workloads, samples,
+                                args.iterations, args.warmup, args.cold_iterations, args.concurrency)
+        log_results(results)
+        write_reports(results, run_info, args.output_json, args.output_csv)
+        return results
 
     except ConnectionFailure as e:
         logging.error("Impossible de se connecter à MongoDB.", exc_info=True)
@@ -92,6 +435,15 @@ def test_database_latency():
         if client:
             client.close()
             logging.info("Connexion à MongoDB fermée.")
+    return None
+
+def test_database_latency():
+    """
+    Mesure ponctuelle historique : une requête 'journée d'une station' à chaud, sans chauffe.
+    Conservée pour compatibilité ; utiliser main() pour un benchmark complet.
+    """
+    main(['--workloads', 'station_day', '--iterations', '1', '--warmup', '0',
+          '--cold-iterations', '0', '--concurrency', '1'])
 
 if __name__ == '__main__':
-    test_database_latency()
+    sys.exit(0 if main() is not None else 1)
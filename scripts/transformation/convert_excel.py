@@ -1,8 +1,14 @@
 import pandas as pd
 import os
-import json
+import sys
 from datetime import datetime
 import logging
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+# Module d'instrumentation partagé (scripts/instrumentation.py)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import instrumentation
 
 # Configuration du logging
 logging.basicConfig(
@@ -14,16 +20,77 @@ logging.basicConfig(
     ]
 )
 
+# Nombre de classeurs convertis en parallèle (un processus par classeur)
+MAX_WORKERS = int(os.environ.get('EXCEL_MAX_WORKERS', os.cpu_count() or 1))
+
+def _excel_engine():
+    """Utilise le moteur calamine (Rust) s'il est installé, sinon le moteur par défaut de pandas."""
+    try:
+        import python_calamine  # noqa: F401
+        return 'calamine'
+    except ImportError:
+        return None
+
+def convert_sheet(df_sheet, sheet_date, skipped=None):
+    """
+    Remplace la colonne 'Time' d'une feuille par une colonne 'timestamp' ISO 8601
+    combinant la date de la feuille et l'heure de chaque ligne, en une seule opération.
+    Les lignes sans heure valide ont un timestamp nul ; celles dont l'heure est présente
+    mais illisible sont journalisées et comptées dans skipped['time'].
+    """
+    if 'Time' not in df_sheet.columns:
+        return df_sheet
+    # Les heures arrivent en datetime.time : leur représentation 'HH:MM:SS' est une durée
+    time_of_day = pd.to_timedelta(df_sheet['Time'].astype(str), errors='coerce')
+    unparsed = int((time_of_day.isna() & df_sheet['Time'].notna()).sum())
+    if unparsed:
+        logging.warning(f"{unparsed} heures illisibles dans la feuille du {sheet_date:%d/%m/%Y} : timestamps nuls.")
+        if skipped is not None:
+            skipped['time'] += unparsed
+    timestamps = pd.Timestamp(sheet_date) + time_of_day
+    return df_sheet.drop(columns=['Time']).assign(timestamp=timestamps.dt.strftime('%Y-%m-%dT%H:%M:%S'))
+
+def convert_workbook(file_path, output_filepath):
+    """
+    Convertit toutes les feuilles d'un classeur (une feuille par date, format DDMMYY)
+    et les écrit au fil de l'eau dans un fichier JSON Lines.
+    Retourne le nombre d'enregistrements écrits.
+    """
+    logging.info(f"Traitement du fichier : {os.path.basename(file_path)}...")
+    sheets = pd.read_excel(file_path, sheet_name=None, engine=_excel_engine())
+
+    records_written = 0
+    skipped = Counter()
+    with open(output_filepath, 'w', encoding='utf-8') as f:
+        for sheet_name, df_sheet in sheets.items():
+            try:
+                # Parse la date depuis le nom de la feuille (format DDMMYY)
+                sheet_date = datetime.strptime(sheet_name, '%d%m%y').date()
+                df_sheet = convert_sheet(df_sheet, sheet_date, skipped)
+                if df_sheet.empty:
+                    continue
+                f.write(df_sheet.to_json(orient='records', lines=True, force_ascii=False, date_format='iso').rstrip('\n') + '\n')
+                records_written += len(df_sheet)
+            except Exception as e:
+                logging.error(f"Erreur lors du traitement de la feuille '{sheet_name}'.", exc_info=True)
+
+    logging.info(f"{records_written} enregistrements sauvegardés dans : {os.path.basename(output_filepath)}")
+    if skipped['time']:
+        logging.warning(f"{skipped['time']} enregistrements de {os.path.basename(file_path)} sans heure valide (timestamp nul).")
+    return records_written
+
 def convert_excel_to_json():
     """
     Lit les fichiers Excel spécifiés, traite chaque feuille comme une date distincte,
-    et sauvegarde les données consolidées dans des fichiers JSON correspondants.
+    et sauvegarde les données consolidées dans des fichiers JSON Lines correspondants.
+    Les classeurs sont convertis en parallèle dans des processus séparés.
     """
     logging.info("Démarrage de la conversion Excel vers JSON")
 
     excel_files = ["ichtegem_weather.xlsx", "la_madeleine_weather.xlsx"]
     output_path = '.' # Sauvegarde dans le répertoire courant
 
+    jobs = []
     for filename in excel_files:
         file_path = os.path.join(output_path, filename)
         
@@ -31,46 +98,25 @@ def convert_excel_to_json():
             logging.warning(f"Fichier {filename} non trouvé. Il est ignoré.")
             continue
 
-        logging.info(f"Traitement du fichier : {filename}...")
-        
-        all_records_for_file = []
-        xls = pd.ExcelFile(file_path)
-        
-        for sheet_name in xls.sheet_names:
-            try:
-                # Parse la date depuis le nom de la feuille (format DDMMYY)
-                sheet_date = datetime.strptime(sheet_name, '%d%m%y').date()
-                
-                df_sheet = pd.read_excel(xls, sheet_name=sheet_name)
-                
-                for _, row in df_sheet.iterrows():
-                    record = row.to_dict()
-                    
-                    # Combine la date de la feuille et l'heure de la ligne
-                    if 'Time' in record and hasattr(record['Time'], 'hour'):
-                        record_time = record['Time']
-                        # Crée un timestamp complet et le convertit en format string ISO
-                        full_timestamp = datetime.combine(sheet_date, record_time)
-                        record['timestamp'] = full_timestamp.isoformat()
-                        
-                        # Supprime l'ancien champ 'Time' qui est un objet non sérialisable
-                        del record['Time']
-                    
-                    all_records_for_file.append(record)
+        output_filename = os.path.splitext(filename)[0] + '.jsonl'
+        jobs.append((file_path, os.path.join(output_path, output_filename)))
 
-            except Exception as e:
-                logging.error(f"Erreur lors du traitement de la feuille '{sheet_name}'.", exc_info=True)
-        
-        # Sauvegarde du fichier JSON correspondant
-        output_filename = os.path.splitext(filename)[0] + '.json'
-        output_filepath = os.path.join(output_path, output_filename)
-        
-        logging.info(f"Sauvegarde des données dans : {output_filename}...")
-        with open(output_filepath, 'w', encoding='utf-8') as f:
-            json.dump(all_records_for_file, f, indent=4, ensure_ascii=False)
+    if jobs:
+        # Les classeurs sont convertis dans des processus fils : l'étape est mesurée ici
+        with instrumentation.stage('convert_workbooks', files=len(jobs)), \
+                ProcessPoolExecutor(max_workers=min(MAX_WORKERS, len(jobs))) as executor:
+            futures = {executor.submit(convert_workbook, *job): job for job in jobs}
+            for future, (file_path, output_filepath) in futures.items():
+                try:
+                    instrumentation.record(rows_out=future.result(),
+                                           bytes_read=instrumentation.path_size(file_path),
+                                           bytes_written=instrumentation.path_size(output_filepath))
+                except Exception as e:
+                    logging.error(f"Erreur lors de la conversion du fichier '{file_path}'.", exc_info=True)
 
     logging.info("Conversion terminée.")
 
 
 if __name__ == '__main__':
-    convert_excel_to_json()
\ No newline at end of file
+    with instrumentation.run('convert_excel'):
+        convert_excel_to_json()
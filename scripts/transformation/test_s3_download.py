@@ -0,0 +1,71 @@
+"""
+Vérifie le cache de téléchargement de download_from_s3_securise contre un S3 simulé
+par moto : une deuxième exécution sur un préfixe inchangé n'envoie aucun GET, seul un
+objet modifié est téléchargé à nouveau, et un téléchargement interrompu ne laisse
+aucun fichier partiel dans le dossier lu par la transformation.
+
+Usage : python scripts/transformation/test_s3_download.py (ou python -m pytest)
+"""
+import os
+import sys
+import tempfile
+
+import boto3
+import pandas as pd
+from moto import mock_aws
+
+import transformation_parquet as tp
+
+BUCKET = 'bucket-test-stations'
+PREFIX = 'data_stations/ichtegem_weather/'
+OBJECTS = 5
+
+def _put_parquet(s3_client, key, value):
+    """Dépose un petit fichier Parquet dans le bucket simulé."""
+    with tempfile.NamedTemporaryFile(suffix='.parquet') as f:
+        pd.DataFrame({'temperature': [value]}).to_parquet(f.name)
+        s3_client.upload_file(f.name, BUCKET, key)
+
+def _download(s3_client, local_dir):
+    """Télécharge le préfixe et retourne le nombre de GET envoyés à S3."""
+    gets = []
+    handler = lambda **kwargs: gets.append(kwargs.get('params'))
+    s3_client.meta.events.register('before-call.s3.GetObject', handler)
+    try:
+        assert tp.download_from_s3_securise(BUCKET, PREFIX, local_dir, extensions_autorisees=['.parquet'],
+                                            s3_client=s3_client, max_workers=4)
+    finally:
+        s3_client.meta.events.unregister('before-call.s3.GetObject', handler)
+    return len(gets)
+
+def test_unchanged_objects_are_not_downloaded_again():
+    with mock_aws(), tempfile.TemporaryDirectory() as local_dir:
+        s3_client = boto3.client('s3', region_name='us-east-1')
+        s3_client.create_bucket(Bucket=BUCKET)
+        keys = [f"{PREFIX}part-{index}.parquet" for index in range(OBJECTS)]
+        for index, key in enumerate(keys):
+            _put_parquet(s3_client, key, float(index))
+        source_dir = os.path.join(local_dir, 'ichtegem_weather')
+
+        assert _download(s3_client, local_dir) == OBJECTS
+        assert _download(s3_client, local_dir) == 0
+
+        # Seul l'objet modifié est téléchargé à nouveau
+        _put_parquet(s3_client, keys[0], 100.0)
+        assert _download(s3_client, local_dir) == 1
+        assert pd.read_parquet(os.path.join(source_dir, 'part-0.parquet'))['temperature'].tolist() == [100.0]
+
+        # Restes d'une exécution interrompue : fichier en cours de téléchargement et ancien '.part'
+        temp_dir = os.path.join(local_dir, tp.DOWNLOAD_TEMP_DIRNAME, 'ichtegem_weather')
+        for path in [os.path.join(temp_dir, 'part-1.parquet.part'), os.path.join(source_dir, 'part-2.parquet.part')]:
+            with open(path, 'wb') as f:
+                f.write(b'PAR1 partiel')
+        assert _download(s3_client, local_dir) == 0
+        assert not [name for name in os.listdir(source_dir) if name.endswith('.part')]
+        assert os.listdir(temp_dir) == []
+        assert len(pd.read_parquet(source_dir)) == OBJECTS
+
+if __name__ == '__main__':
+    test_unchanged_objects_are_not_downloaded_again()
+    print("OK")
+    sys.exit(0)
@@ -1,11 +1,30 @@
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 import json
 import os
+import functools
+import hashlib
+import multiprocessing
+import numbers
 import boto3
+from botocore.config import Config
 from botocore.exceptions import NoCredentialsError, PartialCredentialsError, ClientError
-from datetime import datetime
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
 import shutil
+import sys
+import tempfile
+import uuid
 import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+# Module d'instrumentation partagé (scripts/instrumentation.py)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import instrumentation
 
 # Configuration du logging
 logging.basicConfig(
@@ -24,6 +43,75 @@ S3_PREFIX_ICHTEGEM_WEATHER = 'data_stations/ichtegem_weather/'
 S3_PREFIX_LA_MADELEINE_WEATHER = 'data_stations/la_madeleine_weather/'
 LOCAL_DOWNLOAD_PATH = 'temp_data'
 TRANSFORMED_OUTPUT_PATH = 'transformed_data'
+# Sortie Parquet partitionnée par station et par mois (station_id=.../month=AAAA-MM/)
+PARQUET_OUTPUT_PATH = os.path.join(TRANSFORMED_OUTPUT_PATH, 'parquet')
+PARQUET_PARTITIONING = ds.partitioning(
+    pa.schema([('station_id', pa.string()), ('month', pa.string())]), flavor='hive'
+)
+# Nombre de téléchargements S3 simultanés
+S3_MAX_WORKERS = int(os.environ.get('S3_MAX_WORKERS', 8))
+# Sources traitées simultanément (un thread par source : téléchargement puis attente de sa transformation)
+SOURCE_MAX_WORKERS = int(os.environ.get('SOURCE_MAX_WORKERS', 4))
+# Processus de transformation (lecture et aplatissement des sources) ; 0 : dans les threads des sources
+TRANSFORM_MAX_WORKERS = int(os.environ.get('TRANSFORM_MAX_WORKERS', os.cpu_count() or 1))
+# Manifeste des objets déjà téléchargés (ignoré par pd.read_parquet grâce au préfixe '_')
+DOWNLOAD_MANIFEST_FILENAME = '_download_manifest.json'
+# Téléchargements en cours (LOCAL_DOWNLOAD_PATH/_partial/<source>/), hors du dossier de la
+# source lu comme un dataset : un téléchargement interrompu n'y laisse aucun fichier partiel
+DOWNLOAD_TEMP_DIRNAME = '_partial'
+
+# Mode de transformation : 'full' retraite tout l'historique, 'incremental' ne transforme
+# que les fichiers sources absents du manifeste des fichiers déjà transformés et ajoute
+# leurs sorties au dataset Parquet existant
+TRANSFORM_MODE = os.environ.get('TRANSFORM_MODE', 'full')
+# Manifeste des fichiers sources déjà transformés : {'files': {clé S3: signature (ETag, taille, date)},
+# 'delta': True si data_for_mongodb.json ne contient que les relevés de la dernière exécution incrémentale}
+TRANSFORM_MANIFEST_FILENAME = '_transform_manifest.json'
+# Schéma commun des fichiers du dataset Parquet, tenu à jour par le mode incrémental
+# (ignoré par les lecteurs de dataset grâce au préfixe '_')
+COMMON_METADATA_FILENAME = '_common_metadata'
+
+# Représentation compacte (optionnelle) : métadonnées et direction du vent en catégories,
+# mesures en float32. Activée avec COMPACT_DTYPES=1.
+COMPACT_DTYPES = os.environ.get('COMPACT_DTYPES', '0') == '1'
+CATEGORICAL_COLUMNS = ['station_id', 'station_name', 'city', 'state', 'hardware', 'software', 'wind']
+MEASURE_COLUMNS = [
+    'dew_point', 'precip_rate', 'precip_accum', 'speed', 'gust', 'pressure', 'uv',
+    'humidity', 'solar', 'temperature'
+]
+
+# Conversion des unités vers le Système international : unité -> (facteur, décalage)
+# Les valeurs déjà numériques (sans unité) ne sont jamais converties.
+SI_CONVERSIONS = {
+    '°F': (5 / 9, -32 * 5 / 9),  # °C
+    'mph': (0.44704, 0.0),       # m/s
+    'in': (25.4, 0.0),           # mm (précipitations)
+}
+# Conversions propres à une colonne : la pression est donnée en pouces de mercure
+SI_COLUMN_CONVERSIONS = {
+    'pressure': {'in': (33.8639, 0.0)},  # hPa
+}
+# Nettoyage des mesures : conversion dans le Système international (NORMALIZE_UNITS=1) et
+# type des colonnes de mesures (MEASURE_DTYPE=float32 pour diviser leur taille par deux ;
+# les exports restent en float64)
+NORMALIZE_UNITS = os.environ.get('NORMALIZE_UNITS', '0') == '1'
+MEASURE_DTYPE = np.dtype(os.environ.get('MEASURE_DTYPE', 'float64'))
+
+# Mode streaming : les sources sont transformées par lots d'au plus STREAMING_BATCH_ROWS
+# lignes Parquet, la mémoire restant bornée par la taille d'un lot (0 : tout en mémoire)
+STREAMING_BATCH_ROWS = int(os.environ.get('STREAMING_BATCH_ROWS', 0))
+
+# Clé d'un relevé pour le test de doublons de test_data_quality
+QUALITY_KEY_COLUMNS = ['station_id', 'timestamp']
+# Rapport de qualité des données finales, écrit à côté des sorties
+QUALITY_REPORT_FILENAME = 'quality_report.json'
+
+# Préfixe S3 des données de chaque station de STATION_METADATA ; ajouter une station
+# revient à compléter les deux dictionnaires. L'ordre est celui de la concaténation.
+STATION_S3_PREFIXES = {
+    "IICHTE19": S3_PREFIX_ICHTEGEM_WEATHER,
+    "ILAMAD25": S3_PREFIX_LA_MADELEINE_WEATHER,
+}
 
 # Métadonnées des stations fournies
 STATION_METADATA = {
@@ -53,9 +141,121 @@ STATION_METADATA = {
 
 # Fonctions de Pipeline
 
-def download_from_s3_securise(bucket_name, s3_prefix, local_dir, extensions_autorisees=None):
+def _object_signature(obj):
+    """Signature d'un objet S3 utilisée pour détecter les modifications."""
+    return {
+        'etag': obj['ETag'].strip('"'),
+        'size': obj['Size'],
+        'last_modified': obj['LastModified'].isoformat()
+    }
+
+def load_download_manifest(source_local_dir):
+    """Charge le manifeste des fichiers déjà téléchargés : {clé S3: signature}."""
+    manifest_path = os.path.join(source_local_dir, DOWNLOAD_MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError):
+        logging.warning(f"Manifeste {manifest_path} illisible, tous les fichiers seront téléchargés.")
+        return {}
+
+def save_download_manifest(source_local_dir, manifest):
+    """Sauvegarde le manifeste de façon atomique."""
+    _write_json_atomic(os.path.join(source_local_dir, DOWNLOAD_MANIFEST_FILENAME), manifest)
+
+def _write_json_atomic(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+def load_transform_manifest(output_dir=TRANSFORMED_OUTPUT_PATH):
+    """
+    Charge le manifeste des fichiers sources déjà transformés : {clé S3: signature}.
+    Retourne None s'il n'existe pas ou est illisible (une transformation complète est alors nécessaire).
+    """
+    manifest_path = os.path.join(output_dir, TRANSFORM_MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (json.JSONDecodeError, OSError):
+        logging.warning(f"Manifeste {manifest_path} illisible, l'historique sera entièrement retraité.")
+        return None
+    # Ancien format : {clé S3: signature}
+    return manifest['files'] if isinstance(manifest.get('files'), dict) else manifest
+
+def save_transform_manifest(manifest, output_dir=TRANSFORMED_OUTPUT_PATH, delta=False):
+    """
+    Sauvegarde le manifeste des fichiers transformés de façon atomique. delta indique que
+    data_for_mongodb.json ne contient que les nouveaux relevés (à charger avec
+    MIGRATION_MODE=incremental) : la migration complète ne l'utilise alors pas pour
+    remplacer la collection.
+    """
+    _write_json_atomic(os.path.join(output_dir, TRANSFORM_MANIFEST_FILENAME), {'files': manifest, 'delta': delta})
+
+def list_source_files(download_path, source_names):
+    """
+    Fichiers sources présents dans le cache local, d'après les manifestes de téléchargement :
+    {clé S3: {'source': dossier de la source, 'path': fichier local, 'signature': signature}}.
+    """
+    files = {}
+    for source_name in source_names:
+        source_local_dir = os.path.join(download_path, source_name)
+        for s3_key, signature in load_download_manifest(source_local_dir).items():
+            local_path = os.path.join(source_local_dir, os.path.basename(s3_key))
+            if os.path.exists(local_path):
+                files[s3_key] = {'source': source_name, 'path': local_path, 'signature': signature}
+    return files
+
+def files_to_transform(files, processed):
+    """
+    Clés S3 des fichiers sources pas encore transformés. Retourne None si un fichier
+    déjà transformé a été modifié ou supprimé dans S3 : ses lignes ne pouvant pas être
+    retirées des sorties, l'historique doit être entièrement retraité.
+    """
+    for s3_key, signature in processed.items():
+        if s3_key not in files:
+            logging.warning(f"{s3_key} a été transformé mais n'existe plus dans S3.")
+            return None
+        if files[s3_key]['signature'] != signature:
+            logging.warning(f"{s3_key} a été modifié dans S3 depuis sa transformation.")
+            return None
+    return sorted(s3_key for s3_key in files if s3_key not in processed)
+
+def _download_object(s3_client, bucket_name, s3_key, local_file_path, temp_dir):
+    """
+    Télécharge un objet dans temp_dir puis le renomme dans le dossier de la source, pour
+    ne jamais laisser de fichier partiel parmi les fichiers Parquet lus par la transformation.
+    """
+    tmp_path = os.path.join(temp_dir, os.path.basename(local_file_path) + '.part')
+    s3_client.download_file(bucket_name, s3_key, tmp_path)
+    os.replace(tmp_path, local_file_path)
+
+def _reset_download_temp_dir(source_local_dir, temp_dir):
+    """
+    Vide le dossier des téléchargements en cours d'une source, qui ne contient que les
+    fichiers partiels d'une exécution interrompue, et retire les fichiers '.part' que les
+    versions précédentes laissaient dans le dossier de la source.
+    """
+    if os.path.exists(temp_dir):
+        shutil.rmtree(temp_dir)
+    os.makedirs(temp_dir)
+    for file_name in os.listdir(source_local_dir):
+        if file_name.endswith('.part'):
+            logging.info(f"Suppression du téléchargement interrompu {file_name}...")
+            os.remove(os.path.join(source_local_dir, file_name))
+
+def download_from_s3_securise(bucket_name, s3_prefix, local_dir, extensions_autorisees=None,
+                              s3_client=None, max_workers=S3_MAX_WORKERS):
     """
     Télécharge les fichiers depuis S3 dans un sous-dossier local spécifique au préfixe.
+    Les téléchargements sont effectués en parallèle sur un pool de threads partageant
+    un même client, et les objets inchangés depuis le dernier téléchargement
+    (même ETag, taille et date de modification) sont ignorés.
     """
     source_name = s3_prefix.strip('/').split('/')[-1]
     source_local_dir = os.path.join(local_dir, source_name)
@@ -64,12 +264,19 @@ def download_from_s3_securise(bucket_name, s3_prefix, local_dir, extensions_auto
     
     if not os.path.exists(source_local_dir):
         os.makedirs(source_local_dir)
+    temp_dir = os.path.join(local_dir, DOWNLOAD_TEMP_DIRNAME, source_name)
+    _reset_download_temp_dir(source_local_dir, temp_dir)
 
+    manifest = load_download_manifest(source_local_dir)
+    new_manifest = {}
     try:
-        s3_client = boto3.client('s3')
+        if s3_client is None:
+            # Le pool de connexions doit être au moins aussi grand que le pool de threads
+            s3_client = boto3.client('s3', config=Config(max_pool_connections=max_workers))
         paginator = s3_client.get_paginator('list_objects_v2')
         pages = paginator.paginate(Bucket=bucket_name, Prefix=s3_prefix)
 
+        to_download = []
         for page in pages:
             if "Contents" not in page: continue
             for obj in page["Contents"]:
@@ -79,9 +286,42 @@ def download_from_s3_securise(bucket_name, s3_prefix, local_dir, extensions_auto
                     continue
 
                 local_file_path = os.path.join(source_local_dir, os.path.basename(s3_key))
-                logging.info(f"Téléchargement de {s3_key} vers {local_file_path}...")
-                s3_client.download_file(bucket_name, s3_key, local_file_path)
-        
+                signature = _object_signature(obj)
+                if manifest.get(s3_key) == signature and os.path.exists(local_file_path):
+                    new_manifest[s3_key] = signature
+                    continue
+                to_download.append((s3_key, local_file_path, signature))
+
+        # Suppression des fichiers locaux dont l'objet S3 n'existe plus
+        for s3_key in set(manifest) - set(new_manifest) - {key for key, _, _ in to_download}:
+            stale_path = os.path.join(source_local_dir, os.path.basename(s3_key))
+            if os.path.exists(stale_path):
+                logging.info(f"Suppression de {stale_path} (objet absent de S3)...")
+                os.remove(stale_path)
+
+        logging.info(f"{len(new_manifest)} fichiers inchangés ignorés, {len(to_download)} fichiers à télécharger.")
+        errors = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(_download_object, s3_client, bucket_name, s3_key, local_file_path, temp_dir): (s3_key, local_file_path, signature)
+                for s3_key, local_file_path, signature in to_download
+            }
+            for future in as_completed(futures):
+                s3_key, local_file_path, signature = futures[future]
+                try:
+                    future.result()
+                    new_manifest[s3_key] = signature
+                    instrumentation.record(files=1, bytes_read=os.path.getsize(local_file_path))
+                    logging.info(f"Téléchargement de {s3_key} terminé.")
+                except Exception:
+                    errors += 1
+                    logging.error(f"Échec du téléchargement de {s3_key}.", exc_info=True)
+
+        save_download_manifest(source_local_dir, new_manifest)
+        if errors:
+            logging.error(f"{errors} fichiers n'ont pas pu être téléchargés pour '{source_name}'.")
+            return False
+
         logging.info(f"Téléchargement pour '{source_name}' terminé")
         return True
 
@@ -95,134 +335,501 @@ def download_from_s3_securise(bucket_name, s3_prefix, local_dir, extensions_auto
         logging.error(f"Une erreur est survenue lors du téléchargement.", exc_info=True)
         return False
 
-def transform_station_parquet(data_path, station_meta):
+def transform_station_parquet(data_path, station_meta, compact=False):
     """
     Transforme les fichiers Parquet d'une station, en aplatissant les colonnes objet
     et en utilisant la colonne 'timestamp' existante.
+    Avec compact, les métadonnées textuelles sont ajoutées en catégories (un code
+    par ligne) au lieu d'une chaîne répétée sur chaque ligne.
     """
     logging.info(f"Traitement des données Parquet pour la station : {station_meta['station_name']}")
     if not os.path.exists(data_path) or not os.listdir(data_path):
         logging.warning(f"Le dossier {data_path} est vide ou n'existe pas.")
         return pd.DataFrame()
 
-    df = pd.read_parquet(data_path)
+    source = os.path.basename(os.path.normpath(data_path))
+    with instrumentation.stage('read_parquet', source=source, bytes_read=instrumentation.path_size(data_path)) as metrics:
+        # Colonnes Airbyte extraites dans Arrow : même lecture que pd.read_parquet, sans dictionnaires Python
+        df = unwrap_airbyte_columns(pq.read_table(data_path, use_pandas_metadata=True)).to_pandas()
+        metrics['rows_out'] = len(df)
+    with instrumentation.stage('flatten', source=source, rows_in=len(df)) as metrics:
+        df = flatten_station_frame(df, station_meta, compact)
+        metrics['rows_out'] = len(df)
+    return df
 
-    # Aplatir les colonnes qui contiennent des dictionnaires
-    for col in df.columns:
-        if df[col].dtype == 'object':
-            # Vérifie si le premier élément non nul est un dictionnaire contenant la clé 'string'
-            first_valid = df[col].dropna().iloc[0] if not df[col].dropna().empty else None
-            if isinstance(first_valid, dict) and 'string' in first_valid:
-                logging.info(f"Aplatissement de la colonne '{col}'...")
-                df[col] = df[col].apply(lambda x: x.get('string') if isinstance(x, dict) else x)
-
-    df = df.assign(**station_meta)
+@dataclass(frozen=True)
+class FlatteningPlan:
+    """
+    Aplatissement d'un schéma Parquet de station : colonnes enveloppées par Airbyte
+    (structures {'string': ..., ...}) avec la position du champ 'string' à extraire,
+    et colonnes _airbyte* à retirer.
+    """
+    wrapped: tuple  # (nom de la colonne, position du champ 'string')
+    dropped: tuple
+
+# Plans déjà calculés, par empreinte de schéma (un par processus)
+_FLATTENING_PLANS = {}
+
+def schema_fingerprint(schema):
+    """Empreinte des champs d'un schéma Arrow, sans ses métadonnées (pandas, Airbyte)."""
+    return hashlib.sha1(schema.remove_metadata().serialize()).hexdigest()
+
+def flattening_plan(schema):
+    """Plan d'aplatissement d'un schéma, calculé une seule fois par empreinte de schéma."""
+    fingerprint = schema_fingerprint(schema)
+    plan = _FLATTENING_PLANS.get(fingerprint)
+    if plan is None:
+        wrapped = []
+        for column in schema:
+            if pa.types.is_struct(column.type) and column.type.get_field_index('string') >= 0:
+                position = column.type.get_field_index('string')
+                wrapped.append((column.name, position))
+                logging.info(f"Aplatissement de la colonne '{column.name}'...")
+        dropped = tuple(name for name in schema.names if name.startswith('_airbyte'))
+        plan = _FLATTENING_PLANS[fingerprint] = FlatteningPlan(tuple(wrapped), dropped)
+    return plan
+
+def unwrap_airbyte_columns(table):
+    """
+    Remplace chaque colonne enveloppée par Airbyte par son champ 'string' (null si la
+    structure est nulle) et retire les colonnes _airbyte*, directement sur la table Arrow.
+    """
+    plan = flattening_plan(table.schema)
+    for name, position in plan.wrapped:
+        index = table.schema.get_field_index(name)
+        table = table.set_column(index, name, pc.struct_field(table.column(index), [position]))
+    return table.drop_columns(list(plan.dropped))
+
+def flatten_station_frame(df, station_meta, compact=False):
+    """
+    Ajoute ses métadonnées à un DataFrame de station. Les colonnes enveloppées par
+    Airbyte ont déjà été extraites à la lecture (voir unwrap_airbyte_columns).
+    """
+    if compact:
+        codes = np.zeros(len(df), dtype=np.int8)
+        df = df.assign(**{
+            key: pd.Categorical.from_codes(codes, categories=[value]) if isinstance(value, str) else value
+            for key, value in station_meta.items()
+        })
+    else:
+        df = df.assign(**station_meta)
     
     cols_to_drop = [col for col in df.columns if col.startswith('_airbyte')]
     df = df.drop(columns=cols_to_drop, errors='ignore')
 
     return df
 
+def explode_hourly_payloads(source_df):
+    """
+    Aplatit la structure 'hourly' d'Infoclimat ({station: {'time': [...], metrique: [...]}})
+    en une ligne par mesure, colonne par colonne : les métadonnées de chaque station sont
+    répétées avec np.repeat et chaque série de la charge utile est copiée en un seul bloc
+    dans un tableau NumPy, au lieu de construire un dict par mesure.
+    Le schéma obtenu (ordre des colonnes, types, valeurs manquantes) est celui de
+    pd.DataFrame(liste d'enregistrements).
+    """
+    station_ids, station_infos, time_chunks = [], [], []
+    metric_chunks = {}  # métrique -> [(position de départ, valeurs)]
+    total = 0
+
+    stations_column = source_df['stations'] if 'stations' in source_df.columns else [[]] * len(source_df)
+    for stations_list, hourly_data in zip(stations_column, source_df['hourly']):
+        if not isinstance(hourly_data, dict): continue
+        stations = {s['id']: s for s in (stations_list if isinstance(stations_list, (list, np.ndarray)) else [])
+                    if isinstance(s, dict)}
+
+        for station_id, measurements in hourly_data.items():
+            if not isinstance(measurements, dict): continue
+            time_steps = measurements.get('time', [])
+            num_records = len(time_steps)
+            if num_records == 0: continue
+
+            station_ids.append(station_id)
+            station_infos.append(stations.get(station_id, {}))
+            time_chunks.append(time_steps)
+            for metric, values in measurements.items():
+                # Séries lues depuis Parquet : tableaux NumPy et non listes
+                if metric != 'time' and isinstance(values, (list, np.ndarray)) and len(values):
+                    metric_chunks.setdefault(metric, []).append((total, values[:num_records]))
+            total += num_records
+
+    if total == 0:
+        return pd.DataFrame()
+
+    # Métadonnées de la station répétées sur toute la série : le type de chaque colonne est
+    # déduit des valeurs des stations (une par série), puis le tableau typé est répété
+    counts = np.array([len(time_steps) for time_steps in time_chunks])
+    metadata = {
+        'station_id': station_ids,
+        'latitude': [info.get('latitude') for info in station_infos],
+        'longitude': [info.get('longitude') for info in station_infos],
+        'elevation': [info.get('elevation') for info in station_infos],
+        'station_name': [info.get('name') for info in station_infos],
+    }
+    columns = {name: np.repeat(pd.Series(values).to_numpy(), counts) for name, values in metadata.items()}
+    columns['timestamp'] = _infer_column(np.concatenate([_object_array(chunk) for chunk in time_chunks]))
+    for metric, chunks in metric_chunks.items():
+        columns[metric] = _metric_column(chunks, total)
+    return pd.DataFrame(columns)
+
+def _object_array(values):
+    """Tableau NumPy d'objets, sans conversion des valeurs (np.asarray(['1', 2]) en ferait des chaînes)."""
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+def _infer_column(values):
+    """Type d'une colonne d'objets déduit comme par le constructeur de DataFrame (None -> NaN dans une colonne numérique)."""
+    return pd.Series(values, copy=False).infer_objects().to_numpy()
+
+def _metric_column(chunks, total):
+    """
+    Colonne d'une métrique à partir de ses séries [(position de départ, valeurs)] ; les
+    positions non couvertes (séries plus courtes que 'time', stations sans la métrique)
+    restent NaN. Les séries décimales lues depuis Parquet sont copiées directement dans
+    un tableau float64, les autres (listes JSON, avec None) passent par l'inférence de type.
+    """
+    if all(isinstance(values, np.ndarray) and values.dtype.kind == 'f' for _, values in chunks):
+        column = np.full(total, np.nan)
+    else:
+        column = np.full(total, np.nan, dtype=object)
+    for offset, values in chunks:
+        column[offset:offset + len(values)] = values
+    return column if column.dtype != object else _infer_column(column)
+
 def transform_infoclimat_parquet(data_path):
     """
     Transforme les fichiers Parquet de la source Infoclimat, qu'ils soient imbriqués ou non.
+    Retourne None si la transformation a échoué (un DataFrame vide si le dossier est vide).
     """
     logging.info("Traitement des données Parquet pour Infoclimat")
     if not os.path.exists(data_path) or not os.listdir(data_path):
         logging.warning(f"Le dossier {data_path} est vide ou n'existe pas.")
         return pd.DataFrame()
 
-    df = pd.read_parquet(data_path)
+    with instrumentation.stage('read_parquet', source='infoclimat', bytes_read=instrumentation.path_size(data_path)) as metrics:
+        df = pd.read_parquet(data_path)
+        metrics['rows_out'] = len(df)
 
     try:
-        source_df = df
-        # Si les données sont imbriquées dans _airbyte_data, on les normalise
-        if '_airbyte_data' in df.columns:
-            logging.info("Données trouvées dans '_airbyte_data', normalisation...")
-            source_df = pd.json_normalize(df['_airbyte_data'].apply(json.loads))
-
-        # Si les données (maintenant dans source_df) sont encore imbriquées (format Infoclimat)
-        if 'hourly' in source_df.columns:
-            logging.info("Structure 'hourly' détectée, aplatissement des enregistrements...")
-            exploded_records = []
-            for _, row in source_df.iterrows():
-                stations = {s['id']: s for s in row.get('stations', []) if isinstance(s, dict)}
-                hourly_data = row.get('hourly', {})
-                if not isinstance(hourly_data, dict): continue
-
-                for station_id, measurements in hourly_data.items():
-                    station_info = stations.get(station_id, {})
-                    if not isinstance(measurements, dict): continue
-                    
-                    time_steps = measurements.get('time', [])
-                    num_records = len(time_steps)
-                    
-                    for i in range(num_records):
-                        flat_record = {
-                            'station_id': station_id,
-                            'latitude': station_info.get('latitude'),
-                            'longitude': station_info.get('longitude'),
-                            'elevation': station_info.get('elevation'),
-                            'station_name': station_info.get('name'),
-                            'timestamp': time_steps[i]
-                        }
-                        for metric, values in measurements.items():
-                            if metric != 'time' and isinstance(values, list) and i < len(values):
-                                flat_record[metric] = values[i]
-                        exploded_records.append(flat_record)
-            
-            df = pd.DataFrame(exploded_records)
-        else:
-            # Si 'hourly' n'est pas là, on utilise le dataframe source tel quel
-            logging.info("Structure 'hourly' non détectée, utilisation des données aplaties.")
-            df = source_df
-
-        cols_to_drop = [col for col in df.columns if col.startswith('_airbyte')]
-        df = df.drop(columns=cols_to_drop, errors='ignore')
+        with instrumentation.stage('flatten', source='infoclimat', rows_in=len(df)) as metrics:
+            df = flatten_infoclimat_frame(df)
+            metrics['rows_out'] = len(df)
         return df
-
     except Exception as e:
         logging.error("Erreur critique lors de la transformation des données Infoclimat.", exc_info=True)
-        return pd.DataFrame()
+        return None
+
+def flatten_infoclimat_frame(df):
+    """Aplatit un DataFrame de la source Infoclimat (charges utiles Airbyte ou structure 'hourly')."""
+    source_df = df
+    # Si les données sont imbriquées dans _airbyte_data, on les normalise
+    if '_airbyte_data' in df.columns:
+        logging.info("Données trouvées dans '_airbyte_data', normalisation...")
+        source_df = pd.json_normalize(df['_airbyte_data'].apply(json.loads))
+
+    # Si les données (maintenant dans source_df) sont encore imbriquées (format Infoclimat)
+    if 'hourly' in source_df.columns:
+        logging.info("Structure 'hourly' détectée, aplatissement des enregistrements...")
+        with instrumentation.stage('explode_hourly', rows_in=len(source_df)) as metrics:
+            df = explode_hourly_payloads(source_df)
+            metrics['rows_out'] = len(df)
+    else:
+        # Si 'hourly' n'est pas là, on utilise le dataframe source tel quel
+        logging.info("Structure 'hourly' non détectée, utilisation des données aplaties.")
+        df = source_df
+
+    cols_to_drop = [col for col in df.columns if col.startswith('_airbyte')]
+    return df.drop(columns=cols_to_drop, errors='ignore')
 
 # Fonctions Utilitaires
 
-def test_data_quality(df, source_name):
-    """Effectue des tests de qualité sur le DataFrame."""
-    logging.info(f"Test de qualité pour {source_name}")
-    if df.empty:
+@dataclass
+class QualityReport:
+    """
+    Résultat du test de qualité d'un DataFrame, éventuellement alimenté lot par lot
+    (update) ou par fusion des rapports de plusieurs sources (merge). Les lots peuvent
+    avoir des colonnes différentes : une colonne absente d'un lot compte comme une
+    colonne de valeurs manquantes, comme après pd.concat. Les empreintes des lignes sont
+    conservées jusqu'à finalize() pour compter les doublons entre lots ; to_dict() donne
+    la version sérialisable en JSON.
+    """
+    source_name: str
+    key_columns: list = field(default_factory=list)
+    rows: int = 0
+    null_counts: dict = field(default_factory=dict)
+    unhashable_columns: list = field(default_factory=list)
+    duplicate_rows: int = 0
+    duplicate_keys: int = 0
+    columns: list = field(default_factory=list, repr=False)
+    row_hashes: list = field(default_factory=list, repr=False)
+    key_hashes: list = field(default_factory=list, repr=False)
+
+    @property
+    def has_missing_values(self):
+        return any(self.null_counts.values())
+
+    def _align_columns(self, columns, rows):
+        """Compte comme manquantes les colonnes absentes d'un côté ou de l'autre d'un ajout de rows lignes."""
+        for col in self.columns:
+            if col not in columns:
+                self.null_counts[col] = self.null_counts.get(col, 0) + rows
+        known = set(self.columns)
+        for col in columns:
+            if col not in known:
+                if self.rows:
+                    self.null_counts[col] = self.null_counts.get(col, 0) + self.rows
+                self.columns.append(col)
+        self.rows += rows
+
+    def update(self, df):
+        """Ajoute un lot au rapport en un seul passage sur ses colonnes."""
+        self._align_columns(list(df.columns), len(df))
+        for col, count in df.isna().sum().items():
+            if count:
+                self.null_counts[col] = self.null_counts.get(col, 0) + int(count)
+
+        # Chaque colonne est hachée une seule fois ; une colonne contenant des objets
+        # imbriqués (dict, list) ne peut pas l'être et est exclue des tests de doublons
+        row_hashes = np.zeros(len(df), dtype=np.uint64)
+        key_hashes = np.zeros(len(df), dtype=np.uint64)
+        hashed_columns = 0
+        for col in df.columns:
+            if col in self.unhashable_columns:
+                continue
+            try:
+                hashes = _column_hashes(col, df[col])
+            except TypeError:
+                self.unhashable_columns.append(col)
+                continue
+            hashed_columns += 1
+            row_hashes += hashes
+            if col in self.key_columns:
+                key_hashes += hashes
+        if hashed_columns:
+            self.row_hashes.append(row_hashes)
+            self.key_hashes.append(key_hashes)
+
+    def merge(self, other):
+        """Ajoute au rapport les lignes (déjà hachées) d'un autre rapport non finalisé."""
+        self._align_columns(other.columns, other.rows)
+        for col, count in other.null_counts.items():
+            self.null_counts[col] = self.null_counts.get(col, 0) + count
+        self.unhashable_columns += [col for col in other.unhashable_columns if col not in self.unhashable_columns]
+        self.row_hashes += other.row_hashes
+        self.key_hashes += other.key_hashes
+        return self
+
+    def finalize(self):
+        """Compte les doublons sur l'ensemble des lots et libère les empreintes."""
+        self.duplicate_rows = _count_duplicates(self.row_hashes)
+        self.duplicate_keys = _count_duplicates(self.key_hashes)
+        self.row_hashes, self.key_hashes = [], []
+        # Ordre des colonnes du DataFrame complet, quel que soit l'ordre d'arrivée des lots
+        self.key_columns = [col for col in self.key_columns if col in self.columns]
+        self.null_counts = {col: self.null_counts[col] for col in self.columns if self.null_counts.get(col)}
+        self.unhashable_columns = [col for col in self.columns if col in self.unhashable_columns]
+        return self
+
+    def to_dict(self):
+        return {
+            'source_name': self.source_name,
+            'rows': self.rows,
+            'null_counts': self.null_counts,
+            'unhashable_columns': self.unhashable_columns,
+            'key_columns': self.key_columns,
+            'duplicate_rows': self.duplicate_rows,
+            'duplicate_keys': self.duplicate_keys,
+        }
+
+# Types hachés à l'identique par hash_pandas_object sans qu'une colonne les mélangeant soit ambiguë
+_HOMOGENEOUS_KINDS = {'string', 'bytes', 'integer', 'floating', 'boolean', 'decimal', 'datetime', 'date', 'empty'}
+
+def _hash_column(series):
+    """
+    Empreinte (uint64) de chaque valeur d'une colonne. hash_pandas_object hache les
+    objets par leur représentation str() : dans une colonne de types mêlés, 1 et '1'
+    auraient la même empreinte alors que duplicated() les distingue. Le type de chaque
+    valeur est alors combiné à son empreinte. Comme pour duplicated() sur plusieurs
+    colonnes, les valeurs manquantes (None, NaN, NaT) sont toutes égales. Les entiers
+    sont hachés comme des décimaux : pd.concat les convertit ainsi quand un lot n'a pas
+    la colonne.
+    """
+    if pd.api.types.is_integer_dtype(series.dtype):
+        series = series.astype(np.float64)
+    hashes = pd.util.hash_pandas_object(series, index=False).to_numpy()
+    if series.dtype != 'object' or pd.api.types.infer_dtype(series, skipna=True) in _HOMOGENEOUS_KINDS:
+        return hashes
+    value_types = np.array([_value_type(value) for value in series], dtype=object)
+    missing = series.isna().to_numpy()
+    value_types[missing] = 'null'
+    hashes = _combine_hashes([hashes, pd.util.hash_array(value_types)])
+    hashes[missing] = 0
+    return hashes
+
+def _value_type(value):
+    """Type d'une valeur tel que le voit l'égalité Python (1 == 1.0 == True, Timestamp == datetime)."""
+    if isinstance(value, numbers.Number):
+        return 'number'
+    if isinstance(value, datetime):
+        return 'datetime'
+    if isinstance(value, date):
+        return 'date'
+    return type(value).__name__
+
+def _column_hashes(name, series):
+    """
+    Contribution d'une colonne à l'empreinte de chaque ligne, qui est la somme des
+    contributions de ses colonnes. Une valeur manquante ne contribue pas : une ligne a
+    la même empreinte, que son lot ait la colonne (vide) ou non, comme après pd.concat.
+    """
+    name_hash = pd.util.hash_array(np.array([name], dtype=object))[0]
+    hashes = pd.util.hash_array(_hash_column(series) ^ name_hash)
+    hashes[series.isna().to_numpy()] = 0
+    return hashes
+
+def _combine_hashes(hash_arrays):
+    """Combine des empreintes de colonnes (uint64) en une empreinte par ligne."""
+    if len(hash_arrays) == 1:
+        return hash_arrays[0]
+    return pd.util.hash_pandas_object(pd.DataFrame(dict(enumerate(hash_arrays))), index=False).to_numpy()
+
+def _count_duplicates(hash_arrays):
+    """Nombre de lignes dont l'empreinte a déjà été vue (équivalent à duplicated().sum())."""
+    if not hash_arrays:
+        return 0
+    hashes = np.concatenate(hash_arrays)
+    return int(len(hashes) - len(np.unique(hashes)))
+
+def log_quality_report(report):
+    """Journalise un rapport de qualité dans le format historique du script."""
+    if report.rows == 0:
         logging.warning("Le DataFrame est vide.")
         return
-    logging.info(f"OK: {len(df)} lignes trouvées.")
-    
-    if df.isnull().values.any():
+    logging.info(f"OK: {report.rows} lignes trouvées.")
+    if report.has_missing_values:
         logging.warning("Alerte: Valeurs manquantes détectées.")
-        logging.warning(df.isnull().sum()[df.isnull().sum() > 0])
-    
-    df_for_duplicates_test = df.copy()
-    unhashable_cols = []
-    for col in df_for_duplicates_test.columns:
-        if any(isinstance(x, (dict, list)) for x in df_for_duplicates_test[col].dropna()):
-            unhashable_cols.append(col)
-
-    if unhashable_cols:
-        logging.warning(f"Les colonnes suivantes contiennent des objets non 'hashables' et seront ignorées pour le test de doublons: {unhashable_cols}")
-        df_for_duplicates_test = df_for_duplicates_test.drop(columns=unhashable_cols)
-
-    if df_for_duplicates_test.duplicated().any():
-        logging.warning(f"Alerte: {df_for_duplicates_test.duplicated().sum()} doublons détectés.")
+        logging.warning(pd.Series(report.null_counts))
+    if report.unhashable_columns:
+        logging.warning(f"Les colonnes suivantes contiennent des objets non 'hashables' et seront ignorées pour le test de doublons: {report.unhashable_columns}")
+    if report.duplicate_rows:
+        logging.warning(f"Alerte: {report.duplicate_rows} doublons détectés.")
     else:
         logging.info("OK: Aucun doublon détecté.")
-        
+    if report.duplicate_keys:
+        logging.warning(f"Alerte: {report.duplicate_keys} relevés partagent une même clé {report.key_columns}.")
+
+def save_quality_report(report, output_dir=TRANSFORMED_OUTPUT_PATH):
+    """Sauvegarde le rapport de qualité en JSON à côté des sorties."""
+    report_file = os.path.join(output_dir, QUALITY_REPORT_FILENAME)
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(report.to_dict(), f, indent=4, ensure_ascii=False)
+
+def test_data_quality(df, source_name, key_columns=QUALITY_KEY_COLUMNS):
+    """
+    Effectue des tests de qualité sur le DataFrame : valeurs manquantes, colonnes non
+    hashables, lignes dupliquées et doublons sur key_columns (si elles sont présentes).
+    Retourne un QualityReport.
+    """
+    logging.info(f"Test de qualité pour {source_name}")
+    report = QualityReport(source_name, key_columns=[col for col in key_columns if col in df.columns])
+    with instrumentation.stage('quality', rows_in=len(df)):
+        report.update(df)
+        report.finalize()
+    log_quality_report(report)
     logging.info(f"Fin du test de qualité pour {source_name}")
+    return report
+
+def _split_value_unit(texts):
+    """
+    Découpe des chaînes '<valeur> <unité>' en un seul passage avec les noyaux Arrow.
+    Retourne (valeurs en float64, NaN si non numériques ; unités en tableau Arrow).
+    """
+    arr = pc.utf8_trim_whitespace(pa.array(texts, type=pa.string()))
+    # L'espace ajouté garantit deux éléments après découpage, même sans unité.
+    # Le découpage reconnaît tous les espaces Unicode, dont l'espace insécable des sources.
+    parts = pc.utf8_split_whitespace(pc.binary_join_element_wise(arr, ' ', ''), max_splits=1)
+    value_text = pc.list_element(parts, 0)
+    units = pc.utf8_trim_whitespace(pc.list_element(parts, 1))
+    is_number = pc.match_substring_regex(value_text, r'^-?\d+(\.\d*)?$')
+    values = pc.cast(pc.if_else(is_number, value_text, pa.scalar(None, pa.string())), pa.float64())
+    return values.to_numpy(zero_copy_only=False, writable=True), units
+
+def parse_measure_column(series, normalize_units=False, column_name=None, dtype=np.float64):
+    """
+    Convertit une colonne de mesures (ex : '53.1 °F', '87 %', 0.0) en colonne numérique.
+    Une colonne déjà numérique est retournée telle quelle. Sinon, les valeurs numériques
+    sont converties directement et seules les chaînes sont découpées en valeur et unité.
+    Avec normalize_units, les valeurs suffixées d'une unité connue sont converties
+    dans le Système international (voir SI_CONVERSIONS) ; une chaîne sans unité
+    reconnaissable prend l'unité dominante de la colonne, pour ne pas mêler des valeurs
+    converties et non converties.
+    """
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series
+
+    text_mask = (series.map(type) == str).to_numpy()
+    values = np.full(len(series), np.nan)
+    if not text_mask.all():
+        values[~text_mask] = pd.to_numeric(series[~text_mask], errors='coerce')
+    if not text_mask.any():
+        return pd.Series(values, index=series.index, name=series.name).astype(dtype)
+
+    texts = series.to_numpy()[text_mask]
+    parsed, units = _split_value_unit(texts)
+    units = units.to_numpy(zero_copy_only=False).astype(object) if normalize_units else None
+
+    # Formats inattendus (ex : '12.5°F') : extraction du premier nombre, comme auparavant,
+    # et de ce qui le suit directement comme unité
+    unparsed = np.isnan(parsed)
+    if unparsed.any():
+        extracted = pd.Series(texts[unparsed]).str.extract(r'(-?\d+\.?\d*)\s*(\S*)')
+        parsed[unparsed] = pd.to_numeric(extracted[0], errors='coerce')
+        if units is not None:
+            units[unparsed] = extracted[1].to_numpy()
+
+    if normalize_units:
+        _apply_dominant_unit(units, ~np.isnan(parsed), column_name)
+        conversions = {**SI_CONVERSIONS, **SI_COLUMN_CONVERSIONS.get(column_name, {})}
+        for unit, (factor, offset) in conversions.items():
+            unit_mask = units == unit
+            parsed[unit_mask] = parsed[unit_mask] * factor + offset
+
+    values[text_mask] = parsed
+    return pd.Series(values, index=series.index, name=series.name).astype(dtype)
+
+def _apply_dominant_unit(units, has_value, column_name=None):
+    """
+    Attribue l'unité la plus fréquente de la colonne aux valeurs lues sans unité (ex : '57'
+    parmi des '56.8 °F'), en place. Les valeurs dont l'unité diffère de l'unité dominante
+    sont journalisées : elles ne sont converties que si leur unité est connue.
+    """
+    units_series = pd.Series(units, dtype=object)
+    without_unit = (units_series.isna() | (units_series == '')).to_numpy()
+    counts = units_series[has_value & ~without_unit].value_counts()
+    if counts.empty:
+        return
+    dominant = counts.index[0]
+    missing = has_value & without_unit
+    if missing.any():
+        units[missing] = dominant
+        logging.info(f"Colonne '{column_name}' : {int(missing.sum())} valeurs sans unité lues en {dominant}.")
+    if len(counts) > 1:
+        logging.warning(f"Colonne '{column_name}' : unités différentes de {dominant} : {counts.iloc[1:].to_dict()}")
 
-def clean_and_convert_data(df):
-    """Nettoie, convertit les types et normalise les colonnes."""
+def clean_and_convert_data(df, normalize_units=NORMALIZE_UNITS, measure_dtype=MEASURE_DTYPE):
+    """
+    Nettoie, convertit les types et normalise les colonnes.
+    normalize_units convertit les mesures suffixées d'une unité impériale dans le
+    Système international ; measure_dtype permet d'obtenir des colonnes float32.
+    """
     logging.info("Nettoyage et conversion des types de données")
     rename_map = {
         'Dew Point': 'dew_point', 'Precip. Rate.': 'precip_rate', 'Precip. Accum.': 'precip_accum',
         'Speed': 'speed', 'Gust': 'gust', 'Pressure': 'pressure', 'UV': 'uv', 'Humidity': 'humidity',
-        'Wind': 'wind', 'Solar': 'solar', 'Temperature': 'temperature'
+        'Wind': 'wind', 'Solar': 'solar', 'Temperature': 'temperature',
+        # Noms des colonnes dans les fichiers Parquet d'Airbyte
+        'Dew_Point': 'dew_point', 'Precip__Rate_': 'precip_rate', 'Precip__Accum_': 'precip_accum'
     }
     df = df.rename(columns={k: v for k, v in rename_map.items() if k in df.columns})
     numeric_cols = [
@@ -232,51 +839,680 @@ def clean_and_convert_data(df):
     for col in numeric_cols:
         if col in df.columns:
             # Extraire les nombres de chaînes comme '53.1 °F'
-            df[col] = df[col].astype(str).str.extract(r'(-?\d+\.?\d*)')
-            df[col] = pd.to_numeric(df[col], errors='coerce')
+            df[col] = parse_measure_column(df[col], normalize_units, column_name=col, dtype=measure_dtype)
 
     if 'timestamp' in df.columns:
-        # Pandas peut inférer automatiquement le format pour les chaînes ISO 8601
-        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+        # Chaque valeur est lue comme de l'ISO 8601 : les variantes des sources ('T' ou
+        # espace comme séparateur, millisecondes) cohabitent, et le résultat d'une valeur
+        # ne dépend pas des autres lignes (mode streaming)
+        timestamps = pd.to_datetime(df['timestamp'], errors='coerce', format='ISO8601')
+        unparsed = int((timestamps.isna() & df['timestamp'].notna()).sum())
+        if unparsed:
+            logging.warning(f"{unparsed} timestamps illisibles remplacés par des valeurs nulles.")
+        df['timestamp'] = timestamps
     logging.info("Conversion terminée.")
     return df
 
-# FONCTION PRINCIPALE 
+def optimize_dtypes(df):
+    """
+    Passe le DataFrame en représentation compacte : colonnes textuelles répétées
+    (CATEGORICAL_COLUMNS) en catégories et mesures décimales en float32.
+    """
+    converted = {}
+    for col in df.columns:
+        if col in CATEGORICAL_COLUMNS and df[col].dtype == 'object':
+            converted[col] = df[col].astype('category')
+        elif col in MEASURE_COLUMNS and pd.api.types.is_float_dtype(df[col]) and df[col].dtype != np.float32:
+            converted[col] = df[col].astype(np.float32)
+    return df.assign(**converted)
 
-def main():
+def concat_frames(dfs):
     """
-    Orchestre le téléchargement, la transformation Parquet,
-    le nettoyage et la sauvegarde des données.
+    pd.concat qui conserve les colonnes catégorielles : leurs catégories sont unifiées
+    avant la concaténation, sinon pandas les convertirait en chaînes.
     """
-    if os.path.exists(LOCAL_DOWNLOAD_PATH): shutil.rmtree(LOCAL_DOWNLOAD_PATH)
-    if os.path.exists(TRANSFORMED_OUTPUT_PATH): shutil.rmtree(TRANSFORMED_OUTPUT_PATH)
-    os.makedirs(LOCAL_DOWNLOAD_PATH); os.makedirs(TRANSFORMED_OUTPUT_PATH)
-    logging.info("Répertoires locaux nettoyés.")
+    categorical_columns = {col for df in dfs for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)}
+    if categorical_columns:
+        aligned = [df.copy() for df in dfs]
+        for col in categorical_columns:
+            categories = pd.Index([])
+            for df in aligned:
+                if col in df.columns:
+                    values = df[col].cat.categories if isinstance(df[col].dtype, pd.CategoricalDtype) else df[col].dropna().unique()
+                    categories = categories.union(pd.Index(values))
+            for df in aligned:
+                if col in df.columns:
+                    df[col] = df[col].astype(pd.CategoricalDtype(categories))
+        dfs = aligned
+    return pd.concat(dfs, ignore_index=True)
 
-    s3_sources = [S3_PREFIX_INFOCLIMAT, S3_PREFIX_ICHTEGEM_WEATHER, S3_PREFIX_LA_MADELEINE_WEATHER]
-    for prefix in s3_sources:
-        if not download_from_s3_securise(S3_BUCKET_NAME, prefix, LOCAL_DOWNLOAD_PATH, extensions_autorisees=['.parquet']):
-            logging.error(f"Échec du téléchargement pour {prefix}. Arrêt du script."); return
+def memory_per_row(df):
+    """Nombre moyen d'octets occupés par ligne (chaînes comprises)."""
+    return df.memory_usage(deep=True).sum() / max(len(df), 1)
 
-    df_infoclimat = transform_infoclimat_parquet(os.path.join(LOCAL_DOWNLOAD_PATH, 'infoclimat'))
-    df_ichtegem = transform_station_parquet(os.path.join(LOCAL_DOWNLOAD_PATH, 'ichtegem_weather'), STATION_METADATA["IICHTE19"])
-    df_la_madeleine = transform_station_parquet(os.path.join(LOCAL_DOWNLOAD_PATH, 'la_madeleine_weather'), STATION_METADATA["ILAMAD25"])
-    
-    all_dfs = [df for df in [df_infoclimat, df_ichtegem, df_la_madeleine] if not df.empty]
+def widen_float32_columns(df):
+    """
+    Repasse les colonnes float32 en float64 via leur représentation décimale la plus
+    courte, pour exporter 56.8 et non 56.7999992371 dans le JSON et MongoDB.
+    """
+    return df.assign(**{
+        col: df[col].to_numpy().astype(str).astype(np.float64)
+        for col in df.columns if df[col].dtype == np.float32
+    })
+
+def _arrow_owned(column):
+    """
+    Colonne numérique dans des tampons alloués par Arrow (concat_arrays) plutôt que sur le
+    tableau NumPy emprunté par from_pandas. Les threads d'écriture de write_dataset relâchent
+    leurs références après son retour ; libérer depuis l'un d'eux un tampon emprunté à NumPy
+    demande le GIL, et fait avorter le processus si l'interpréteur est en cours d'arrêt.
+    """
+    return pa.chunked_array([pa.concat_arrays([chunk, chunk.slice(0, 0)]) for chunk in column.chunks],
+                            type=column.type)
+
+def to_arrow_table(df):
+    """
+    Convertit le DataFrame final en table Arrow typée. Les colonnes objet mélangeant
+    plusieurs types sont converties en chaînes et les timestamps sont stockés à la
+    milliseconde, la précision des dates BSON.
+    """
+    mixed_columns = [
+        col for col in df.columns
+        if df[col].dtype == 'object' and pd.api.types.infer_dtype(df[col], skipna=True).startswith('mixed')
+    ]
+    for col in mixed_columns:
+        logging.info(f"Colonne '{col}' de types mélangés convertie en chaînes.")
+    # Conversion colonne par colonne, sans la copie complète du DataFrame que ferait df.assign
+    table = pa.Table.from_pandas(df, columns=[col for col in df.columns if col not in mixed_columns],
+                                 preserve_index=False)
+    for index, field in enumerate(table.schema):
+        if pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+            table = table.set_column(index, field, _arrow_owned(table.column(index)))
+    if mixed_columns:
+        pandas_metadata = table.schema.pandas_metadata
+        for col in mixed_columns:
+            position = df.columns.get_loc(col)
+            as_strings = df[col].where(df[col].isna(), df[col].astype(str))
+            table = table.add_column(position, col, pa.array(as_strings, from_pandas=True))
+            pandas_metadata['columns'].insert(position, {'name': col, 'field_name': col, 'pandas_type': 'unicode',
+                                                         'numpy_type': 'object', 'metadata': None})
+        table = table.replace_schema_metadata({**table.schema.metadata, b'pandas': json.dumps(pandas_metadata).encode()})
+
+    def storage_type(field):
+        if pa.types.is_timestamp(field.type):
+            return field.with_type(pa.timestamp('ms'))
+        if pa.types.is_dictionary(field.type):
+            # Les catégories sont de toute façon encodées en dictionnaire par Parquet
+            return field.with_type(field.type.value_type)
+        return field
+
+    schema = pa.schema([storage_type(field) for field in table.schema], metadata=table.schema.metadata)
+    return table.cast(schema, safe=False)
+
+def with_month_column(df):
+    """Ajoute la colonne de partitionnement 'month' (AAAA-MM) dérivée du timestamp."""
+    return df.assign(month=df['timestamp'].dt.strftime('%Y-%m') if 'timestamp' in df.columns else None)
+
+def write_partitioned_parquet(df, output_path, basename_template=None):
+    """
+    Écrit le DataFrame final en Parquet, partitionné par station et par mois.
+    basename_template permet d'écrire plusieurs lots dans le même dataset sans écraser
+    les fichiers des lots précédents.
+    """
+    written_sizes = []
+    with instrumentation.stage('write_parquet', rows_in=len(df)) as metrics:
+        table = to_arrow_table(with_month_column(df))
+        ds.write_dataset(
+            table, output_path, format='parquet',
+            partitioning=PARQUET_PARTITIONING,
+            basename_template=basename_template,
+            existing_data_behavior='overwrite_or_ignore',
+            # Appelé depuis les threads d'écriture d'Arrow : les tailles sont additionnées ensuite
+            file_visitor=lambda written_file: written_sizes.append(written_file.size)
+        )
+        metrics['rows_out'] = table.num_rows
+        metrics['bytes_written'] = sum(written_sizes)
+    return table.num_rows
+
+def dataset_file_schema(parquet_path):
+    """
+    Schéma commun des fichiers d'un dataset Parquet, sans les colonnes de partitionnement :
+    celui de _common_metadata s'il existe, sinon l'unification des schémas de tous les
+    fichiers. Retourne None si le dataset est vide ou absent.
+    """
+    common_metadata = os.path.join(parquet_path, COMMON_METADATA_FILENAME)
+    if os.path.exists(common_metadata):
+        return pq.read_schema(common_metadata)
+    if not os.path.isdir(parquet_path):
+        return None
+    dataset = ds.dataset(parquet_path, format='parquet', partitioning=PARQUET_PARTITIONING)
+    schemas = [fragment.physical_schema for fragment in dataset.get_fragments()]
+    return pa.unify_schemas(schemas).remove_metadata() if schemas else None
+
+def append_partitions(staging_path, parquet_path, run_id):
+    """
+    Ajoute au dataset parquet_path les fichiers du dataset staging_path, préfixés par
+    run_id pour ne jamais écraser les fichiers des exécutions précédentes, et met à jour
+    _common_metadata. Retourne False, sans rien déplacer, si le schéma des nouveaux
+    fichiers est incompatible avec celui du dataset (même colonne, types différents).
+    """
+    new_schema = dataset_file_schema(staging_path)
+    if new_schema is None:
+        return True
+    existing_schema = dataset_file_schema(parquet_path)
+    try:
+        schema = pa.unify_schemas([existing_schema, new_schema] if existing_schema else [new_schema])
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+        logging.warning(f"Schéma des nouvelles partitions incompatible avec le dataset existant : {e}")
+        return False
+
+    with instrumentation.stage('append_partitions') as metrics:
+        for root, _, file_names in os.walk(staging_path):
+            target_dir = os.path.join(parquet_path, os.path.relpath(root, staging_path))
+            for file_name in file_names:
+                if file_name == COMMON_METADATA_FILENAME:
+                    continue
+                os.makedirs(target_dir, exist_ok=True)
+                os.replace(os.path.join(root, file_name), os.path.join(target_dir, f"{run_id}-{file_name}"))
+                metrics['files'] = metrics.get('files', 0) + 1
+        pq.write_metadata(schema, os.path.join(parquet_path, COMMON_METADATA_FILENAME))
+    return True
+
+# Mode streaming
+
+def iter_parquet_frames(data_path, batch_rows, unwrap=False):
+    """
+    Lit un dossier de fichiers Parquet par lots d'au plus batch_rows lignes, dans l'ordre de pd.read_parquet.
+    Avec unwrap, les colonnes enveloppées par Airbyte sont extraites avant la conversion en DataFrame.
+    """
+    dataset = ds.dataset(data_path, format='parquet', partitioning='hive')
+    for batch in dataset.to_batches(batch_size=batch_rows):
+        if batch.num_rows:
+            yield unwrap_airbyte_columns(pa.Table.from_batches([batch])).to_pandas() if unwrap else batch.to_pandas()
+
+def source_read_rows(data_path, batch_rows, flatten, unwrap=False, sample_rows=16):
+    """
+    Lignes sources à lire par lot pour que leur aplatissement donne environ batch_rows
+    lignes : une charge utile Infoclimat se déplie en une ligne par station et par heure.
+    Le facteur est estimé sur les premières lignes de la source qui produisent des
+    lignes (une charge utile vide ou sans relevé ne dit rien de ce facteur). Retourne
+    batch_rows si aucune ligne de la source ne produit de ligne.
+    """
+    for raw_df in iter_parquet_frames(data_path, sample_rows, unwrap):
+        flattened_rows = len(flatten(raw_df))
+        if flattened_rows:
+            return max(1, int(batch_rows * len(raw_df) / flattened_rows))
+    return batch_rows
+
+def _output_batches(df, batch_rows):
+    """Découpe un lot aplati en lots d'au plus batch_rows lignes (aucun si le lot est vide)."""
+    if df.empty:
+        return
+    if len(df) <= batch_rows:
+        yield df
+        return
+    for start in range(0, len(df), batch_rows):
+        yield df.iloc[start:start + batch_rows].reset_index(drop=True)
+
+def _source_file_prefix(index):
+    return f"part-{index:04d}-"
+
+def _remove_source_files(parquet_path, index):
+    """Supprime les fichiers Parquet déjà écrits par la source de position index."""
+    for root, _, file_names in os.walk(parquet_path):
+        for file_name in file_names:
+            if file_name.startswith(_source_file_prefix(index)):
+                os.remove(os.path.join(root, file_name))
+
+def stream_source(item, batch_rows, json_dir, parquet_path):
+    """
+    Aplatit, nettoie et écrit lot par lot une source, item étant (position de la source,
+    (nom, dossier, aplatissement d'un lot, extraction des colonnes Airbyte à la lecture)).
+    Chaque lot non vide d'au plus batch_rows lignes de sortie est écrit dès qu'il est
+    nettoyé : ses fichiers Parquet dans parquet_path (préfixés par la position de la source)
+    et ses enregistrements à la suite de json_dir/<position>.json, avec les seules colonnes
+    de la source. Une source en erreur est écartée en entier, comme dans le chemin en mémoire.
+    Retourne le rapport de qualité (non finalisé) de la source, sans ligne si elle n'a rien
+    produit, ou None si sa transformation a échoué.
+    """
+    index, (source_name, data_path, flatten, unwrap) = item
+    report = QualityReport(source_name, key_columns=list(QUALITY_KEY_COLUMNS))
+    if not os.path.exists(data_path) or not os.listdir(data_path):
+        logging.warning(f"Le dossier {data_path} est vide ou n'existe pas.")
+        return report
+    # Les étapes portent le nom du dossier de la source, comme dans le chemin en mémoire
+    source = os.path.basename(os.path.normpath(data_path))
+    json_path = os.path.join(json_dir, f"{index:04d}.json")
+    batch_number = 0
+    try:
+        read_rows = source_read_rows(data_path, batch_rows, flatten, unwrap)
+        logging.info(f"Traitement en streaming de la source {source_name} "
+                     f"(lots de {batch_rows} lignes, {read_rows} lignes sources lues à la fois)")
+        frames = instrumentation.timed_iter('read_parquet', iter_parquet_frames(data_path, read_rows, unwrap), count=len,
+                                            source=source, bytes_read=instrumentation.path_size(data_path))
+        with open(json_path, 'w', encoding='utf-8') as f:
+            for raw_df in frames:
+                with instrumentation.stage('flatten', source=source, rows_in=len(raw_df)) as metrics:
+                    flat_df = flatten(raw_df)
+                    metrics['rows_out'] = len(flat_df)
+                for df in _output_batches(flat_df, batch_rows):
+                    with instrumentation.stage('clean', source=source, rows_in=len(df), rows_out=len(df)):
+                        df = clean_and_convert_data(df.drop(columns=['Time'], errors='ignore'))
+                    with instrumentation.stage('quality', source=source, rows_in=len(df)):
+                        report.update(df)
+                    # Mesures en float32 (MEASURE_DTYPE) élargies pour l'export, comme en mémoire
+                    df = widen_float32_columns(df)
+                    with instrumentation.stage('write_json', source=source, rows_in=len(df)) as metrics:
+                        # Les enregistrements sont écrits lot par lot : les crochets de chaque lot sont retirés
+                        records = df.to_json(orient='records', indent=4, force_ascii=False, date_format='iso')
+                        start = f.tell()
+                        f.write((',' if batch_number else '') + records[1:-2])
+                        metrics['bytes_written'] = f.tell() - start
+                    write_partitioned_parquet(
+                        df, parquet_path,
+                        basename_template=f"{_source_file_prefix(index)}{batch_number:06d}-{{i}}.parquet"
+                    )
+                    batch_number += 1
+    except Exception:
+        logging.error(f"Erreur critique lors de la transformation de la source {source_name}.", exc_info=True)
+        _remove_source_files(parquet_path, index)
+        report = None
+    if report is None or not report.rows:
+        if os.path.exists(json_path):
+            os.remove(json_path)
+    return report
+
+def _unified_type(types, complete):
+    """
+    Type d'une colonne sur l'ensemble des lots, tel que l'aurait donné pd.concat : entiers
+    et décimaux (ou entiers absents de certains lots) en décimaux, autres mélanges en chaînes.
+    """
+    if len(types) == 1:
+        column_type = next(iter(types))
+        return pa.float64() if pa.types.is_integer(column_type) and not complete else column_type
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in types):
+        return pa.float64()
+    return pa.string()
+
+def _rewrite_columns(path, targets):
+    """Réécrit un fichier Parquet en convertissant les colonnes de targets ({nom: type})."""
+    table = pq.ParquetFile(path).read()
+    for name, target in targets.items():
+        index = table.schema.get_field_index(name)
+        if pa.types.is_string(target):
+            # Même représentation que to_arrow_table pour les colonnes de types mélangés
+            values = table.column(index).to_pandas(integer_object_nulls=True)
+            column = pa.array(values.where(values.isna(), values.astype(str)), type=pa.string(), from_pandas=True)
+        else:
+            column = table.column(index).cast(target)
+        table = table.set_column(index, pa.field(name, target), column)
+    # Les métadonnées pandas du lot ne décrivent plus les colonnes converties
+    temporary_path = f"{path}.tmp"
+    pq.write_table(table.replace_schema_metadata(None), temporary_path)
+    os.replace(temporary_path, path)
+
+def unify_dataset_files(parquet_path, columns):
+    """
+    Aligne les fichiers d'un dataset écrit lot par lot sur l'écriture du DataFrame complet :
+    les lots n'ayant pas tous les mêmes colonnes, ni les mêmes types pour une colonne, les
+    fichiers dont une colonne n'a pas son type final (voir _unified_type) sont réécrits, et
+    le schéma commun (colonnes dans l'ordre de columns) est écrit dans _common_metadata.
+    Retourne le nombre de fichiers réécrits.
+    """
+    dataset = ds.dataset(parquet_path, format='parquet', partitioning=PARQUET_PARTITIONING)
+    fragments = [(fragment.path, fragment.physical_schema) for fragment in dataset.get_fragments()]
+    types, presence = {}, {}
+    for _, schema in fragments:
+        for column in schema:
+            presence[column.name] = presence.get(column.name, 0) + 1
+            if not pa.types.is_null(column.type):
+                types.setdefault(column.name, set()).add(column.type)
+    targets = {name: _unified_type(column_types, presence[name] == len(fragments)) for name, column_types in types.items()}
+
+    rewritten = 0
+    for path, schema in fragments:
+        changes = {column.name: targets[column.name] for column in schema
+                   if not pa.types.is_null(column.type) and column.type != targets[column.name]}
+        if changes:
+            _rewrite_columns(path, changes)
+            rewritten += 1
+    for name, target in targets.items():
+        if len(types[name]) > 1 and pa.types.is_string(target):
+            logging.info(f"Colonne '{name}' de types mélangés convertie en chaînes.")
+
+    schema = pa.schema([pa.field(name, targets.get(name, pa.null())) for name in columns if name in presence])
+    pq.write_metadata(schema, os.path.join(parquet_path, COMMON_METADATA_FILENAME))
+    return rewritten
+
+def transform_streaming(sources, batch_rows, output_dir=TRANSFORMED_OUTPUT_PATH, parquet_path=PARQUET_OUTPUT_PATH,
+                        failed_sources=None):
+    """
+    Transforme les sources lot par lot (aplatissement -> nettoyage -> qualité -> écriture)
+    sans jamais charger l'ensemble des données : chaque lot est écrit dès qu'il est
+    nettoyé (voir stream_source), les sources étant traitées simultanément (voir
+    run_sources). Les relevés et le rapport de qualité sont ceux du chemin en mémoire ;
+    les fichiers Parquet sont lus avec le schéma commun de _common_metadata. Le JSON, lui,
+    n'est pas unifié : chaque enregistrement ne porte que les colonnes de sa source, là où
+    la transformation en mémoire écrit null pour les colonnes des autres sources (les
+    documents MongoDB n'ont alors pas ces champs au lieu de les avoir à null). Les
+    colonnes concernées sont journalisées.
+    Le dossier de chaque source en échec est ajouté à failed_sources (si fourni).
+    Retourne le rapport de qualité, ou None si aucune donnée n'a été transformée.
+    """
+    with tempfile.TemporaryDirectory(prefix='_json_', dir=output_dir) as json_dir:
+        task = functools.partial(stream_source, batch_rows=batch_rows, json_dir=json_dir, parquet_path=parquet_path)
+        source_reports = run_sources(list(enumerate(sources)), task)
+        if failed_sources is not None:
+            failed_sources.extend(os.path.basename(os.path.normpath(data_path))
+                                  for (_, data_path, _, _), source_report in zip(sources, source_reports)
+                                  if source_report is None)
+        written = [(index, source_report) for index, source_report in enumerate(source_reports)
+                   if source_report is not None and source_report.rows]
+        if not written:
+            logging.warning("Aucune donnée n'a été transformée. Vérifiez les fichiers Parquet dans S3.")
+            return None
+
+        report = QualityReport("Données transformées finales", key_columns=list(QUALITY_KEY_COLUMNS))
+        for _, source_report in written:
+            report.merge(source_report)
+        absent_columns = {source_report.source_name: [col for col in report.columns if col not in source_report.columns]
+                          for _, source_report in written}
+        absent_columns = {name: columns for name, columns in absent_columns.items() if columns}
+        if absent_columns:
+            logging.info(f"Colonnes absentes des enregistrements JSON de ces sources (null en mémoire) : {absent_columns}")
+
+        # Les enregistrements des sources sont mis bout à bout, dans l'ordre des sources
+        output_file = os.path.join(output_dir, 'data_for_mongodb.json')
+        with instrumentation.stage('assemble_json') as metrics:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.write('[')
+                for position, (index, _) in enumerate(written):
+                    if position:
+                        f.write(',')
+                    with open(os.path.join(json_dir, f"{index:04d}.json"), encoding='utf-8') as part:
+                        shutil.copyfileobj(part, f)
+                f.write('\n]')
+            metrics['bytes_written'] = os.path.getsize(output_file)
+
+    with instrumentation.stage('unify_parquet') as metrics:
+        metrics['files'] = unify_dataset_files(parquet_path, report.columns)
+
+    logging.info(f"Transformation en streaming terminée. {report.rows} enregistrements combinés.")
+    logging.info(f"Résultat sauvegardé dans {output_file}")
+    logging.info(f"{report.rows} enregistrements sauvegardés en Parquet dans {parquet_path}")
+    logging.info(f"Test de qualité pour {report.source_name}")
+    report.finalize()
+    log_quality_report(report)
+    return report
+
+# Ordonnancement des sources
+
+def _source_name(s3_prefix):
+    """Nom d'une source : dernier segment de son préfixe S3, qui est aussi son dossier local."""
+    return s3_prefix.strip('/').split('/')[-1]
+
+def pipeline_sources():
+    """
+    Sources du pipeline, dans l'ordre de concaténation : Infoclimat puis une source par
+    station de STATION_S3_PREFIXES. Chaque source est un dict {'name', 'label', 'prefix', 'station'}.
+    """
+    sources = [{'name': _source_name(S3_PREFIX_INFOCLIMAT), 'label': 'Infoclimat',
+                'prefix': S3_PREFIX_INFOCLIMAT, 'station': None}]
+    for station_id, s3_prefix in STATION_S3_PREFIXES.items():
+        sources.append({'name': _source_name(s3_prefix), 'label': STATION_METADATA[station_id]['station_name'],
+                        'prefix': s3_prefix, 'station': station_id})
+    return sources
+
+def run_sources(sources, task=None, download=None, max_workers=SOURCE_MAX_WORKERS,
+                process_workers=TRANSFORM_MAX_WORKERS):
+    """
+    Petit ordonnanceur des sources, indépendantes jusqu'à la fusion de leurs résultats :
+    chaque source est prise en charge par un thread (au plus max_workers à la fois) qui
+    exécute download(source) (E/S), puis soumet task(source) (CPU) à un pool de
+    process_workers processus et attend son résultat. task doit donc être picklable
+    (fonction du module ou functools.partial) ; avec process_workers à 0, elle est
+    exécutée dans le thread de la source.
+    Retourne les résultats de task dans l'ordre des sources, ou None si un téléchargement a échoué.
+    """
+    if not sources:
+        return []
+    executor = None
+    if task is not None and process_workers > 0:
+        # 'spawn' : un fork depuis un processus multi-thread pourrait hériter de verrous bloqués
+        executor = ProcessPoolExecutor(max_workers=min(process_workers, len(sources)),
+                                       mp_context=multiprocessing.get_context('spawn'))
+
+    def handle(source):
+        if download is not None and not download(source):
+            return False, None
+        if task is None:
+            return True, None
+        if executor is None:
+            return True, task(source)
+        # Les étapes mesurées dans le processus de travail sont ajoutées au rapport d'exécution
+        return True, instrumentation.merge(executor.submit(instrumentation.captured, task, source).result())
+
+    try:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(sources))) as threads:
+            outcomes = list(threads.map(handle, sources))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    if not all(ok for ok, _ in outcomes):
+        return None
+    return [result for _, result in outcomes]
+
+def download_source(source, s3_client=None, download_path=LOCAL_DOWNLOAD_PATH):
+    """Télécharge les fichiers Parquet d'une source dans download_path/<nom de la source>."""
+    with instrumentation.stage('s3_download', source=source['name']):
+        downloaded = download_from_s3_securise(S3_BUCKET_NAME, source['prefix'], download_path,
+                                               extensions_autorisees=['.parquet'], s3_client=s3_client)
+    if not downloaded:
+        logging.error(f"Échec du téléchargement pour {source['prefix']}.")
+    return downloaded
+
+def load_source(source, download_path=LOCAL_DOWNLOAD_PATH, compact=False):
+    """
+    Lit et aplatit une source en mémoire (exécuté dans un processus de run_sources).
+    Retourne None si la transformation de la source a échoué.
+    """
+    data_path = os.path.join(download_path, source['name'])
+    if source['station'] is None:
+        return transform_infoclimat_parquet(data_path)
+    return transform_station_parquet(data_path, STATION_METADATA[source['station']], compact=compact)
+
+def source_flattener(source):
+    """Fonction d'aplatissement d'un lot de la source (picklable, pour les processus du mode streaming)."""
+    if source['station'] is None:
+        return flatten_infoclimat_frame
+    return functools.partial(flatten_station_frame, station_meta=STATION_METADATA[source['station']])
+
+# FONCTION PRINCIPALE 
+
+def streaming_sources(download_path=LOCAL_DOWNLOAD_PATH):
+    """
+    Sources du mode streaming, dans l'ordre de concaténation du chemin en mémoire :
+    (nom, dossier, aplatissement d'un lot, extraction des colonnes Airbyte à la lecture).
+    """
+    return [(source['label'], os.path.join(download_path, source['name']), source_flattener(source),
+             source['station'] is not None)
+            for source in pipeline_sources()]
+
+def transform_in_memory(download_path=LOCAL_DOWNLOAD_PATH, output_dir=TRANSFORMED_OUTPUT_PATH,
+                        parquet_path=PARQUET_OUTPUT_PATH, compact=COMPACT_DTYPES, frames=None, failed_sources=None):
+    """
+    Transforme toutes les sources en mémoire puis écrit les sorties.
+    Les sources sont lues et aplaties simultanément (voir run_sources), sauf si leurs
+    DataFrames sont fournis dans frames (dans l'ordre de pipeline_sources, None pour une
+    source en échec). Le dossier de chaque source en échec est ajouté à failed_sources (si fourni).
+    Retourne le rapport de qualité, ou None si aucune donnée n'a été transformée.
+    """
+    sources = pipeline_sources()
+    if frames is None:
+        frames = run_sources(sources, functools.partial(load_source, download_path=download_path, compact=compact))
+    if failed_sources is not None:
+        failed_sources.extend(source['name'] for source, df in zip(sources, frames) if df is None)
+    all_dfs = [df for df in frames if df is not None and not df.empty]
     
     if not all_dfs:
-        logging.warning("Aucune donnée n'a été transformée. Vérifiez les fichiers Parquet dans S3."); return
+        logging.warning("Aucune donnée n'a été transformée. Vérifiez les fichiers Parquet dans S3."); return None
 
-    final_df = pd.concat(all_dfs, ignore_index=True)
+    with instrumentation.stage('concat', rows_in=sum(len(df) for df in all_dfs)) as metrics:
+        final_df = concat_frames(all_dfs) if compact else pd.concat(all_dfs, ignore_index=True)
+        metrics['rows_out'] = len(final_df)
     logging.info(f"Transformation terminée. {len(final_df)} enregistrements combinés.")
     
     final_df = final_df.drop(columns=['Time'], errors='ignore')
-    final_df = clean_and_convert_data(final_df)
-    test_data_quality(final_df, "Données transformées finales")
+    with instrumentation.stage('clean', rows_in=len(final_df), rows_out=len(final_df)):
+        final_df = clean_and_convert_data(final_df)
+    if compact:
+        bytes_before = memory_per_row(final_df)
+        with instrumentation.stage('optimize_dtypes', rows_in=len(final_df), rows_out=len(final_df)):
+            final_df = optimize_dtypes(final_df)
+        logging.info(f"Représentation compacte : {bytes_before:.0f} -> {memory_per_row(final_df):.0f} octets par ligne.")
+    report = test_data_quality(final_df, "Données transformées finales")
 
-    output_file = os.path.join(TRANSFORMED_OUTPUT_PATH, 'data_for_mongodb.json')
-    final_df.to_json(output_file, orient='records', indent=4, force_ascii=False, date_format='iso')
+    # Les float32 de la représentation compacte sont élargis uniquement pour l'export
+    export_df = widen_float32_columns(final_df)
+    output_file = os.path.join(output_dir, 'data_for_mongodb.json')
+    with instrumentation.stage('write_json', rows_in=len(export_df)) as metrics:
+        export_df.to_json(output_file, orient='records', indent=4, force_ascii=False, date_format='iso')
+        metrics['bytes_written'] = os.path.getsize(output_file)
     logging.info(f"Résultat sauvegardé dans {output_file}")
 
+    rows_written = write_partitioned_parquet(export_df, parquet_path)
+    logging.info(f"{rows_written} enregistrements sauvegardés en Parquet dans {parquet_path}")
+    return report
+
+def transform_sources(download_path=LOCAL_DOWNLOAD_PATH, output_dir=TRANSFORMED_OUTPUT_PATH,
+                      parquet_path=PARQUET_OUTPUT_PATH, failed_sources=None):
+    """Transforme les sources de download_path en streaming (STREAMING_BATCH_ROWS) ou en mémoire."""
+    if STREAMING_BATCH_ROWS:
+        if COMPACT_DTYPES:
+            logging.info("Mode streaming : la représentation compacte est ignorée, la mémoire étant bornée par la taille des lots.")
+        return transform_streaming(streaming_sources(download_path), STREAMING_BATCH_ROWS, output_dir, parquet_path,
+                                   failed_sources=failed_sources)
+    return transform_in_memory(download_path, output_dir, parquet_path, failed_sources=failed_sources)
+
+def transformed_signatures(files, failed_sources):
+    """
+    Entrées du manifeste des fichiers transformés pour files (entrées de list_source_files),
+    sans les fichiers des sources en échec, qui restent à transformer.
+    """
+    if failed_sources:
+        logging.error(f"Transformation en échec pour les sources {sorted(set(failed_sources))} : "
+                      "leurs fichiers ne sont pas inscrits au manifeste et seront retraités.")
+    return {key: entry['signature'] for key, entry in files.items() if entry['source'] not in failed_sources}
+
+def _link_or_copy(source_path, target_path):
+    """Lien physique vers le fichier du cache (sans copie), ou copie si le système de fichiers ne le permet pas."""
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copy2(source_path, target_path)
+
+def _clear_outputs(output_dir):
+    """Sorties d'une exécution sans nouveau relevé : tableau JSON vide et pas de rapport de qualité."""
+    with open(os.path.join(output_dir, 'data_for_mongodb.json'), 'w', encoding='utf-8') as f:
+        f.write('[]')
+    report_file = os.path.join(output_dir, QUALITY_REPORT_FILENAME)
+    if os.path.exists(report_file):
+        os.remove(report_file)
+
+def transform_incremental(new_files, run_id, download_path=LOCAL_DOWNLOAD_PATH,
+                          output_dir=TRANSFORMED_OUTPUT_PATH, parquet_path=PARQUET_OUTPUT_PATH, failed_sources=None):
+    """
+    Transforme uniquement new_files (entrées de list_source_files) : les fichiers sont liés
+    dans un cache temporaire de même arborescence et transformés comme lors d'une exécution
+    complète, dans un dossier de préparation. Leurs partitions Parquet sont ensuite ajoutées
+    au dataset existant et data_for_mongodb.json ne contient que les nouveaux relevés
+    (à charger avec MIGRATION_MODE=incremental). Les sources en échec sont ajoutées à
+    failed_sources (si fourni), comme pour transform_sources.
+    Retourne (True si les sorties ont été publiées, rapport de qualité ou None).
+    """
+    if not new_files:
+        logging.info("Aucun nouveau fichier source à transformer.")
+        _clear_outputs(output_dir)
+        return True, None
+
+    with tempfile.TemporaryDirectory(prefix='_delta_', dir=download_path) as delta_path, \
+            tempfile.TemporaryDirectory(prefix='_staging_', dir=output_dir) as staging_dir:
+        for entry in new_files:
+            source_dir = os.path.join(delta_path, entry['source'])
+            os.makedirs(source_dir, exist_ok=True)
+            _link_or_copy(entry['path'], os.path.join(source_dir, os.path.basename(entry['path'])))
+
+        staging_parquet = os.path.join(staging_dir, 'parquet')
+        report = transform_sources(delta_path, staging_dir, staging_parquet, failed_sources=failed_sources)
+        if report is None:
+            _clear_outputs(output_dir)
+            return True, None
+        if not append_partitions(staging_parquet, parquet_path, run_id):
+            return False, None
+        os.replace(os.path.join(staging_dir, 'data_for_mongodb.json'), os.path.join(output_dir, 'data_for_mongodb.json'))
+    logging.info(f"Nouvelles partitions ajoutées à {parquet_path} (fichiers préfixés par {run_id}).")
+    return True, report
+
+def main():
+    """
+    Orchestre le téléchargement, la transformation Parquet,
+    le nettoyage et la sauvegarde des données.
+    Les sources sont téléchargées simultanément ; en mode en mémoire complet, chacune est
+    lue et aplatie dans un processus dès la fin de son téléchargement (voir run_sources).
+    Avec STREAMING_BATCH_ROWS, la transformation est faite par lots (voir transform_streaming).
+    Avec TRANSFORM_MODE=incremental, seuls les fichiers sources absents du manifeste des
+    fichiers transformés sont traités (voir transform_incremental) ; l'historique est
+    retraité entièrement s'il n'y a pas de manifeste ou si un fichier déjà transformé a changé.
+    Les fichiers d'une source dont la transformation a échoué ne sont pas inscrits au
+    manifeste : ils seront traités à nouveau à la prochaine exécution incrémentale.
+    """
+    incremental = TRANSFORM_MODE == 'incremental'
+    # LOCAL_DOWNLOAD_PATH est conservé : il sert de cache entre deux exécutions
+    if not incremental and os.path.exists(TRANSFORMED_OUTPUT_PATH): shutil.rmtree(TRANSFORMED_OUTPUT_PATH)
+    os.makedirs(LOCAL_DOWNLOAD_PATH, exist_ok=True); os.makedirs(TRANSFORMED_OUTPUT_PATH, exist_ok=True)
+    logging.info("Répertoires locaux préparés.")
+
+    sources = pipeline_sources()
+    # Un seul client (thread-safe) partagé par les téléchargements de toutes les sources
+    s3_client = boto3.client('s3', config=Config(max_pool_connections=S3_MAX_WORKERS * SOURCE_MAX_WORKERS))
+    download = functools.partial(download_source, s3_client=s3_client)
+    load = None
+    if not incremental and not STREAMING_BATCH_ROWS:
+        load = functools.partial(load_source, download_path=LOCAL_DOWNLOAD_PATH, compact=COMPACT_DTYPES)
+    frames = run_sources(sources, load, download)
+    if frames is None:
+        logging.error("Échec du téléchargement d'une source. Arrêt du script."); return
+    files = list_source_files(LOCAL_DOWNLOAD_PATH, [source['name'] for source in sources])
+
+    if incremental:
+        processed = load_transform_manifest()
+        new_keys = files_to_transform(files, processed) if processed is not None else None
+        if new_keys is not None:
+            logging.info(f"Mode incrémental : {len(new_keys)} nouveaux fichiers sources sur {len(files)}.")
+            # Préfixe des fichiers ajoutés au dataset : deux exécutions ne peuvent pas le partager
+            run_id = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+            failed = []
+            with instrumentation.stage('transform', mode='incremental', files=len(new_keys)):
+                published, report = transform_incremental([files[key] for key in new_keys], run_id, failed_sources=failed)
+            if published:
+                if report:
+                    save_quality_report(report)
+                transformed = transformed_signatures({key: files[key] for key in new_keys}, failed)
+                save_transform_manifest({**processed, **transformed}, delta=True)
+                return
+        logging.warning("Mode incrémental impossible, l'historique est entièrement retraité.")
+        shutil.rmtree(TRANSFORMED_OUTPUT_PATH); os.makedirs(TRANSFORMED_OUTPUT_PATH)
+
+    failed = []
+    with instrumentation.stage('transform', mode='streaming' if STREAMING_BATCH_ROWS else 'in_memory'):
+        if load is not None:
+            report = transform_in_memory(frames=frames, failed_sources=failed)
+        else:
+            report = transform_sources(failed_sources=failed)
+    if report:
+        save_quality_report(report)
+    save_transform_manifest(transformed_signatures(files, failed))
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    with instrumentation.run('transformation'):
+        main()